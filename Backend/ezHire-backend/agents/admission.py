@@ -0,0 +1,231 @@
+"""
+Admission control for LLM-bound requests
+
+Each /chat or sequence generation/edit request pins a worker on a model call
+for seconds. AdmissionController caps how many run at once, globally and per
+user, and keeps a bounded FIFO wait queue in front of them. A request that
+cannot get a slot is rejected straight away when the queue (or the user's
+share of it) is full, or after waiting `queue_timeout` seconds, with a
+Retry-After estimate, so one user firing requests in parallel cannot take
+every worker.
+
+Slots are handed over on release: the first queued request whose user is
+under its limit gets the freed slot, so a user at its limit does not hold up
+the requests queued behind it.
+"""
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from agents.tracing import metrics, record_span
+
+admission_in_flight = metrics.gauge("ezhire_admission_in_flight", "Admitted LLM-bound requests running")
+admission_queue_depth = metrics.gauge("ezhire_admission_queue_depth", "LLM-bound requests waiting for a slot")
+admission_rejected = metrics.counter("ezhire_admission_rejected_total", "LLM-bound requests rejected with 429", ("reason",))
+admission_wait_seconds = metrics.histogram("ezhire_admission_wait_seconds", "Time LLM-bound requests waited for a slot")
+
+class AdmissionRejected(Exception):
+    """No slot for the request; retry_after is a hint in whole seconds"""
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Too many requests ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+class _Waiter:
+    __slots__ = ("user_id", "admitted", "wake")
+
+    def __init__(self, user_id, wake):
+        self.user_id = user_id
+        self.admitted = False
+        self.wake = wake
+
+class AdmissionController:
+    """Per-user and global concurrency limits with a bounded wait queue"""
+    def __init__(self, max_concurrency=None, user_concurrency=None, queue_size=None,
+                 user_queue_size=None, queue_timeout=None):
+        self.enabled = os.getenv('ADMISSION_ENABLED', 'True') == 'True'
+        self.max_concurrency = max_concurrency if max_concurrency is not None else int(os.getenv('ADMISSION_MAX_CONCURRENCY', 8))
+        self.user_concurrency = user_concurrency if user_concurrency is not None else int(os.getenv('ADMISSION_USER_CONCURRENCY', 2))
+        self.queue_size = queue_size if queue_size is not None else int(os.getenv('ADMISSION_QUEUE_SIZE', 32))
+        self.user_queue_size = user_queue_size if user_queue_size is not None else int(os.getenv('ADMISSION_USER_QUEUE_SIZE', 4))
+        self.queue_timeout = queue_timeout if queue_timeout is not None else float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 30))
+        self._lock = threading.Lock()
+        self._queue = deque()
+        self._in_flight = 0
+        self._user_in_flight = {}
+        self._user_queued = {}
+        self._avg_hold = 5.0  # Moving average of how long a slot is held, for Retry-After
+        self.counters = {"admitted": 0, "queued": 0, "rejected": 0}
+
+    def _has_slot(self, user_id):
+        return (self._in_flight < self.max_concurrency
+                and self._user_in_flight.get(user_id, 0) < self.user_concurrency)
+
+    def _take_slot(self, user_id):
+        self._in_flight += 1
+        self._user_in_flight[user_id] = self._user_in_flight.get(user_id, 0) + 1
+        self.counters["admitted"] += 1
+
+    def _unqueue(self, waiter):
+        self._queue.remove(waiter)
+        self._user_queued[waiter.user_id] -= 1
+        if not self._user_queued[waiter.user_id]:
+            del self._user_queued[waiter.user_id]
+
+    def _dispatch(self):
+        """Hand free slots to queued requests, oldest first, skipping users at their limit"""
+        for waiter in list(self._queue):
+            if self._in_flight >= self.max_concurrency:
+                break
+            if self._has_slot(waiter.user_id):
+                self._unqueue(waiter)
+                self._take_slot(waiter.user_id)
+                waiter.admitted = True
+                waiter.wake()
+
+    def _retry_after(self):
+        return max(1, math.ceil(self._avg_hold * (len(self._queue) + 1) / max(self.max_concurrency, 1)))
+
+    def _reject(self, reason):
+        self.counters["rejected"] += 1
+        admission_rejected.inc(reason=reason)
+        return AdmissionRejected(reason, self._retry_after())
+
+    def _update_gauges(self):
+        admission_in_flight.set(self._in_flight)
+        admission_queue_depth.set(len(self._queue))
+
+    def _enter(self, user_id, wake):
+        """A slot right away (None), a queued waiter, or AdmissionRejected; call with the lock held"""
+        # Queued requests are all blocked on a limit, so a free slot is not jumping the queue
+        if self._has_slot(user_id):
+            self._take_slot(user_id)
+            return None
+        if self._user_queued.get(user_id, 0) >= self.user_queue_size:
+            raise self._reject("user_queue_full")
+        if len(self._queue) >= self.queue_size:
+            raise self._reject("queue_full")
+        waiter = _Waiter(user_id, wake)
+        self._queue.append(waiter)
+        self._user_queued[user_id] = self._user_queued.get(user_id, 0) + 1
+        self.counters["queued"] += 1
+        return waiter
+
+    def _timed_out(self, waiter):
+        """After a wait ran out: False if the slot arrived meanwhile, otherwise leave the queue"""
+        with self._lock:
+            if waiter.admitted:
+                return False
+            self._unqueue(waiter)
+            self._update_gauges()
+            return True
+
+    def acquire(self, user_id=None, timeout=None):
+        """Block until a slot is free; raises AdmissionRejected. Returns the time it was admitted."""
+        timeout = self.queue_timeout if timeout is None else timeout
+        started = time.perf_counter()
+        event = threading.Event()
+        with self._lock:
+            waiter = self._enter(user_id, event.set)
+            self._update_gauges()
+        if waiter is not None and not event.wait(timeout) and self._timed_out(waiter):
+            with self._lock:
+                raise self._reject("timeout")
+        return self._admitted(started)
+
+    async def aacquire(self, user_id=None, timeout=None):
+        """acquire() for the event loop: waiting does not block a thread"""
+        timeout = self.queue_timeout if timeout is None else timeout
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(True))
+
+        with self._lock:
+            waiter = self._enter(user_id, wake)
+            self._update_gauges()
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                if self._timed_out(waiter):
+                    with self._lock:
+                        raise self._reject("timeout")
+            except asyncio.CancelledError:
+                # Client went away while queued; give back a slot handed over meanwhile
+                if not self._timed_out(waiter):
+                    self.release(user_id)
+                raise
+        return self._admitted(started)
+
+    def _admitted(self, started):
+        waited = time.perf_counter() - started
+        admission_wait_seconds.observe(waited)
+        if waited > 0.001:
+            record_span("queue", "admission", waited)
+        return time.perf_counter()
+
+    def release(self, user_id=None, admitted_at=None):
+        """Give back a slot taken by acquire()"""
+        with self._lock:
+            if admitted_at is not None:
+                self._avg_hold = 0.8 * self._avg_hold + 0.2 * (time.perf_counter() - admitted_at)
+            self._in_flight -= 1
+            self._user_in_flight[user_id] -= 1
+            if not self._user_in_flight[user_id]:
+                del self._user_in_flight[user_id]
+            self._dispatch()
+            self._update_gauges()
+
+    @contextmanager
+    def admit(self, user_id=None, timeout=None):
+        """Hold a slot for the duration of the block"""
+        if not self.enabled:
+            yield
+            return
+        admitted_at = self.acquire(user_id, timeout)
+        try:
+            yield
+        finally:
+            self.release(user_id, admitted_at)
+
+    @asynccontextmanager
+    async def aadmit(self, user_id=None, timeout=None):
+        if not self.enabled:
+            yield
+            return
+        admitted_at = await self.aacquire(user_id, timeout)
+        try:
+            yield
+        finally:
+            self.release(user_id, admitted_at)
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.counters,
+                "enabled": self.enabled,
+                "in_flight": self._in_flight,
+                "queue_depth": len(self._queue),
+                "users_in_flight": len(self._user_in_flight),
+                "max_concurrency": self.max_concurrency,
+                "user_concurrency": self.user_concurrency,
+                "queue_size": self.queue_size,
+            }
+
+_controller = None
+_controller_lock = threading.Lock()
+
+def get_admission_controller():
+    """Process-wide admission controller"""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdmissionController()
+    return _controller
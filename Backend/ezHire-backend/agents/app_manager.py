@@ -1,27 +1,33 @@
+import os
 import json
+import time
+import random
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extras import execute_values
 from agents.hr_agent import HRAgent
 from agents.outreach_agent import OutreachSequenceGenerator
-from models.database import get_db_connection
+from agents.conversation_state import ConversationState
+from agents.admission import get_admission_controller
+from models.database import db_cursor
+from models.outreach_sequence import canonical_json
+from models.sequence_store import SEQUENCE_COLUMNS, BASE_JOIN, materialize, store_version, astore_version
+from models.async_database import adb_connection, afetchone
 
 class HROutreachManager:
-    def __init__(self):
-        # Initialize components
-        self.hr_agent = HRAgent()
-        self.outreach_generator = OutreachSequenceGenerator()
+    def __init__(self, hr_agent=None, outreach_generator=None):
+        # Initialize components; agents.registry passes in shared instances
+        self.outreach_generator = outreach_generator or OutreachSequenceGenerator()
+        self.hr_agent = hr_agent or HRAgent(outreach_generator=self.outreach_generator)
         
     def handle_chat(self, user_id, campaign_id, message, conversation_id=None):
         """Handle a chat message with context"""
-        campaign_context = self._get_campaign_context(campaign_id) if campaign_id else ""
-        
-        full_message = "User's Request: " + message
-        if campaign_context:
-            full_message = full_message + "\n" + "Campaign context: " + campaign_context
-
-        # full_message = campaign_context + message if campaign_context else message
-        response = self.hr_agent.chat(full_message, conversation_id)
+        full_message = self._full_message(message, campaign_id)
+        response, usage = self.hr_agent.chat_with_usage(full_message, conversation_id, campaign_id)
         
         # Store conversation
-        new_conversation_id = self._store_conversation(user_id, campaign_id, message, response, conversation_id)
+        new_conversation_id, first_seq = self._store_conversation(user_id, campaign_id, message, response, conversation_id)
+        self.hr_agent.record_turn(new_conversation_id, message, response, first_seq)
         # print("=====Response=====")
         # print(response)
         # formatted_output = response['output'].replace("'", '"')
@@ -36,27 +42,71 @@ class HROutreachManager:
             # "output": json.loads(output),
             # "campaign_id": campaign_id,
             # "message": message,
-            "conversation_id": new_conversation_id
+            "conversation_id": new_conversation_id,
+            "usage": usage
         }
     
-    def generate_campaign_sequence(self, campaign_id, additional_info=None):
+    def stream_chat(self, user_id, campaign_id, message, conversation_id=None):
+        """Streaming variant of handle_chat; the turn is stored once the response is complete"""
+        full_message = self._full_message(message, campaign_id)
+
+        for event in self.hr_agent.stream_chat(full_message, conversation_id, campaign_id):
+            if event["event"] != "response":
+                yield event
+                continue
+
+            response = event["data"]
+            new_conversation_id, first_seq = self._store_conversation(user_id, campaign_id, message, response, conversation_id)
+            self.hr_agent.record_turn(new_conversation_id, message, response, first_seq)
+            yield {
+                "event": "done",
+                "data": {
+                    "response": response,
+                    "conversation_id": new_conversation_id,
+                    "usage": event["usage"]
+                }
+            }
+
+    def stream_campaign_sequence(self, campaign_id, additional_info=None, use_cache=True):
+        """Streaming variant of generate_campaign_sequence; the sequence is stored when complete"""
+        campaign = self._get_campaign(campaign_id)
+        if not campaign:
+            yield {"event": "error", "data": {"error": "Campaign not found"}}
+            return
+
+        campaign_info = self._campaign_info(campaign, additional_info)
+        for event in self.outreach_generator.stream_sequence(campaign_info, use_cache=use_cache):
+            if event["event"] != "sequence":
+                yield event
+                continue
+
+            sequence = event["data"]
+            if "error" in sequence:
+                # Unusable model output is reported, never stored as a version
+                yield {"event": "error", "data": sequence}
+                return
+            sequence_id = self._store_sequence(campaign_id, sequence)
+            yield {
+                "event": "done",
+                "data": {
+                    "sequence_id": sequence_id,
+                    "sequence": sequence
+                }
+            }
+
+    def generate_campaign_sequence(self, campaign_id, additional_info=None, use_cache=True):
         """Generate a sequence for a campaign"""
         # Get campaign info
         campaign = self._get_campaign(campaign_id)
         if not campaign:
             return {"error": "Campaign not found"}
             
-        # Combine with additional info
-        campaign_info = {
-            "target_role": campaign['target_role'],
-            "industry": campaign['industry']
-        }
-        
-        if additional_info:
-            campaign_info.update(additional_info)
+        campaign_info = self._campaign_info(campaign, additional_info)
             
         # Generate sequence
-        sequence = self.outreach_generator.generate_sequence(campaign_info)
+        sequence = self.outreach_generator.generate_sequence(campaign_info, use_cache=use_cache)
+        if "error" in sequence:
+            return sequence
         
         # Store sequence
         sequence_id = self._store_sequence(campaign_id, sequence)
@@ -66,6 +116,79 @@ class HROutreachManager:
             "sequence": sequence
         }
     
+    def generate_campaign_sequences_batch(self, campaign_ids, additional_info=None, max_concurrency=None, max_retries=None, use_cache=True, admission_key=None):
+        """
+        Generate sequences for many campaigns concurrently
+
+        At most max_concurrency generations run at once; each one is retried
+        with exponential backoff. With admission_key, every generation takes
+        its own admission slot for that user, and max_concurrency is capped at
+        the per-user limit. All generated sequences are written with a single
+        bulk insert. Returns per-campaign results and timings.
+        """
+        started = time.monotonic()
+        limit = int(os.getenv('BATCH_MAX_CONCURRENCY', 8))
+        retry_limit = int(os.getenv('BATCH_MAX_RETRIES', 2))
+        max_concurrency = max(1, min(int(max_concurrency or limit), limit))
+        max_retries = max(0, min(int(max_retries) if max_retries is not None else retry_limit, retry_limit))
+        admission = get_admission_controller()
+        if admission_key is not None and admission.enabled:
+            max_concurrency = min(max_concurrency, admission.user_concurrency)
+        else:
+            admission_key = None
+        campaign_ids = list(dict.fromkeys(campaign_ids))
+
+        with db_cursor() as cur:
+            cur.execute("SELECT * FROM campaigns WHERE id = ANY(%s)", (campaign_ids,))
+            campaigns = {campaign['id']: campaign for campaign in cur.fetchall()}
+
+        def generate(campaign):
+            campaign_info = self._campaign_info(campaign, additional_info)
+            task_started = time.monotonic()
+            error = None
+            for attempt in range(1, max_retries + 2):
+                try:
+                    with admission.admit(admission_key) if admission_key is not None else nullcontext():
+                        # Retries skip the cache so a bad cached answer is not returned again
+                        sequence = self.outreach_generator.generate_sequence(campaign_info, use_cache=use_cache and attempt == 1)
+                    if "error" not in sequence:
+                        return {"sequence": sequence, "attempts": attempt, "duration_ms": round((time.monotonic() - task_started) * 1000)}
+                    error = sequence["error"]
+                except Exception as e:
+                    error = str(e)
+                if attempt <= max_retries:
+                    time.sleep(min(0.5 * 2 ** (attempt - 1), 8) + random.uniform(0, 0.25))
+            return {"error": error, "attempts": max_retries + 1, "duration_ms": round((time.monotonic() - task_started) * 1000)}
+
+        found = [campaigns[campaign_id] for campaign_id in campaign_ids if campaign_id in campaigns]
+        outcomes = {}
+        if found:
+            with ThreadPoolExecutor(max_workers=min(max_concurrency, len(found))) as executor:
+                for campaign, outcome in zip(found, executor.map(generate, found)):
+                    outcomes[campaign['id']] = outcome
+
+        sequence_ids = self._store_sequences_bulk([
+            (campaign_id, outcome["sequence"]) for campaign_id, outcome in outcomes.items() if "sequence" in outcome
+        ])
+
+        results = []
+        for campaign_id in campaign_ids:
+            outcome = outcomes.get(campaign_id)
+            if outcome is None:
+                results.append({"campaign_id": campaign_id, "status": "not_found", "error": "Campaign not found"})
+            elif "sequence" in outcome:
+                results.append({"campaign_id": campaign_id, "status": "succeeded", "sequence_id": sequence_ids[campaign_id], **outcome})
+            else:
+                results.append({"campaign_id": campaign_id, "status": "failed", **outcome})
+
+        return {
+            "results": results,
+            "succeeded": sum(1 for result in results if result["status"] == "succeeded"),
+            "failed": sum(1 for result in results if result["status"] != "succeeded"),
+            "max_concurrency": max_concurrency,
+            "duration_ms": round((time.monotonic() - started) * 1000)
+        }
+
     def edit_sequence(self, sequence_id, edit_instructions):
         """Edit an existing sequence"""
         # Get existing sequence
@@ -74,57 +197,177 @@ class HROutreachManager:
             return {"error": "Sequence not found"}
             
         # Edit sequence
-        edited_sequence = self.outreach_generator.edit_sequence(sequence['sequence_data'], edit_instructions)
+        edited_sequence = self.outreach_generator.edit_sequence(materialize(sequence)['sequence_data'], edit_instructions)
+        if "error" in edited_sequence:
+            # A failed edit must not become the campaign's latest version
+            return edited_sequence
         
-        # Store new version
-        new_sequence_id = self._store_sequence(
-            sequence['campaign_id'], 
-            edited_sequence['sequence_data'], 
-            version=(sequence['version'] + 1)
-        )
+        # Store new version (as a delta against the parent's snapshot when small)
+        with db_cursor(commit=True) as cur:
+            new_sequence_id, version = store_version(cur, sequence, edited_sequence)
         
         return {
             "sequence_id": new_sequence_id,
+            "version": version,
             "sequence": edited_sequence
         }
     
+    # Async variants used by the ASGI entry point (asgi.py)
+    async def ahandle_chat(self, user_id, campaign_id, message, conversation_id=None):
+        """Async variant of handle_chat"""
+        campaign = await self._aget_campaign(campaign_id) if campaign_id else None
+        full_message = self._compose_message(message, self._format_campaign_context(campaign))
+
+        response, usage = await self.hr_agent.achat_with_usage(full_message, conversation_id, campaign_id)
+
+        new_conversation_id, first_seq = await self._astore_conversation(user_id, campaign_id, message, response, conversation_id)
+        await self.hr_agent.arecord_turn(new_conversation_id, message, response, first_seq)
+        return {
+            "response": response,
+            "conversation_id": new_conversation_id,
+            "usage": usage
+        }
+
+    async def agenerate_campaign_sequence(self, campaign_id, additional_info=None, use_cache=True):
+        """Async variant of generate_campaign_sequence"""
+        campaign = await self._aget_campaign(campaign_id)
+        if not campaign:
+            return {"error": "Campaign not found"}
+
+        sequence = await self.outreach_generator.agenerate_sequence(self._campaign_info(campaign, additional_info), use_cache=use_cache)
+        if "error" in sequence:
+            return sequence
+        sequence_id = await self._astore_sequence(campaign_id, sequence)
+
+        return {
+            "sequence_id": sequence_id,
+            "sequence": sequence
+        }
+
+    async def aedit_sequence(self, sequence_id, edit_instructions):
+        """Async variant of edit_sequence"""
+        sequence = await afetchone(
+            f"SELECT {SEQUENCE_COLUMNS}, c.latest_version FROM outreach_sequences s {BASE_JOIN} "
+            "LEFT JOIN campaigns c ON c.id = s.campaign_id WHERE s.id = $1",
+            sequence_id
+        )
+        if not sequence:
+            return {"error": "Sequence not found"}
+
+        edited_sequence = await self.outreach_generator.aedit_sequence(materialize(sequence)['sequence_data'], edit_instructions)
+        if "error" in edited_sequence:
+            return edited_sequence
+        async with adb_connection(transaction=True) as conn:
+            new_sequence_id, version = await astore_version(conn, sequence, edited_sequence)
+
+        return {
+            "sequence_id": new_sequence_id,
+            "version": version,
+            "sequence": edited_sequence
+        }
+
+    async def _aget_campaign(self, campaign_id):
+        return await afetchone("SELECT * FROM campaigns WHERE id = $1", campaign_id)
+
+    async def _astore_conversation(self, user_id, campaign_id, message, response, conversation_id=None):
+        """Async variant of _store_conversation"""
+        new_messages = self._conversation_messages(message, response)
+        state = self._state_update(campaign_id, response)
+
+        async with adb_connection(transaction=True) as conn:
+            result = None
+            if conversation_id:
+                result = await conn.fetchrow(
+                    """
+                    UPDATE conversations
+                    SET message_count = message_count + $1, updated_at = CURRENT_TIMESTAMP,
+                        active_campaign_id = COALESCE($2, active_campaign_id),
+                        last_sequence_id = COALESCE($3, last_sequence_id),
+                        last_sequence_version = CASE WHEN $3::INTEGER IS NULL THEN last_sequence_version ELSE $4 END
+                    WHERE id = $5
+                    RETURNING id, message_count
+                    """,
+                    len(new_messages), state.campaign_id, state.sequence_id, state.sequence_version, conversation_id
+                )
+            if result:
+                new_conversation_id = result['id']
+                first_seq = result['message_count'] - len(new_messages) + 1
+            else:
+                new_conversation_id = await conn.fetchval(
+                    """
+                    INSERT INTO conversations (user_id, campaign_id, message_count, active_campaign_id, last_sequence_id, last_sequence_version)
+                    VALUES ($1, $2, $3, $4, $5, $6) RETURNING id
+                    """,
+                    user_id, campaign_id, len(new_messages), state.campaign_id, state.sequence_id, state.sequence_version
+                )
+                first_seq = 1
+
+            await conn.executemany(
+                "INSERT INTO conversation_messages (conversation_id, seq, role, content) VALUES ($1, $2, $3, $4)",
+                [(new_conversation_id, first_seq + i, msg["role"], msg["content"]) for i, msg in enumerate(new_messages)]
+            )
+
+        return new_conversation_id, first_seq
+
+    async def _astore_sequence(self, campaign_id, sequence):
+        async with adb_connection() as conn:
+            return await conn.fetchval(
+                "INSERT INTO outreach_sequences (campaign_id, sequence_data, version) VALUES ($1, $2, 1) RETURNING id",
+                campaign_id, sequence
+            )
+
     def create_campaign(self, user_id, name, description=None, target_role=None, industry=None):
         """Create a new campaign"""
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute(
-            "INSERT INTO campaigns (user_id, name, description, target_role, industry) VALUES (%s, %s, %s, %s, %s) RETURNING id",
-            (user_id, name, description, target_role, industry)
-        )
-        
-        campaign_id = cur.fetchone()['id']
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+        with db_cursor(commit=True) as cur:
+            cur.execute(
+                "INSERT INTO campaigns (user_id, name, description, target_role, industry) VALUES (%s, %s, %s, %s, %s) RETURNING id",
+                (user_id, name, description, target_role, industry)
+            )
+            campaign_id = cur.fetchone()['id']
         
         return {"campaign_id": campaign_id, "message": "Campaign created successfully"}
     
+    def _full_message(self, message, campaign_id):
+        """User message plus the campaign context the agent needs"""
+        campaign_context = self._get_campaign_context(campaign_id) if campaign_id else ""
+        return self._compose_message(message, campaign_context)
+
+    def _compose_message(self, message, campaign_context):
+        full_message = "User's Request: " + message
+        if campaign_context:
+            full_message = full_message + "\n" + "Campaign context: " + campaign_context
+
+        # full_message = campaign_context + message if campaign_context else message
+        return full_message
+
+    def _campaign_info(self, campaign, additional_info=None):
+        # Combine with additional info
+        campaign_info = {
+            "target_role": campaign['target_role'],
+            "industry": campaign['industry']
+        }
+        
+        if additional_info:
+            campaign_info.update(additional_info)
+        return campaign_info
+
     # Helper methods for database operations
     def _get_campaign(self, campaign_id):
         """Get campaign info from database"""
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute("SELECT * FROM campaigns WHERE id = %s", (campaign_id,))
-        campaign = cur.fetchone()
-        
-        cur.close()
-        conn.close()
+        with db_cursor() as cur:
+            cur.execute("SELECT * FROM campaigns WHERE id = %s", (campaign_id,))
+            campaign = cur.fetchone()
         
         return campaign
         
     def _get_campaign_context(self, campaign_id):
         """Get campaign context string"""
-        campaign = self._get_campaign(campaign_id)
+        return self._format_campaign_context(self._get_campaign(campaign_id))
+
+    def _format_campaign_context(self, campaign):
         if not campaign:
             return ""
+        campaign_id = campaign['id']
             
         context = f"Working on campaign: {campaign['name']} (campaign_id: {campaign_id})"
         
@@ -139,10 +382,68 @@ class HROutreachManager:
         return context
         
     def _store_conversation(self, user_id, campaign_id, message, response, conversation_id=None):
-        """Store conversation in database"""
-        conn = get_db_connection()
-        cur = conn.cursor()
+        """Store conversation in database, returning (conversation_id, seq of the stored user message)
+
+        The conversation's state (active campaign, last sequence) is updated
+        from the campaign the request was about and the ids the response reports.
+        """
+        new_messages = self._conversation_messages(message, response)
+        state = self._state_update(campaign_id, response)
+        
+        with db_cursor(commit=True) as cur:
+            new_conversation_id = None
+            if conversation_id:
+                # Reserving sequence numbers locks the conversation row, so
+                # concurrent turns on the same conversation append in order
+                cur.execute(
+                    """
+                    UPDATE conversations
+                    SET message_count = message_count + %s, updated_at = CURRENT_TIMESTAMP,
+                        active_campaign_id = COALESCE(%s, active_campaign_id),
+                        last_sequence_id = COALESCE(%s, last_sequence_id),
+                        last_sequence_version = CASE WHEN %s::INTEGER IS NULL THEN last_sequence_version ELSE %s END
+                    WHERE id = %s
+                    RETURNING id, message_count
+                    """,
+                    (len(new_messages), state.campaign_id, state.sequence_id,
+                     state.sequence_id, state.sequence_version, conversation_id)
+                )
+                result = cur.fetchone()
+                if result:
+                    new_conversation_id = result['id']
+                    first_seq = result['message_count'] - len(new_messages) + 1
+
+            if not new_conversation_id:
+                # Create new conversation (also when the given ID was not found)
+                cur.execute(
+                    """
+                    INSERT INTO conversations (user_id, campaign_id, message_count, active_campaign_id, last_sequence_id, last_sequence_version)
+                    VALUES (%s, %s, %s, %s, %s, %s) RETURNING id
+                    """,
+                    (user_id, campaign_id, len(new_messages), state.campaign_id, state.sequence_id, state.sequence_version)
+                )
+                new_conversation_id = cur.fetchone()['id']
+                first_seq = 1
+
+            execute_values(
+                cur,
+                "INSERT INTO conversation_messages (conversation_id, seq, role, content) VALUES %s",
+                [
+                    (new_conversation_id, first_seq + i, msg["role"], json.dumps(msg["content"]))
+                    for i, msg in enumerate(new_messages)
+                ]
+            )
+        
+        return new_conversation_id, first_seq
         
+    def _state_update(self, campaign_id, response):
+        """Conversation state fields this turn sets; None leaves a field unchanged"""
+        state = ConversationState()
+        state.update_from_response(response, campaign_id=campaign_id)
+        return state
+
+    def _conversation_messages(self, message, response):
+        """The user/assistant message pair stored for one turn"""
         response_to_store = response
         if isinstance(response, dict):
             response_to_store = response
@@ -156,77 +457,44 @@ class HROutreachManager:
                     "output": "Conversation response"
                 }
         
-        new_messages = [
+        return [
             {"role": "user", "content": message},
             {"role": "assistant", "content": response_to_store}
         ]
-        
-        if conversation_id:
-            # Get existing conversation
-            cur.execute("SELECT messages FROM conversations WHERE id = %s", (conversation_id,))
-            conversation = cur.fetchone()
-            
-            if conversation:
-                # Update existing conversation
-                messages = conversation['messages']
-                messages.extend(new_messages)
-                
-                cur.execute(
-                    "UPDATE conversations SET messages = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s RETURNING id",
-                    (json.dumps(messages), conversation_id)
-                )
-                result = cur.fetchone()
-                new_conversation_id = result['id']
-            else:
-                # Create new conversation if ID not found
-                cur.execute(
-                    "INSERT INTO conversations (user_id, campaign_id, messages) VALUES (%s, %s, %s) RETURNING id",
-                    (user_id, campaign_id, json.dumps(new_messages))
-                )
-                result = cur.fetchone()
-                new_conversation_id = result['id']
-        else:
-            # Create new conversation
-            cur.execute(
-                "INSERT INTO conversations (user_id, campaign_id, messages) VALUES (%s, %s, %s) RETURNING id",
-                (user_id, campaign_id, json.dumps(new_messages))
-            )
-            result = cur.fetchone()
-            new_conversation_id = result['id']
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-        
-        return new_conversation_id
-        
+
     def _get_sequence(self, sequence_id):
         """Get sequence from database"""
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute("SELECT * FROM outreach_sequences WHERE id = %s", (sequence_id,))
-        sequence = cur.fetchone()
-        
-        cur.close()
-        conn.close()
+        with db_cursor() as cur:
+            cur.execute(
+                f"SELECT {SEQUENCE_COLUMNS}, c.latest_version FROM outreach_sequences s {BASE_JOIN} "
+                "LEFT JOIN campaigns c ON c.id = s.campaign_id WHERE s.id = %s",
+                (sequence_id,)
+            )
+            sequence = cur.fetchone()
         
+        # Stored form (snapshot or delta); materialize() rebuilds sequence_data
         return sequence
+
+    def _store_sequence(self, campaign_id, sequence):
+        """Store a newly generated sequence as version 1"""
+        with db_cursor(commit=True) as cur:
+            cur.execute(
+                "INSERT INTO outreach_sequences (campaign_id, sequence_data, version) VALUES (%s, %s, 1) RETURNING id",
+                (campaign_id, canonical_json(sequence))
+            )
+            sequence_id = cur.fetchone()['id']
         
-    def _store_sequence(self, campaign_id, sequence, version=1):
-        """Store sequence in database"""
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute(
-            "INSERT INTO outreach_sequences (campaign_id, sequence_data, version) VALUES (%s, %s, %s) RETURNING id",
-            (campaign_id, json.dumps(sequence), version)
-        )
-        
-        sequence_id = cur.fetchone()['id']
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-        
-        return sequence_id
\ No newline at end of file
+        return sequence_id
+
+    def _store_sequences_bulk(self, sequences, version=1):
+        """Store (campaign_id, sequence) pairs in one insert; returns {campaign_id: sequence_id}"""
+        if not sequences:
+            return {}
+        with db_cursor(commit=True) as cur:
+            rows = execute_values(
+                cur,
+                "INSERT INTO outreach_sequences (campaign_id, sequence_data, version) VALUES %s RETURNING id, campaign_id",
+                [(campaign_id, canonical_json(sequence), version) for campaign_id, sequence in sequences],
+                fetch=True
+            )
+        return {row['campaign_id']: row['id'] for row in rows}
@@ -0,0 +1,114 @@
+import os
+import threading
+from agents.conversation_state import ConversationState
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+def count_tokens(text):
+    """Count tokens with tiktoken when available, otherwise estimate ~4 characters per token"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return max(1, len(text) // 4)
+
+class ConversationHistory:
+    """
+    Sliding window of recent messages plus a rolling summary of older ones
+
+    The last max_turns turns are kept verbatim as long as they fit in
+    token_budget; everything older is folded into `summary` by compact().
+    `summary_seq` is the sequence number of the last message folded into the
+    summary, so the stored summary can be resumed after a cache miss.
+    `state` tracks the campaign and sequence the conversation is working on.
+    """
+    def __init__(self, summary="", summary_seq=0, max_turns=None, token_budget=None, state=None):
+        self.summary = summary or ""
+        self.state = state or ConversationState()
+        self.summary_seq = summary_seq or 0
+        self.max_turns = max_turns if max_turns is not None else int(os.getenv('AGENT_HISTORY_MAX_TURNS', 6))
+        self.token_budget = token_budget if token_budget is not None else int(os.getenv('AGENT_HISTORY_TOKEN_BUDGET', 1500))
+        self.messages = []  # list of (seq, role, text)
+        # Highest message seq this history has seen; equals conversations.message_count when current
+        self.last_seq = self.summary_seq
+        self.lock = threading.Lock()
+        self._compacting = False
+
+    def add_message(self, seq, role, text):
+        self.messages.append((seq, role, text))
+        self.last_seq = max(self.last_seq, seq)
+
+    def add_turn(self, user_message, ai_message, first_seq):
+        with self.lock:
+            self.add_message(first_seq, "user", user_message)
+            self.add_message(first_seq + 1, "assistant", ai_message)
+            if len(self.messages) > 2 and self.messages[-3][0] > first_seq:
+                # A concurrent turn on the same conversation finished first
+                self.messages.sort(key=lambda m: m[0])
+
+    def _format_messages(self, messages):
+        return "\n".join(
+            f"{'Human' if role == 'user' else 'AI'}: {text}" for _, role, text in messages
+        )
+
+    def render(self):
+        """History text to interpolate into prompts"""
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of earlier conversation: {self.summary}")
+        if self.messages:
+            parts.append(self._format_messages(self.messages))
+        return "\n".join(parts)
+
+    def token_count(self):
+        return count_tokens(self.render())
+
+    def _split_point(self):
+        """Index of the first message to keep verbatim"""
+        keep_from = max(0, len(self.messages) - self.max_turns * 2)
+        # Fold further (whole turns) while the window is over budget, but
+        # always keep the latest turn verbatim
+        while (
+            keep_from < len(self.messages) - 2
+            and count_tokens(self.summary) + count_tokens(self._format_messages(self.messages[keep_from:])) > self.token_budget
+        ):
+            keep_from += 2
+        return keep_from
+
+    def needs_compaction(self):
+        return self._split_point() > 0
+
+    def compact(self, summarize):
+        """
+        Fold messages outside the window into the summary
+
+        summarize(existing_summary, transcript) must return the new summary.
+        Returns True if the summary changed.
+        """
+        with self.lock:
+            keep_from = self._split_point()
+            if keep_from == 0 or self._compacting:
+                return False
+            self._compacting = True
+            folded = self.messages[:keep_from]
+            transcript = self._format_messages(folded)
+            summary_seq = folded[-1][0]
+
+        # Summarize outside the lock; turns appended meanwhile stay in the window
+        try:
+            new_summary = summarize(self.summary, transcript)
+        except Exception:
+            with self.lock:
+                self._compacting = False
+            raise
+
+        with self.lock:
+            self.summary = new_summary
+            self.summary_seq = summary_seq
+            self.messages = [m for m in self.messages if m[0] > summary_seq]
+            self._compacting = False
+        return True
@@ -0,0 +1,48 @@
+class ConversationState:
+    """
+    What a conversation is currently working on
+
+    Tracked explicitly so tools can resolve "edit it" or "generate one for
+    this campaign" without scanning the history. Persisted in the
+    conversations table (active_campaign_id, last_sequence_id,
+    last_sequence_version) and cached with the conversation's history.
+    """
+    __slots__ = ("campaign_id", "sequence_id", "sequence_version")
+
+    def __init__(self, campaign_id=None, sequence_id=None, sequence_version=None):
+        self.campaign_id = campaign_id
+        self.sequence_id = sequence_id
+        self.sequence_version = sequence_version
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            campaign_id=row.get('active_campaign_id'),
+            sequence_id=row.get('last_sequence_id'),
+            sequence_version=row.get('last_sequence_version')
+        )
+
+    def record_sequence(self, campaign_id, sequence_id, version):
+        """A tool generated or edited a sequence"""
+        if campaign_id:
+            self.campaign_id = campaign_id
+        self.sequence_id = sequence_id
+        self.sequence_version = version
+
+    def update_from_response(self, response, campaign_id=None):
+        """Apply the ids a turn's response reports (and the campaign the request was about)"""
+        if campaign_id:
+            self.campaign_id = campaign_id
+        if isinstance(response, dict):
+            if response.get("campaign_id"):
+                self.campaign_id = response["campaign_id"]
+            if response.get("sequence_id"):
+                self.sequence_id = response["sequence_id"]
+                self.sequence_version = response.get("version")
+
+    def as_dict(self):
+        return {
+            "campaign_id": self.campaign_id,
+            "sequence_id": self.sequence_id,
+            "sequence_version": self.sequence_version,
+        }
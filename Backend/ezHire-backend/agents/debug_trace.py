@@ -0,0 +1,117 @@
+import os
+import time
+import zlib
+import random
+import threading
+from collections import deque
+from agents.tracing import current_trace, current_tool
+
+class DebugTraceBuffer:
+    """
+    Bounded in-memory ring buffer of structured debug records
+
+    Replaces printing prompts, responses and parser output to stdout. Records
+    are kept per request: a request is either sampled (all of its records are
+    kept) or not, decided from its request id at `sample_rate`. Only the
+    newest `capacity` records are kept and long text fields are truncated to
+    `max_chars`.
+    """
+    def __init__(self, capacity=None, sample_rate=None, max_chars=None):
+        self.enabled = os.getenv('DEBUG_TRACE_ENABLED', 'True') == 'True'
+        self.capacity = capacity if capacity is not None else int(os.getenv('DEBUG_TRACE_CAPACITY', 1000))
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv('DEBUG_TRACE_SAMPLE_RATE', 1.0))
+        self.max_chars = max_chars if max_chars is not None else int(os.getenv('DEBUG_TRACE_MAX_CHARS', 4000))
+        self._records = deque(maxlen=self.capacity)
+        self._lock = threading.Lock()
+        self._seq = 0
+        self.counters = {"recorded": 0, "sampled_out": 0}
+
+    def sampled(self, request_id=None):
+        """Whether records for this request (or, outside a request, this call) are kept"""
+        if not self.enabled or self.sample_rate <= 0:
+            return False
+        if self.sample_rate >= 1:
+            return True
+        if request_id is None:
+            return random.random() < self.sample_rate
+        # Same decision for every record of a request
+        return zlib.crc32(request_id.encode("utf-8")) / 0xFFFFFFFF < self.sample_rate
+
+    def _truncate(self, value):
+        if isinstance(value, str) and len(value) > self.max_chars:
+            return value[:self.max_chars] + f"... [{len(value) - self.max_chars} more characters]"
+        return value
+
+    def record(self, kind, data, request_id=None, tool=None):
+        """
+        Keep a record like {"kind": "llm", "request_id", "tool", "data": {...}}
+
+        request_id and tool default to the current request and agent tool.
+        Returns False when the record was sampled out.
+        """
+        if request_id is None:
+            trace = current_trace()
+            request_id = trace.request_id if trace else None
+        if not self.sampled(request_id):
+            with self._lock:
+                self.counters["sampled_out"] += 1
+            return False
+
+        entry = {
+            "timestamp": time.time(),
+            "kind": kind,
+            "request_id": request_id,
+            "tool": tool if tool is not None else current_tool(),
+            "data": {key: self._truncate(value) for key, value in data.items()},
+        }
+        with self._lock:
+            self._seq += 1
+            entry["seq"] = self._seq
+            self._records.append(entry)
+            self.counters["recorded"] += 1
+        return True
+
+    def recent(self, limit=100, request_id=None, kind=None):
+        """Newest records first, optionally for one request or kind"""
+        with self._lock:
+            records = list(self._records)
+        matches = []
+        for entry in reversed(records):
+            if request_id and entry["request_id"] != request_id:
+                continue
+            if kind and entry["kind"] != kind:
+                continue
+            matches.append(entry)
+            if len(matches) >= limit:
+                break
+        return matches
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.counters,
+                "enabled": self.enabled,
+                "size": len(self._records),
+                "capacity": self.capacity,
+                "sample_rate": self.sample_rate,
+            }
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+def get_debug_trace():
+    """Process-wide debug trace buffer"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = DebugTraceBuffer()
+    return _buffer
+
+def debug_trace(kind, **data):
+    """Record a debug record in the process-wide buffer"""
+    return get_debug_trace().record(kind, data)
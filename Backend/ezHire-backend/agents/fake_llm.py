@@ -0,0 +1,133 @@
+"""
+Offline stand-ins for ChatOpenAI and the legacy OpenAI LLM
+
+They look at the prompt to decide what kind of answer the real model would
+give (a ReAct routing step, a JSON sequence, a summary or plain prose) and
+return a canned but realistic response after `latency` seconds. Select them
+with LLM_BACKEND=fake.
+"""
+import os
+import re
+import json
+import math
+import time
+import hashlib
+from typing import Any, List, Optional
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+from langchain_core.language_models.chat_models import SimpleChatModel
+from agents.intent_router import IntentRouter, GENERAL
+
+_router = IntentRouter(threshold=0.0, margin=0.0)
+
+def _fake_step(n, channel, role):
+    step = {
+        "channel": channel,
+        "timing": "Send immediately" if n == 1 else f"Send {2 * (n - 1) + 1} days after initial email",
+        "message_content": (
+            f"Hi {{candidate_name}}, I came across your background and think you would be a great fit "
+            f"for our {role} opening. We are a remote-first team that values growth and ownership. "
+            f"Would you be open to a short call this week?"
+        ),
+    }
+    if channel == "Email":
+        step["subject_line"] = f"{role} opportunity - step {n}"
+    return step
+
+def fake_sequence(role="Software Engineer", steps=3):
+    channels = ["Email", "LinkedIn", "Email"]
+    return {f"step{n}": _fake_step(n, channels[(n - 1) % len(channels)], role) for n in range(1, steps + 1)}
+
+def _field(prompt, label, default):
+    match = re.search(rf"{label}:\s*(.+)", prompt)
+    return match.group(1).strip() if match else default
+
+def fake_response(prompt):
+    """Return the text a real model would plausibly produce for one of the app's prompts"""
+    if "Action Input:" in prompt and "Begin!" in prompt:
+        # Routing prompt of the ReAct agent
+        user_input = prompt.split("User:")[-1].split("You have access to the following tools")[0].strip()
+        scores = _router.score(user_input)
+        tool = max(scores, key=scores.get) if scores else GENERAL
+        return f"Thought: I should use {tool}\nAction: {tool}\nAction Input: \"{user_input[:500]}\""
+
+    if "New summary:" in prompt:
+        return "The recruiter is building an outreach campaign and has generated and edited sequences."
+
+    role = _field(prompt, "Target Role", "Software Engineer")
+    if '"campaign"' in prompt and '"sequence"' in prompt:
+        return json.dumps({
+            "campaign": {
+                "target_role": role,
+                "industry": "Technology",
+                "company_values": "Innovation, Collaboration, Excellence",
+                "unique_selling_points": "Remote-first, Competitive salary, Growth opportunities",
+            },
+            "sequence": fake_sequence(role),
+        })
+
+    if "outreach sequence" in prompt and "JSON" in prompt:
+        return json.dumps(fake_sequence(role))
+
+    if "best practice" in prompt:
+        return ("[Best Practice] Reference one concrete achievement from the candidate's profile in the first "
+                "two sentences; personalized openers lift reply rates by roughly 30%.")
+
+    return "Happy to help! I can draft outreach sequences, edit existing ones, or share recruiting best practices."
+
+class FakeCompletionLLM(LLM):
+    """Drop-in replacement for the legacy OpenAI completion LLM"""
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-completion"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        return fake_response(prompt)
+
+class FakeChatLLM(SimpleChatModel):
+    """Drop-in replacement for ChatOpenAI"""
+    latency: float = 0.0
+    model_name: str = "fake-chat"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _call(self, messages: List[Any], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        prompt = "\n".join(str(message.content) for message in messages)
+        return fake_response(prompt)
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic local embeddings: hashed bag of words, L2-normalized
+
+    Texts that share words get similar vectors, which is enough for the
+    vector store, ingestion and semantic cache to behave realistically
+    without calling OpenAI.
+    """
+    def __init__(self, dimension=256):
+        self.dimension = dimension
+
+    def _embed(self, text):
+        vector = [0.0] * self.dimension
+        for token in re.findall(r"[a-z0-9]+", text.lower()):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimension
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+def fake_latency():
+    return float(os.getenv('FAKE_LLM_LATENCY', 0))
@@ -3,46 +3,57 @@ import json
 from typing import ClassVar, List
 from langchain.agents import Tool, AgentExecutor, LLMSingleActionAgent
 from langchain.prompts import StringPromptTemplate
-from langchain_openai import ChatOpenAI
 from langchain.chains import LLMChain
-from langchain.memory import ConversationBufferMemory
 from langchain.agents.output_parsers import ReActSingleInputOutputParser
 from langchain.agents.agent import AgentOutputParser
 from langchain.schema import AgentAction, AgentFinish
 import re
+import asyncio
+from contextvars import ContextVar
 from typing import List, Union
+from agents.chat_history import ConversationHistory, count_tokens
+from agents.conversation_state import ConversationState
+from agents.llm_backends import chat_llm
+from agents.llm_cache import get_llm_cache
+from agents.memory_store import ConversationMemoryStore
+from agents.registry import get_embedder, get_intent_router, get_semantic_cache
+from agents.tracing import span, traced_tool
+from agents.debug_trace import debug_trace
+from agents.output_parsing import parse_final_answer
 from agents.outreach_agent import OutreachSequenceGenerator
-from models.database import get_db_connection
+from models.database import db_cursor
+from models.outreach_sequence import canonical_json
+from models.sequence_store import SEQUENCE_COLUMNS, BASE_JOIN, materialize, store_version, astore_version
+from models.async_database import adb_connection, afetchone, afetchall
+from models.vector_store import get_knowledge_index, query_hr_knowledge
 
 
 # debuggng
 # import langchain
 # langchain.debug = True
+
+# Memory of the conversation the current request is working on; tools read it
+# instead of a shared attribute so concurrent chats never see each other's history
+_current_memory = ContextVar("current_memory", default=None)
+
 class CustomReActOutputParser(AgentOutputParser):
     def parse(self, llm_output: str) -> Union[AgentAction, AgentFinish]:
-        print("=====inside custom parser=====")
-        print(f"LLM Output: {llm_output}")
-        if "Final Answer:" in llm_output:
-            final_answer_text = llm_output.split("Final Answer:")[-1].strip()
-            if final_answer_text.strip().startswith("{"):
-                try:
-                    return_values = json.loads(final_answer_text)
-                    return AgentFinish(
-                        return_values=return_values,
-                        log=llm_output,
-                    )
-                except json.JSONDecodeError:
-                    pass
-            
+        with span("parse", "react"):
+            result = self._parse(llm_output)
+        debug_trace("parse", llm_output=llm_output, result=type(result).__name__, action=getattr(result, "tool", None))
+        return result
+
+    def _parse(self, llm_output: str) -> Union[AgentAction, AgentFinish]:
+        answer = parse_final_answer(llm_output)
+        if answer is not None:
             return AgentFinish(
-                return_values={"output": final_answer_text},
+                return_values=answer if isinstance(answer, dict) else {"output": answer},
                 log=llm_output,
             )
             # return AgentFinish(
             #     return_values={"output": llm_output.split("Final Answer:")[-1].strip()},
             #     log=llm_output,
             # )
-        print("==== NO MATCH ====")
         regex = r"Action: (.*?)[\n]*Action Input:[\s]*(.*)"
         match = re.search(regex, llm_output, re.DOTALL)
 
@@ -111,7 +122,6 @@ class HRAgentPrompt(StringPromptTemplate):
     tools: List[Tool] = []
     def __init__(self, tools: List[Tool], **kwargs):
         super().__init__(**kwargs)
-        print(f"Initalizing with {tools}")
         self.tools = tools
 
     def format(self, **kwargs):
@@ -121,42 +131,57 @@ class HRAgentPrompt(StringPromptTemplate):
         return self.template.format(**kwargs)
 
 class HRAgent:
-    def __init__(self):
+    def __init__(self, outreach_generator=None):
         # self.llm = OpenAI(temperature=0.7)
-        self.llm =ChatOpenAI(model="gpt-4o", temperature=0.2)
-        self.memory = ConversationBufferMemory(memory_key="chat_history", return_messages=False)
-        self.outreach_generator = OutreachSequenceGenerator()
+        self.llm = chat_llm(model="gpt-4o", temperature=0.2)
+        self.memories = ConversationMemoryStore(loader=self._load_memory, counter=self._message_count)
+        self.outreach_generator = outreach_generator or OutreachSequenceGenerator()
         # tools
         self.tools = [
             Tool(
                 name="Generate_Outreach_Sequence",
                 func=self.generate_sequence,
+                coroutine=self.agenerate_sequence,
                 description="Generate an outreach sequence for campaign_id based on campaign requirements"
             ),
             Tool(
                 name="Edit_Sequence",
                 func=self.edit_sequence,
+                coroutine=self.aedit_sequence,
                 description="IMPORTANT: Use this tool for ANY request to edit, modify, change, update, revise, improve, or customize an existing outreach sequence. If the user mentions any of these words in relation to a sequence, ALWAYS use this tool."
             ),
             Tool(
                 name="Search_Best_Practices",
                 func=self.search_best_practices,
+                coroutine=self.asearch_best_practices,
                 description="Search for best practices in talent outreach"
             ),
             Tool(
                 name="General_Conversation",
                 func=self.handle_general_conversation,
+                coroutine=self.ahandle_general_conversation,
                 description="Only handle general conversation if any other tool is not applicable. This is a fallback tool."
             )
         ]
+        # Each tool runs as a span, and LLM/DB spans inside it are tagged with its name
+        for tool in self.tools:
+            tool.func = traced_tool(tool.name, tool.func)
+            tool.coroutine = traced_tool(tool.name, tool.coroutine)
         
+        self.tools_by_name = {tool.name: tool for tool in self.tools}
+        self.router = get_intent_router()
+        self.embedder = get_embedder()
+        self.semantic_cache = get_semantic_cache()
+        self.knowledge_top_k = int(os.getenv('KNOWLEDGE_TOP_K', 3))
+        self.knowledge_min_score = float(os.getenv('KNOWLEDGE_MIN_SCORE', 0.8))
+
         # agent
-        prompt = HRAgentPrompt(
+        self.prompt = HRAgentPrompt(
             tools=self.tools,
             input_variables=["input", "chat_history"]
         )
 
-        llm_chain = LLMChain(llm=self.llm, prompt=prompt)
+        llm_chain = LLMChain(llm=self.llm, prompt=self.prompt)
         
         self.agent = LLMSingleActionAgent(
             llm_chain=llm_chain,
@@ -168,8 +193,8 @@ class HRAgent:
         self.agent_executor = AgentExecutor.from_agent_and_tools(
             agent=self.agent,
             tools=self.tools,
-            memory=self.memory,
-            verbose=True,
+            # Step-by-step output goes to stdout; prompts and parses are in the debug trace buffer instead
+            verbose=os.getenv('AGENT_VERBOSE', 'False') == 'True',
             max_iterations=1,
             early_stopping_method="force",
             handle_parsing_errors=self.handle_parsing_errors,
@@ -177,265 +202,340 @@ class HRAgent:
             return_intermediate_steps=True
         )
 
-    def _parse_requirements(self, requirements_text):
-        """Parse natural language requirements into structured data"""
-        
-        prompt = f"""
-        Extract the following information from this text:
-        - target_role
-        - industry
-        - company_values
-        - unique_selling_points
-        
-        Text: {requirements_text}
-        
-        Return as a JSON object with these keys.
-        """
-        response = self.llm.invoke(prompt)
-        try:
-            # Try to extract JSON from the response
-            json_match = re.search(r'```json\n(.*?)\n```', response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(1)
-                return json.loads(json_str)
-            
-            # If no JSON found in markdown format, try to parse the whole response
-            return json.loads(response)
-        except:
-            # Fallback to basic extraction
-            info = {
-                "target_role": "",
-                "industry": "",
-                "company_values": "",
-                "unique_selling_points": ""
-            }
-            
-            # Simple extraction
-            if "target role" in requirements_text.lower():
-                role_match = re.search(r'target role[:\s]+([^,\n.]+)', requirements_text, re.IGNORECASE)
-                if role_match:
-                    info["target_role"] = role_match.group(1).strip()
-                    
-            if "industry" in requirements_text.lower():
-                industry_match = re.search(r'industry[:\s]+([^,\n.]+)', requirements_text, re.IGNORECASE)
-                if industry_match:
-                    info["industry"] = industry_match.group(1).strip()
-            
-            # Use the whole text as values if nothing extracted
-            if not any(info.values()):
-                info["company_values"] = requirements_text[:100]
-                info["unique_selling_points"] = "From requirements"
-                
-            return info
-
     def generate_sequence(self, requirements):
         """Generate an outreach sequence based on campaign requirements"""
         try:
-            print(f"Generating sequence with requirements: {requirements}")
-            og_requirements = requirements
-
+            debug_trace("tool_input", requirements=requirements)
             if isinstance(requirements, str):
-                campaign_id = None
-                campaign_match = re.search(r"campaign(?:_id| id|ID)[: ]*(\d+)", requirements)
-                if campaign_match:
-                    campaign_id = int(campaign_match.group(1))
-                campaign_info = self._parse_requirements(requirements)
+                # One call extracts the campaign fields and writes the sequence
+                campaign_info, sequence = self.outreach_generator.generate_from_requirements(requirements)
             else:
-                campaign_info = og_requirements
-                campaign_id = None
+                campaign_info = requirements
+                sequence = self.outreach_generator.generate_sequence(campaign_info)
 
-            sequence = self.outreach_generator.generate_sequence(campaign_info)
+            campaign_id = self._requested_campaign(requirements)
+            sequence_id = None
+            try:
+                if campaign_id and "error" not in sequence:
+                    with db_cursor(commit=True) as cur:
+                        cur.execute(
+                            "INSERT INTO outreach_sequences (campaign_id, sequence_data, version) VALUES (%s, %s, %s) RETURNING id",
+                            (campaign_id, canonical_json(sequence), 1)
+                        )
+                        sequence_id = cur.fetchone()['id']
+            except Exception as e:
+                print(f"Error saving sequence: {str(e)}")
+            return self._generated_answer(sequence, campaign_id, campaign_info, sequence_id)
+        except Exception as e:
+            return f"Error generating sequence: {str(e)}"
 
+    async def agenerate_sequence(self, requirements):
+        """Async entry point of the Generate_Outreach_Sequence tool (LLM and insert stay on the event loop)"""
+        try:
+            debug_trace("tool_input", requirements=requirements)
+            if isinstance(requirements, str):
+                campaign_info, sequence = await self.outreach_generator.agenerate_from_requirements(requirements)
+            else:
+                campaign_info = requirements
+                sequence = await self.outreach_generator.agenerate_sequence(campaign_info)
+
+            campaign_id = self._requested_campaign(requirements)
             sequence_id = None
             try:
-                if not campaign_id:
-                    campaign_id = self._extract_campaign_id_from_memory()
-                
-                if campaign_id:
-                    conn = get_db_connection()
-                    cur = conn.cursor()
-                    cur.execute(
-                        "INSERT INTO outreach_sequences (campaign_id, sequence_data, version) VALUES (%s, %s, %s) RETURNING id",
-                        (campaign_id, json.dumps(sequence), 1)
-                    )
-                    sequence_id = cur.fetchone()['id']
-                    conn.commit()
-                    cur.close()
-                    conn.close()
+                if campaign_id and "error" not in sequence:
+                    async with adb_connection() as conn:
+                        sequence_id = await conn.fetchval(
+                            "INSERT INTO outreach_sequences (campaign_id, sequence_data, version) VALUES ($1, $2, 1) RETURNING id",
+                            campaign_id, sequence
+                        )
             except Exception as e:
                 print(f"Error saving sequence: {str(e)}")
-           
-            sequence_json = json.dumps(sequence, indent=2)
-            final_answer = {
-                        "output": sequence_json,
-                        "action_tool": "Generate_Outreach_Sequence",
-                        "message": f"Generating Sequence..."
-                    }
-            if campaign_id:
-                final_answer["campaign_id"] = campaign_id
-            if sequence_id:
-                final_answer["sequence_id"] = sequence_id
-                final_answer["message"] += f" (ID: {sequence_id})"
-                
-            return f"Final Answer: {json.dumps(final_answer)}"
+            return self._generated_answer(sequence, campaign_id, campaign_info, sequence_id)
         except Exception as e:
             return f"Error generating sequence: {str(e)}"
+
+    def _requested_campaign(self, requirements):
+        """Campaign a generation is for: named in the request, or the conversation's active one"""
+        if isinstance(requirements, str):
+            campaign_match = re.search(r"campaign(?:_id| id|ID)[: ]*(\d+)", requirements)
+            if campaign_match:
+                return int(campaign_match.group(1))
+        state = self._conversation_state()
+        return state.campaign_id if state else None
+
+    def _generated_answer(self, sequence, campaign_id, campaign_info, sequence_id):
+        state = self._conversation_state()
+        if sequence_id and state:
+            state.record_sequence(campaign_id, sequence_id, 1)
+        final_answer = {
+                    "output": canonical_json(sequence),
+                    "action_tool": "Generate_Outreach_Sequence",
+                    "message": "Generating Sequence..."
+                }
+        if campaign_id:
+            final_answer["campaign_id"] = campaign_id
+        if campaign_info:
+            final_answer["campaign_info"] = campaign_info
+        if sequence_id:
+            final_answer["sequence_id"] = sequence_id
+            final_answer["version"] = 1
+            final_answer["message"] += f" (ID: {sequence_id})"
+            
+        return f"Final Answer: {json.dumps(final_answer)}"
     
     def edit_sequence(self, edit_request):
         """Edit an existing outreach sequence based on user feedback"""
         try:
-            sequence_id = None
-            campaign_id = None
-            
-            if isinstance(edit_request, str):
-                id_match = re.search(r"sequence (?:id|ID)[: ]*(\d+)", edit_request)
-                if id_match:
-                    sequence_id = int(id_match.group(1))
-                else:
-                    campaign_match = re.search(r"campaign(?:_id| id|ID)[: ]*(\d+)", edit_request)
-                    if campaign_match:
-                        campaign_id = int(campaign_match.group(1))
-                
-                conn = get_db_connection()
-                cur = conn.cursor()
-                
-                if sequence_id:
-                    cur.execute("SELECT id, sequence_data, campaign_id, version FROM outreach_sequences WHERE id = %s", (sequence_id,))
-                elif campaign_id:
-                    cur.execute("""
-                        SELECT id, sequence_data, campaign_id, version 
-                        FROM outreach_sequences 
-                        WHERE campaign_id = %s 
-                        ORDER BY version DESC, created_at DESC 
-                        LIMIT 1
-                    """, (campaign_id,))
-                else:
-                    # fallback
-                    campaign_id = self._extract_campaign_id_from_memory()
-                    if campaign_id:
-                        cur.execute("""
-                            SELECT id, sequence_data, campaign_id, version 
-                            FROM outreach_sequences 
-                            WHERE campaign_id = %s 
-                            ORDER BY version DESC, created_at DESC 
-                            LIMIT 1
-                        """, (campaign_id,))
-                    else:
-                        cur.close()
-                        conn.close()
-                        return "To edit an existing sequence, please provide a sequence ID or campaign ID in your request."
-                
+            target = self._edit_target(edit_request)
+            if isinstance(target, str):
+                return target
+            sequence_id, campaign_id = target
+
+            with db_cursor() as cur:
+                cur.execute(self._edit_target_query(sequence_id, "%s"), (sequence_id or campaign_id,))
                 result = cur.fetchone()
-                if result:
-                    sequence_id = result['id']
-                    sequence_json = result['sequence_data']
-                    campaign_id = result['campaign_id']
-                    version = result['version']
-                    
-                    if isinstance(sequence_json, str):
-                        sequence = json.loads(sequence_json)
-                    else:
-                        sequence = sequence_json
-                        
-                    edited_sequence = self.outreach_generator.edit_sequence(sequence, edit_request)
-                    
-                    cur.execute(
-                        "INSERT INTO outreach_sequences (campaign_id, sequence_data, version) VALUES (%s, %s, %s) RETURNING id",
-                        (campaign_id, json.dumps(edited_sequence), version + 1)
-                    )
-                    new_sequence_id = cur.fetchone()['id']
-                    conn.commit()
-                    
-                    cur.close()
-                    conn.close()
-                    
-                    edited_json = json.dumps(edited_sequence, indent=2)
-                    final_answer = {
-                        "output": edited_json,
-                        "action_tool": "Edit_Sequence",
-                        "message": f"Updated sequence..."
-                    }
-                    if campaign_id:
-                        final_answer["campaign_id"] = campaign_id
-                        final_answer["message"] += f" (Campaign ID: {campaign_id})"
-                    if new_sequence_id:
-                        final_answer["sequence_id"] = new_sequence_id
-                        final_answer["message"] += f" (ID: {new_sequence_id})"
-                    
-                    return f"Final Answer: {json.dumps(final_answer)}"
-                    # final_answer = {
-                    #     "output": edited_json,
-                    #     "action_tool": "Edit_Sequence",
-                    #     "sequence_id": new_sequence_id,
-                    #     "campaign_id": campaign_id,
-                    #     "message": f"I've updated the sequence (new ID: {new_sequence_id}) for campaign {campaign_id}. You can reference this ID for future edits."
-                    # }
-                    # return f"Here is the edited sequence (ID: {new_sequence_id}): {edited_json}\n\nFinal Answer: {final_answer} "
-                    # return f"Here is the edited sequence (ID: {new_sequence_id}): {edited_json}\n\nFinal Answer: {final_answer} I've updated the sequence (new ID: {new_sequence_id}) for campaign {campaign_id}. You can reference this ID for future edits."
-                else:
-                    cur.close()
-                    conn.close()
-                    error_message = ""
-                    if sequence_id:
-                        error_message = f"Error: Sequence with ID {sequence_id} was not found."
-                    elif campaign_id:
-                        error_message = f"Error: No sequences found for campaign ID {campaign_id}."
-                    else:
-                        error_message = "Error: I couldn't identify which sequence to edit. Please provide a sequence ID or campaign ID."
-                    final_answer = {
-                        "output": "",
-                        "action_tool": "Edit_Sequence",
-                        "message": error_message,
-                        "error": True
-                    }
-                    return f"Final Answer: {json.dumps(final_answer)}"
-                        
-            final_answer = {
-                "output": "",
-                "action_tool": "Edit_Sequence",
-                "message": "To edit an existing sequence, please provide the sequence ID (e.g., 'Edit sequence ID 123') or campaign ID (e.g., 'Edit sequence for campaign 456').",
-                "error": True
-            }
-            return f"Final Answer: {json.dumps(final_answer)}"
+            if not result:
+                return self._edit_not_found(sequence_id, campaign_id)
+
+            # The LLM call runs without holding a pooled connection
+            edited_sequence = self.outreach_generator.edit_sequence(materialize(result)['sequence_data'], edit_request)
+            if "error" in edited_sequence:
+                # A failed edit must not become the campaign's latest version
+                return self._edit_error(f"Error editing sequence: {edited_sequence['error']}")
+
+            with db_cursor(commit=True) as cur:
+                new_sequence_id, version = store_version(cur, result, edited_sequence)
+            return self._edited_answer(edited_sequence, result['campaign_id'], new_sequence_id, version)
         except Exception as e:
-            final_answer = {
-                "output": "",
-                "action_tool": "Edit_Sequence",
-                "message": f"Error editing sequence: {str(e)}",
-                "error": True
-            }
-            return f"Final Answer: {json.dumps(final_answer)}"
-    
-    def chat(self, user_input, conversation_id=None):
+            return self._edit_error(f"Error editing sequence: {str(e)}")
+
+    async def aedit_sequence(self, edit_request):
+        """Async entry point of the Edit_Sequence tool (LLM and queries stay on the event loop)"""
+        try:
+            target = self._edit_target(edit_request)
+            if isinstance(target, str):
+                return target
+            sequence_id, campaign_id = target
+
+            result = await afetchone(self._edit_target_query(sequence_id, "$1"), sequence_id or campaign_id)
+            if not result:
+                return self._edit_not_found(sequence_id, campaign_id)
+
+            edited_sequence = await self.outreach_generator.aedit_sequence(materialize(result)['sequence_data'], edit_request)
+            if "error" in edited_sequence:
+                return self._edit_error(f"Error editing sequence: {edited_sequence['error']}")
+
+            async with adb_connection(transaction=True) as conn:
+                new_sequence_id, version = await astore_version(conn, result, edited_sequence)
+            return self._edited_answer(edited_sequence, result['campaign_id'], new_sequence_id, version)
+        except Exception as e:
+            return self._edit_error(f"Error editing sequence: {str(e)}")
+
+    def _edit_target(self, edit_request):
+        """(sequence_id, campaign_id) the edit request is about, or the answer to give when there is none"""
+        if not isinstance(edit_request, str):
+            return self._edit_error("To edit an existing sequence, please provide the sequence ID (e.g., 'Edit sequence ID 123') or campaign ID (e.g., 'Edit sequence for campaign 456').")
+
+        sequence_id = None
+        campaign_id = None
+        id_match = re.search(r"sequence (?:id|ID)[: ]*(\d+)", edit_request)
+        if id_match:
+            sequence_id = int(id_match.group(1))
+        else:
+            campaign_match = re.search(r"campaign(?:_id| id|ID)[: ]*(\d+)", edit_request)
+            if campaign_match:
+                campaign_id = int(campaign_match.group(1))
+
+        state = self._conversation_state()
+        if not sequence_id and not campaign_id and state:
+            # fallback: what this conversation is working on
+            campaign_id = state.campaign_id
+            if not campaign_id:
+                sequence_id = state.sequence_id
+        if not sequence_id and not campaign_id:
+            return "To edit an existing sequence, please provide a sequence ID or campaign ID in your request."
+        return sequence_id, campaign_id
+
+    def _edit_target_query(self, sequence_id, placeholder):
+        """Query for the version to edit: the given sequence, or the campaign's latest through its maintained pointer"""
+        if sequence_id:
+            return f"""
+                SELECT {SEQUENCE_COLUMNS}
+                FROM outreach_sequences s
+                {BASE_JOIN}
+                WHERE s.id = {placeholder}
+            """
+        return f"""
+            SELECT {SEQUENCE_COLUMNS}
+            FROM campaigns c
+            JOIN outreach_sequences s ON s.id = c.latest_sequence_id
+            {BASE_JOIN}
+            WHERE c.id = {placeholder}
+        """
+
+    def _edited_answer(self, edited_sequence, campaign_id, new_sequence_id, version):
+        state = self._conversation_state()
+        if state:
+            state.record_sequence(campaign_id, new_sequence_id, version)
+        final_answer = {
+            "output": canonical_json(edited_sequence),
+            "action_tool": "Edit_Sequence",
+            "message": "Updated sequence..."
+        }
+        if campaign_id:
+            final_answer["campaign_id"] = campaign_id
+            final_answer["message"] += f" (Campaign ID: {campaign_id})"
+        if new_sequence_id:
+            final_answer["sequence_id"] = new_sequence_id
+            final_answer["version"] = version
+            final_answer["message"] += f" (ID: {new_sequence_id})"
+        return f"Final Answer: {json.dumps(final_answer)}"
+
+    def _edit_not_found(self, sequence_id, campaign_id):
+        if sequence_id:
+            return self._edit_error(f"Error: Sequence with ID {sequence_id} was not found.")
+        return self._edit_error(f"Error: No sequences found for campaign ID {campaign_id}.")
+
+    def _edit_error(self, message):
+        final_answer = {
+            "output": "",
+            "action_tool": "Edit_Sequence",
+            "message": message,
+            "error": True
+        }
+        return f"Final Answer: {json.dumps(final_answer)}"
+
+    def chat(self, user_input, conversation_id=None, campaign_id=None):
         """Process user input and return agent response"""
+        response, _ = self.chat_with_usage(user_input, conversation_id, campaign_id)
+        return response
+
+    def chat_with_usage(self, user_input, conversation_id=None, campaign_id=None):
+        """Process user input and return (agent response, prompt token usage for this turn)
+
+        campaign_id, when the request names one, becomes the conversation's
+        active campaign.
+        """
+        chat_history, route, usage = self._prepare_turn(user_input, conversation_id, campaign_id=campaign_id)
+        return self._run_agent(user_input, chat_history, route), usage
+
+    def _prepare_turn(self, user_input, conversation_id, memory=None, campaign_id=None):
+        """Load the conversation's history, pick a fast-path route and measure the prompt"""
+        if memory is None and conversation_id:
+            memory = self.memories.get(conversation_id)
+        if memory is None:
+            memory = self._new_memory()
+        if campaign_id:
+            memory.state.campaign_id = campaign_id
+        _current_memory.set(memory)
+
+        chat_history = memory.render()
+        route = self.router.route(self._user_request(user_input))
+        usage = {
+            "history_tokens": count_tokens(chat_history),
+            # No routing prompt is sent when the fast path picks the tool
+            "routing_prompt_tokens": 0 if route else count_tokens(self.prompt.format(input=user_input, chat_history=chat_history)),
+            "summarized_through_seq": memory.summary_seq,
+            "fast_path_tool": route[0] if route else None,
+        }
+        debug_trace("turn", user_input=user_input, chat_history=chat_history, usage=usage)
+        return chat_history, route, usage
+
+    async def achat_with_usage(self, user_input, conversation_id=None, campaign_id=None):
+        """Async variant of chat_with_usage; the agent runs with ainvoke"""
+        memory = await self.memories.aget(conversation_id, self._aload_memory, self._amessage_count) if conversation_id else None
+        chat_history, route, usage = self._prepare_turn(
+            user_input, conversation_id, memory=memory or self._new_memory(), campaign_id=campaign_id
+        )
+        return await self._arun_agent(user_input, chat_history, route), usage
+
+    async def _arun_agent(self, user_input, chat_history, route=None):
         try:
-            print(f"====IN CHAT======")
-            print(f"User input: {user_input}")
-
-            if conversation_id:
-                conn = get_db_connection()
-                cur = conn.cursor()
-                cur.execute("SELECT messages FROM conversations WHERE id = %s", (conversation_id,))
-                conversation = cur.fetchone()
-                cur.close()
-                conn.close()
-                
-                if conversation:
-                    self.memory.clear()
-                    
-                    messages = conversation['messages']
-                    for msg in messages:
-                        if msg['role'] == 'user':
-                            self.memory.chat_memory.add_user_message(msg['content'])
-                        else:
-                            content = msg['content']
-                            if isinstance(content, dict):
-                                content = json.dumps(content)
-                            self.memory.chat_memory.add_ai_message(content)
-            print(f"=== Fetched conversation ===")
-            print(f"====Execting AGENT====")
-
-            result = self.agent_executor.invoke({"input": user_input})
+            if route:
+                tool_name, confidence = route
+                debug_trace("route", fast_path=tool_name, confidence=confidence)
+                return self._tool_response(tool_name, await self.tools_by_name[tool_name].coroutine(user_input))
+
+            with span("agent", "executor"):
+                result = await self.agent_executor.ainvoke({"input": user_input, "chat_history": chat_history})
+
+            if "intermediate_steps" in result and len(result["intermediate_steps"]) > 0:
+                action, tool_output = result["intermediate_steps"][-1]
+                return self._tool_response(action.tool, tool_output)
+
+            return {
+                "output": "Response generated",
+                "action_tool": "Unknown",
+                "message": result.get("output", "No response generated"),
+            }
+        except Exception as e:
+            print(f"ERROR: {str(e)}")
+            return self._tool_response("General_Conversation", await self.ahandle_general_conversation(user_input))
+
+    def stream_chat(self, user_input, conversation_id=None, campaign_id=None):
+        """
+        Streaming variant of chat_with_usage
+
+        Yields event dicts. Conversational tools picked by the fast path stream
+        their tokens as they arrive; generation, edits and ambiguous requests
+        run as usual and are reported once finished. The last event is
+        {"event": "response", "data": response, "usage": usage}.
+        """
+        chat_history, route, usage = self._prepare_turn(user_input, conversation_id, campaign_id=campaign_id)
+        tool_name = route[0] if route else None
+        yield {"event": "route", "data": {"tool": tool_name}}
+
+        streaming_prompts = {
+            "Search_Best_Practices": (self._best_practices_prompt, "Best practice for talent outreach"),
+            "General_Conversation": (self._general_conversation_prompt, "Conversation response"),
+        }
+        if tool_name not in streaming_prompts:
+            yield {"event": "response", "data": self._run_agent(user_input, chat_history, route), "usage": usage}
+            return
+
+        build_prompt, output = streaming_prompts[tool_name]
+        prompt = build_prompt(user_input)
+        cache = get_llm_cache()
+        # Only best practices are cached; general replies depend on the history
+        cache_key = cache.make_key(self.llm, prompt) if tool_name == "Search_Best_Practices" and cache.enabled else None
+        vector = self._semantic_vector(tool_name, user_input)
+        message = self.semantic_cache.lookup(tool_name, self._semantic_key(tool_name, user_input), vector) if vector else None
+        if message is None and cache_key:
+            message = cache.get(cache_key)
+        if message is None and tool_name == "Search_Best_Practices":
+            message, _ = self._knowledge_answer(user_input, vector=vector)
+
+        try:
+            if message is not None:
+                yield {"event": "token", "data": {"text": message}}
+            else:
+                chunks = []
+                for chunk in self.llm.stream(prompt):
+                    if chunk.content:
+                        chunks.append(chunk.content)
+                        yield {"event": "token", "data": {"text": chunk.content}}
+                message = "".join(chunks)
+                if cache_key:
+                    cache.set(cache_key, message, model=self.llm.model_name)
+                if vector:
+                    self.semantic_cache.store(tool_name, self._semantic_key(tool_name, user_input), vector, message)
+            response = {"output": output, "action_tool": tool_name, "message": message}
+        except Exception as e:
+            print(f"ERROR while streaming: {str(e)}")
+            response = self._run_agent(user_input, chat_history, route)
+
+        yield {"event": "response", "data": response, "usage": usage}
+
+    def _run_agent(self, user_input, chat_history, route=None):
+        try:
+            if route:
+                # Confident intent: call the tool directly and skip the routing LLM call
+                tool_name, confidence = route
+                debug_trace("route", fast_path=tool_name, confidence=confidence)
+                return self._tool_response(tool_name, self.tools_by_name[tool_name].func(user_input))
+
+            with span("agent", "executor"):
+                result = self.agent_executor.invoke({"input": user_input, "chat_history": chat_history})
             
             # print(f"Agent result: {result}")
 
@@ -443,23 +543,7 @@ class HRAgent:
                 last_step = result["intermediate_steps"][-1]
                 action = last_step[0] 
                 tool_output = last_step[1] 
-                
-                if isinstance(tool_output, str) and "Final Answer:" in tool_output:
-                    tool_output = tool_output.split("Final Answer:")[1].strip()
-                    try:
-                        return json.loads(tool_output)
-                    except json.JSONDecodeError:
-                        return {
-                            "output": "Response processed",
-                            "action_tool": action.tool,
-                            "message": tool_output,
-                            "error": True
-                        }
-                return {
-                    "output": "Response generated",
-                    "action_tool": action.tool,
-                    "message": tool_output if isinstance(tool_output, str) else json.dumps(tool_output)
-                }
+                return self._tool_response(action.tool, tool_output)
                 
             return {
                 "output": "Response generated",
@@ -470,15 +554,11 @@ class HRAgent:
                 # return result.get("output", "No response generated")
         except Exception as e:
             print(f"ERROR: {str(e)}")
-            print(f"====Defaulting to general conversation")
             general_response = self.handle_general_conversation(user_input)
 
-            if isinstance(general_response, str) and "Final Answer:" in general_response:
-                json_str = general_response.split("Final Answer:")[1].strip()
-                try:
-                    return json.loads(json_str)
-                except json.JSONDecodeError:
-                    pass
+            answer = parse_final_answer(general_response, last=False)
+            if isinstance(answer, dict):
+                return answer
                     
             return {
                 "output": f"Error processing request: {str(e)}", 
@@ -488,28 +568,152 @@ class HRAgent:
             }
             # return self.handle_general_conversation(user_input)
     
-    def _extract_campaign_id_from_memory(self):
-        """Extract campaign ID from conversation memory"""
-        try:
-            if hasattr(self, 'memory') and hasattr(self.memory, 'chat_memory'):
-                memory_string = str(self.memory.chat_memory)
-                print(f"\n\nMemory string: {memory_string}")
-                campaign_match = re.search(r"Working on campaign.*?campaign_id[: ]*(\d+)", memory_string)
-                if campaign_match:
-                    return int(campaign_match.group(1))
-                    
-                id_match = re.search(r"campaign_id[: ]*(\d+)", memory_string)
-                if id_match:
-                    return int(id_match.group(1))
-        except Exception as e:
-            print(f"Error extracting campaign ID: {str(e)}")
-        return None
+    def _user_request(self, user_input):
+        """The user's own words, without the campaign context appended by the manager"""
+        request = user_input.split("\nCampaign context:")[0]
+        return request.replace("User's Request:", "", 1).strip()
 
-    def search_best_practices(self, query):
-        """Search for best practices in talent outreach"""
-        # print(f"Searching best practices for query: {query}")
-        
+    def _tool_response(self, tool_name, tool_output):
+        """Turn a tool's "Final Answer: {...}" output into the response dict"""
+        answer = parse_final_answer(tool_output, last=False)
+        if isinstance(answer, dict):
+            return answer
+        if answer is not None:
+            return {
+                "output": "Response processed",
+                "action_tool": tool_name,
+                "message": answer,
+                "error": True
+            }
+        return {
+            "output": "Response generated",
+            "action_tool": tool_name,
+            "message": tool_output if isinstance(tool_output, str) else json.dumps(tool_output)
+        }
+
+    def _new_memory(self):
+        return ConversationHistory()
+
+    def _message_count(self, conversation_id):
+        """Stored messages of a conversation, to tell whether a cached history is current"""
+        with db_cursor() as cur:
+            cur.execute("SELECT message_count FROM conversations WHERE id = %s", (conversation_id,))
+            row = cur.fetchone()
+        return row['message_count'] if row else None
+
+    async def _amessage_count(self, conversation_id):
+        row = await afetchone("SELECT message_count FROM conversations WHERE id = $1", conversation_id)
+        return row['message_count'] if row else None
+
+    def _load_memory(self, conversation_id):
+        """Rebuild a conversation's history from the database (cache miss path)
+
+        Only the stored summary and the messages after it are read.
+        """
+        with db_cursor() as cur:
+            cur.execute(
+                "SELECT summary, summary_seq, active_campaign_id, last_sequence_id, last_sequence_version FROM conversations WHERE id = %s",
+                (conversation_id,)
+            )
+            conversation = cur.fetchone()
+            if not conversation:
+                return None
+            cur.execute(
+                "SELECT seq, role, content FROM conversation_messages WHERE conversation_id = %s AND seq > %s ORDER BY seq",
+                (conversation_id, conversation['summary_seq'])
+            )
+            messages = cur.fetchall()
+
+        memory = ConversationHistory(
+            summary=conversation['summary'],
+            summary_seq=conversation['summary_seq'],
+            state=ConversationState.from_row(conversation)
+        )
+        for msg in messages:
+            memory.add_message(msg['seq'], msg['role'], self._memory_content(msg['content']))
+
+        if memory.needs_compaction():
+            self._compact_history(conversation_id, memory)
+        return memory
+
+    async def _aload_memory(self, conversation_id):
+        """Async variant of _load_memory"""
+        conversation = await afetchone(
+            "SELECT summary, summary_seq, active_campaign_id, last_sequence_id, last_sequence_version FROM conversations WHERE id = $1",
+            conversation_id
+        )
+        if not conversation:
+            return None
+        messages = await afetchall(
+            "SELECT seq, role, content FROM conversation_messages WHERE conversation_id = $1 AND seq > $2 ORDER BY seq",
+            conversation_id, conversation['summary_seq']
+        )
+
+        memory = ConversationHistory(
+            summary=conversation['summary'],
+            summary_seq=conversation['summary_seq'],
+            state=ConversationState.from_row(conversation)
+        )
+        for msg in messages:
+            memory.add_message(msg['seq'], msg['role'], self._memory_content(msg['content']))
+
+        if memory.needs_compaction():
+            await asyncio.to_thread(self._compact_history, conversation_id, memory)
+        return memory
+
+    async def arecord_turn(self, conversation_id, user_message, response, first_seq):
+        """Async variant of record_turn; summarizing runs off the event loop"""
+        memory = self.memories.append_turn(conversation_id, user_message, self._memory_content(response), first_seq)
+        if memory is not None and memory.needs_compaction():
+            try:
+                await asyncio.to_thread(self._compact_history, conversation_id, memory)
+            except Exception as e:
+                print(f"Error summarizing conversation {conversation_id}: {str(e)}")
+
+    def _memory_content(self, content):
+        return json.dumps(content) if isinstance(content, dict) else content
+
+    def record_turn(self, conversation_id, user_message, response, first_seq):
+        """Incrementally add a stored turn to the cached history of a conversation"""
+        memory = self.memories.append_turn(conversation_id, user_message, self._memory_content(response), first_seq)
+        if memory is not None and memory.needs_compaction():
+            try:
+                self._compact_history(conversation_id, memory)
+            except Exception as e:
+                print(f"Error summarizing conversation {conversation_id}: {str(e)}")
+
+    def _compact_history(self, conversation_id, memory):
+        """Fold turns outside the window into the rolling summary and persist it"""
+        if memory.compact(self._summarize_history):
+            with db_cursor(commit=True) as cur:
+                cur.execute(
+                    "UPDATE conversations SET summary = %s, summary_seq = %s WHERE id = %s AND summary_seq < %s",
+                    (memory.summary, memory.summary_seq, conversation_id, memory.summary_seq)
+                )
+
+    def _summarize_history(self, summary, transcript):
         prompt = f"""
+        Progressively summarize this conversation between a recruiter and an HR assistant.
+        Keep every campaign_id and sequence_id mentioned, the roles and industries discussed,
+        and any decisions or edits the recruiter asked for. Limit the summary to 150 words.
+
+        Current summary:
+        {summary or "(none)"}
+
+        New lines of conversation:
+        {transcript}
+
+        New summary:
+        """
+        return self.llm.invoke(prompt).content.strip()
+
+    def _conversation_state(self):
+        """State of the conversation the current request belongs to"""
+        memory = _current_memory.get()
+        return memory.state if memory is not None else None
+
+    def _best_practices_prompt(self, query):
+        return f"""
         Generate a concise and specific best practice for talent outreach based on this query:
         
         Query: {query}
@@ -520,31 +724,157 @@ class HRAgent:
         3. Be formatted as a single best practice tip
         4. Be between 50-150 words
         """
+
+    def search_best_practices(self, query, use_cache=True):
+        """Search for best practices in talent outreach
+
+        Answers from the HR knowledge index when it holds relevant entries;
+        only falls back to generating a tip when nothing matches.
+        """
+        # print(f"Searching best practices for query: {query}")
+        tool_name = "Search_Best_Practices"
+        key = self._semantic_key(tool_name, query)
+        vector = self._semantic_vector(tool_name, query) if use_cache else None
+        cached = self.semantic_cache.lookup(tool_name, key, vector) if vector else None
+        if cached:
+            return self._best_practices_answer(cached)
+
+        message, sources = self._knowledge_answer(query, vector=vector)
+        if message:
+            return self._best_practices_answer(message, sources)
+        
+        prompt = self._best_practices_prompt(query)
         
         try:
-            response = self.llm.invoke(prompt).content
-            final_answer = {
-                "output": "Best practice for talent outreach",
-                "action_tool": "Search_Best_Practices",
-                "message": response,
-            }
-            
-            return f"Final Answer: {json.dumps(final_answer)}"
+            response = get_llm_cache().invoke(self.llm, prompt, use_cache=use_cache)
+            if vector:
+                self.semantic_cache.store(tool_name, key, vector, response)
+            return self._best_practices_answer(response)
+        except Exception as e:
+            return self._best_practices_fallback(e)
+
+    async def asearch_best_practices(self, query, use_cache=True):
+        """Async variant of search_best_practices"""
+        tool_name = "Search_Best_Practices"
+        key = self._semantic_key(tool_name, query)
+        vector = await self._asemantic_vector(tool_name, query) if use_cache else None
+        cached = self.semantic_cache.lookup(tool_name, key, vector) if vector else None
+        if cached:
+            return self._best_practices_answer(cached)
+
+        if vector:
+            message, sources = self._knowledge_answer(query, vector=vector)
+        else:
+            message, sources = await self._aknowledge_answer(query)
+        if message:
+            return self._best_practices_answer(message, sources)
+
+        prompt = self._best_practices_prompt(query)
+
+        try:
+            response = await get_llm_cache().ainvoke(self.llm, prompt, use_cache=use_cache)
+            if vector:
+                self.semantic_cache.store(tool_name, key, vector, response)
+            return self._best_practices_answer(response)
+        except Exception as e:
+            return self._best_practices_fallback(e)
+
+    def _semantic_key(self, tool_name, user_input):
+        """Text the semantic cache compares: the bare request for best practices,
+        the whole message (with campaign context) for general conversation"""
+        return self._user_request(user_input) if tool_name == "Search_Best_Practices" else user_input
+
+    def _semantic_cacheable(self, tool_name):
+        if not self.semantic_cache.enabled:
+            return False
+        if tool_name == "General_Conversation":
+            # General replies depend on the history, so only opening turns are shared
+            memory = _current_memory.get()
+            return memory is None or not memory.render()
+        return True
+
+    def _semantic_vector(self, tool_name, user_input):
+        """Query embedding for the semantic cache, or None when the turn is not cacheable"""
+        if not self._semantic_cacheable(tool_name):
+            return None
+        try:
+            return self.semantic_cache.embed(self._semantic_key(tool_name, user_input))
+        except Exception as e:
+            print(f"Semantic cache embedding failed: {str(e)}")
+            return None
+
+    async def _asemantic_vector(self, tool_name, user_input):
+        if not self._semantic_cacheable(tool_name):
+            return None
+        try:
+            return await self.semantic_cache.aembed(self._semantic_key(tool_name, user_input))
+        except Exception as e:
+            print(f"Semantic cache embedding failed: {str(e)}")
+            return None
+
+    def _knowledge_answer(self, query, vector=None):
+        """(answer, source ids) built from relevant knowledge entries, or (None, [])"""
+        try:
+            hits = query_hr_knowledge(
+                get_knowledge_index(), self._user_request(query),
+                top_k=self.knowledge_top_k, filter={"type": {"$ne": "outreach_message"}},
+                embedder=self.embedder, vector=vector
+            )
         except Exception as e:
-            best_practice = "[Best Practice] Personalized messages referencing specific achievements boost response rates by 30%."
+            print(f"Knowledge lookup failed: {str(e)}")
+            return None, []
+
+        relevant = [hit for hit in hits if hit["score"] >= self.knowledge_min_score and hit["text"]]
+        if not relevant:
+            return None, []
+        if len(relevant) == 1:
+            answer = relevant[0]["text"]
+        else:
+            answer = "\n".join(f"- {hit['text']}" for hit in relevant)
+        return answer, [hit["id"] for hit in relevant]
+
+    async def _aknowledge_answer(self, query):
+        index = get_knowledge_index()
+        if hasattr(index, "__len__") and len(index) == 0:
+            return None, []
+        try:
+            vector = await self.embedder.aembed_query(self._user_request(query))
+        except Exception as e:
+            print(f"Knowledge lookup failed: {str(e)}")
+            return None, []
+        # The index lookup itself is an in-memory matrix product
+        return self._knowledge_answer(query, vector=vector)
+
+    def _best_practices_answer(self, response, sources=None):
+        final_answer = {
+            "output": "Best practice for talent outreach",
+            "action_tool": "Search_Best_Practices",
+            "message": response,
+        }
+        if sources:
+            final_answer["sources"] = sources
         
-            final_answer = {
-                "output": f"Error retrieving additional practices: {str(e)}",
-                "action_tool": "Search_Best_Practices",
-                "message": best_practice,
-                "error": True
-            }
-            
-            return f"Final Answer: {json.dumps(final_answer)}"
+        return f"Final Answer: {json.dumps(final_answer)}"
+
+    def _best_practices_fallback(self, e):
+        best_practice = "[Best Practice] Personalized messages referencing specific achievements boost response rates by 30%."
+    
+        final_answer = {
+            "output": f"Error retrieving additional practices: {str(e)}",
+            "action_tool": "Search_Best_Practices",
+            "message": best_practice,
+            "error": True
+        }
         
-    def handle_general_conversation(self, input_text):
-        """Handle general conversation that doesn't require specific tools"""
-        prompt = f"""
+        return f"Final Answer: {json.dumps(final_answer)}"
+        
+    def _general_conversation_prompt(self, input_text):
+        memory = _current_memory.get()
+        history = memory.render() if memory is not None else ""
+        history_context = f"Conversation so far:\n{history}\n" if history else ""
+
+        return f"""
+        {history_context}
         The user has sent the following message in a conversation about HR and talent acquisition:
         
         {input_text}
@@ -554,28 +884,64 @@ class HRAgent:
         help with talent acquisition tasks like creating outreach sequences.
         Limit your response to 50-150 words.
         """
+
+    def handle_general_conversation(self, input_text):
+        """Handle general conversation that doesn't require specific tools"""
+        tool_name = "General_Conversation"
+        vector = self._semantic_vector(tool_name, input_text)
+        cached = self.semantic_cache.lookup(tool_name, input_text, vector) if vector else None
+        if cached:
+            return self._general_conversation_answer(cached)
+
+        prompt = self._general_conversation_prompt(input_text)
         
         try:
             response = self.llm.invoke(prompt).content
-            final_answer = {
-                "message": response,
-                "action_tool": "General_Conversation",
-                "output": "Conversation response"
-            }
-            
-            return f"Final Answer: {json.dumps(final_answer)}"
+            if vector:
+                self.semantic_cache.store(tool_name, input_text, vector, response)
+            return self._general_conversation_answer(response)
             # return response
-        except Exception as e:
-            default_response = "I'm here to help with your HR and talent acquisition needs. How can I assist you today?"
-            
-            final_answer = {
-                "output": "Conversation response",
-                "action_tool": "General_Conversation",
-                "message": default_response,
-                "error": True
-            }
-            
-            return f"Final Answer: {json.dumps(final_answer)}"
+        except Exception:
+            return self._general_conversation_fallback()
+
+    async def ahandle_general_conversation(self, input_text):
+        """Async variant of handle_general_conversation"""
+        tool_name = "General_Conversation"
+        vector = await self._asemantic_vector(tool_name, input_text)
+        cached = self.semantic_cache.lookup(tool_name, input_text, vector) if vector else None
+        if cached:
+            return self._general_conversation_answer(cached)
+
+        prompt = self._general_conversation_prompt(input_text)
+
+        try:
+            response = (await self.llm.ainvoke(prompt)).content
+            if vector:
+                self.semantic_cache.store(tool_name, input_text, vector, response)
+            return self._general_conversation_answer(response)
+        except Exception:
+            return self._general_conversation_fallback()
+
+    def _general_conversation_answer(self, response):
+        final_answer = {
+            "message": response,
+            "action_tool": "General_Conversation",
+            "output": "Conversation response"
+        }
+        
+        return f"Final Answer: {json.dumps(final_answer)}"
+
+    def _general_conversation_fallback(self):
+        default_response = "I'm here to help with your HR and talent acquisition needs. How can I assist you today?"
+        
+        final_answer = {
+            "output": "Conversation response",
+            "action_tool": "General_Conversation",
+            "message": default_response,
+            "error": True
+        }
+        
+        return f"Final Answer: {json.dumps(final_answer)}"
         
     def handle_parsing_errors(self, error):
             """Handle parsing errors by treating them as conversational responses"""
@@ -0,0 +1,128 @@
+import os
+import re
+import threading
+
+GENERATE = "Generate_Outreach_Sequence"
+EDIT = "Edit_Sequence"
+BEST_PRACTICES = "Search_Best_Practices"
+GENERAL = "General_Conversation"
+
+# (tool, pattern, weight). Scores of matching rules are summed per tool.
+DEFAULT_RULES = [
+    (EDIT, r"\b(edit|modify|change|update|revise|improve|customi[sz]e|rewrite|shorten|tweak)\b", 0.6),
+    (EDIT, r"\b(step\s*\d|emails?|messages?|subject|follow[- ]?up)\b", 0.2),
+    (EDIT, r"\bsequence[ _]?(id|ID)[: ]*\d+", 0.3),
+    (EDIT, r"\b((more|less) (casual|formal|friendly|concise|personal|professional)|shorter|longer|punchier|warmer)\b", 0.45),
+    (EDIT, r"\b(the|this|that|my|current|existing) (sequence|outreach|emails?|messages?)\b|\b(make|keep) (it|them)\b", 0.3),
+    (EDIT, r"\b(new|another) version\b", 0.3),
+    (GENERATE, r"\b(generate|create|draft|write|build)\b", 0.45),
+    (GENERATE, r"\b(outreach|sequence|campaign|cadence)\b", 0.3),
+    (GENERATE, r"\b(engineers?|developers?|designers?|managers?|scientists?|roles?|hiring|recruit)\b", 0.1),
+    (BEST_PRACTICES, r"\b(best practices?|tips?|advice|recommend(ation)?s?|how (do|should|can) i|what works)\b", 0.6),
+    (BEST_PRACTICES, r"\b(response rates?|open rates?|benchmarks?|strategy|strategies)\b", 0.3),
+    (BEST_PRACTICES, r"\b(reach(ing)? out|talent outreach|candidates?)\b", 0.2),
+    (GENERAL, r"^\W*(hi|hello|hey|thanks|thank you|good (morning|afternoon|evening)|bye|ok(ay)?|cool)\b[\W\w]{0,20}$", 0.9),
+]
+
+# tool -> tools whose rules veto a fast path to it. Generating when the user
+# meant an edit silently creates a new v1 sequence, so any hint of an edit
+# sends the request to the agent instead.
+DEFAULT_VETOES = {
+    GENERATE: (EDIT,),
+}
+
+def load_classifier(path):
+    """
+    Load a pickled scikit-learn style text classifier (predict_proba + classes_)
+    trained on tool names, and wrap it as a text -> (tool, confidence) callable
+    """
+    import pickle
+    with open(path, 'rb') as f:
+        model = pickle.load(f)
+
+    def classify(text):
+        probabilities = model.predict_proba([text])[0]
+        best = max(range(len(probabilities)), key=lambda i: probabilities[i])
+        return model.classes_[best], float(probabilities[best])
+
+    return classify
+
+class IntentRouter:
+    """
+    Rule-based pre-router that picks a tool without an LLM round trip
+
+    Each rule adds its weight to a tool's score; the best tool wins when its
+    score reaches the threshold and beats the runner-up by `margin`. An
+    optional local classifier (callable text -> (tool, confidence)) is
+    consulted when the rules are not confident. A tool is never picked when
+    a rule of one of its vetoing tools matched. Anything else returns None
+    and should fall through to the ReAct agent.
+    """
+    def __init__(self, rules=None, threshold=None, margin=0.2, classifier=None, vetoes=None):
+        self.rules = [(tool, re.compile(pattern, re.IGNORECASE), weight) for tool, pattern, weight in (rules or DEFAULT_RULES)]
+        self.vetoes = vetoes if vetoes is not None else DEFAULT_VETOES
+        self.threshold = threshold if threshold is not None else float(os.getenv('INTENT_ROUTER_THRESHOLD', 0.75))
+        self.margin = margin
+        if classifier is None and os.getenv('INTENT_CLASSIFIER_PATH'):
+            classifier = load_classifier(os.getenv('INTENT_CLASSIFIER_PATH'))
+        self.classifier = classifier
+        self.enabled = os.getenv('INTENT_ROUTER_ENABLED', 'True') == 'True'
+        self._lock = threading.Lock()
+        self.counters = {"fast_path": 0, "classifier": 0, "fallthrough": 0}
+        self.tool_counters = {}
+
+    def score(self, text):
+        scores = {}
+        for tool, pattern, weight in self.rules:
+            if pattern.search(text):
+                scores[tool] = scores.get(tool, 0.0) + weight
+        return scores
+
+    def _vetoed(self, tool, scores):
+        return any(other in scores for other in self.vetoes.get(tool, ()))
+
+    def _count(self, counter, tool=None):
+        with self._lock:
+            self.counters[counter] += 1
+            if tool:
+                self.tool_counters[tool] = self.tool_counters.get(tool, 0) + 1
+
+    def route(self, text):
+        """Return (tool_name, confidence) for confident cases, otherwise None"""
+        if not self.enabled or not text:
+            self._count("fallthrough")
+            return None
+
+        scores = self.score(text)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if ranked:
+            best_tool, best_score = ranked[0]
+            runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+            confidence = round(min(best_score, 1.0), 3)
+            if (confidence >= self.threshold and best_score - runner_up >= self.margin
+                    and not self._vetoed(best_tool, scores)):
+                self._count("fast_path", best_tool)
+                return best_tool, confidence
+
+        if self.classifier is not None:
+            try:
+                tool, confidence = self.classifier(text)
+                if tool and confidence >= self.threshold and not self._vetoed(tool, scores):
+                    self._count("classifier", tool)
+                    return tool, confidence
+            except Exception as e:
+                print(f"Intent classifier failed: {str(e)}")
+
+        self._count("fallthrough")
+        return None
+
+    def stats(self):
+        with self._lock:
+            total = sum(self.counters.values())
+            routed = self.counters["fast_path"] + self.counters["classifier"]
+            return {
+                **self.counters,
+                "by_tool": dict(self.tool_counters),
+                "hit_rate": routed / total if total else 0.0,
+                "threshold": self.threshold,
+            }
@@ -0,0 +1,210 @@
+import os
+import json
+import random
+import threading
+from models.database import db_cursor
+
+class JobLimitReached(Exception):
+    """The owner already has user_limit jobs queued or running"""
+    pass
+
+class JobQueue:
+    """
+    Postgres-backed background job queue with a bounded pool of worker threads
+
+    Jobs are rows in the jobs table, so queued work survives restarts and can
+    be picked up by any process running workers. Workers claim jobs with
+    FOR UPDATE SKIP LOCKED; jobs left 'running' by a crashed process are put
+    back in the queue once they are older than stale_after seconds. A failed
+    attempt is retried after an exponential backoff (retry_backoff seconds,
+    doubling per attempt up to retry_backoff_max), so an outage is not
+    hammered back to back. Each owner (user) may have at most user_limit
+    jobs queued or running.
+    """
+    def __init__(self, workers=None, poll_interval=None, max_attempts=None, stale_after=None, user_limit=None,
+                 retry_backoff=None, retry_backoff_max=None):
+        self.workers = workers if workers is not None else int(os.getenv('JOB_WORKERS', 2))
+        self.poll_interval = poll_interval if poll_interval is not None else float(os.getenv('JOB_POLL_INTERVAL', 2))
+        self.max_attempts = max_attempts if max_attempts is not None else int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+        self.stale_after = stale_after if stale_after is not None else float(os.getenv('JOB_STALE_AFTER', 900))
+        self.user_limit = user_limit if user_limit is not None else int(os.getenv('JOB_USER_MAX_ACTIVE', 10))
+        self.retry_backoff = retry_backoff if retry_backoff is not None else float(os.getenv('JOB_RETRY_BACKOFF', 5))
+        self.retry_backoff_max = retry_backoff_max if retry_backoff_max is not None else float(os.getenv('JOB_RETRY_BACKOFF_MAX', 300))
+        self.handlers = {}
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def register(self, kind, handler):
+        """handler(payload) runs the job and returns a JSON-serializable result"""
+        self.handlers[kind] = handler
+
+    def enqueue(self, kind, payload, owner=None):
+        """Queue a job; raises JobLimitReached when `owner` already has user_limit active jobs"""
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for job kind '{kind}'")
+        with db_cursor(commit=True) as cur:
+            if owner is not None:
+                # Serializes enqueues of one owner so the count below cannot race
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (owner,))
+                cur.execute(
+                    "SELECT COUNT(*) AS active FROM jobs WHERE owner = %s AND status IN ('queued', 'running')",
+                    (owner,)
+                )
+                if cur.fetchone()['active'] >= self.user_limit:
+                    raise JobLimitReached(f"At most {self.user_limit} queued or running jobs per user")
+            cur.execute(
+                "INSERT INTO jobs (kind, payload, owner) VALUES (%s, %s, %s) RETURNING id",
+                (kind, json.dumps(payload), owner)
+            )
+            job_id = cur.fetchone()['id']
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        with db_cursor() as cur:
+            cur.execute(
+                "SELECT id, kind, status, result, error, attempts, run_after, created_at, started_at, finished_at FROM jobs WHERE id = %s",
+                (job_id,)
+            )
+            return cur.fetchone()
+
+    def _claim(self):
+        with db_cursor(commit=True) as cur:
+            cur.execute(
+                """
+                UPDATE jobs SET status = 'running', started_at = CURRENT_TIMESTAMP, attempts = attempts + 1
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE status = 'queued' AND run_after <= CURRENT_TIMESTAMP AND kind = ANY(%s)
+                    ORDER BY id
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING id, kind, payload, attempts
+                """,
+                (list(self.handlers),)
+            )
+            return cur.fetchone()
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with db_cursor(commit=True) as cur:
+            cur.execute(
+                "UPDATE jobs SET status = %s, result = %s, error = %s, finished_at = CURRENT_TIMESTAMP WHERE id = %s",
+                (status, json.dumps(result) if result is not None else None, error, job_id)
+            )
+
+    def backoff(self, attempts):
+        """Seconds to wait before retrying a job that failed its attempts-th attempt (with jitter)"""
+        delay = min(self.retry_backoff * 2 ** (attempts - 1), self.retry_backoff_max)
+        return delay * random.uniform(0.8, 1.2)
+
+    def _retry(self, job_id, error, delay):
+        with db_cursor(commit=True) as cur:
+            cur.execute(
+                """
+                UPDATE jobs SET status = 'queued', error = %s, finished_at = CURRENT_TIMESTAMP,
+                    run_after = CURRENT_TIMESTAMP + %s * INTERVAL '1 second'
+                WHERE id = %s
+                """,
+                (error, delay, job_id)
+            )
+
+    def requeue_stale(self):
+        """Put jobs abandoned by a crashed or restarted worker back in the queue"""
+        with db_cursor(commit=True) as cur:
+            cur.execute(
+                """
+                UPDATE jobs SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+                    error = 'Worker stopped before the job finished', run_after = CURRENT_TIMESTAMP
+                WHERE status = 'running' AND started_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+                """,
+                (self.max_attempts, self.stale_after)
+            )
+            return cur.rowcount
+
+    def run_job(self, job):
+        handler = self.handlers[job['kind']]
+        try:
+            result = handler(job['payload'])
+        except Exception as e:
+            print(f"Job {job['id']} ({job['kind']}) failed: {str(e)}")
+            if job['attempts'] < self.max_attempts:
+                self._retry(job['id'], str(e), self.backoff(job['attempts']))
+            else:
+                self._finish(job['id'], 'failed', error=str(e))
+            return
+
+        if isinstance(result, dict) and "error" in result:
+            # Handled failures such as a missing campaign are not retried
+            self._finish(job['id'], 'failed', result=result, error=str(result["error"]))
+        else:
+            self._finish(job['id'], 'succeeded', result=result)
+
+    def run_once(self):
+        """Claim and run a single job; returns False if the queue was empty"""
+        job = self._claim()
+        if not job:
+            return False
+        self.run_job(job)
+        return True
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception as e:
+                print(f"Job worker error: {str(e)}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _reaper_loop(self):
+        while not self._stopping.wait(max(self.stale_after / 4, self.poll_interval)):
+            try:
+                self.requeue_stale()
+            except Exception as e:
+                print(f"Job reaper error: {str(e)}")
+
+    def start(self):
+        """Start the worker threads (idempotent)"""
+        with self._lock:
+            if self._threads or self.workers <= 0:
+                return
+            try:
+                self.requeue_stale()
+            except Exception as e:
+                print(f"Could not requeue stale jobs: {str(e)}")
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            reaper = threading.Thread(target=self._reaper_loop, name="job-reaper", daemon=True)
+            reaper.start()
+            self._threads.append(reaper)
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def stats(self):
+        with db_cursor() as cur:
+            cur.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status")
+            counts = {row['status']: row['count'] for row in cur.fetchall()}
+        return {"workers": self.workers, "jobs": counts}
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """Process-wide job queue"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue()
+    return _queue
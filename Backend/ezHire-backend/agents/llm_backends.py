@@ -0,0 +1,66 @@
+import os
+import threading
+
+_callbacks = None
+_callbacks_lock = threading.Lock()
+
+def llm_callbacks():
+    """Shared callback handlers attached to every LLM (timing spans, tokens, cost)"""
+    global _callbacks
+    if _callbacks is None:
+        with _callbacks_lock:
+            if _callbacks is None:
+                from agents.llm_callbacks import TracingCallbackHandler
+                _callbacks = [TracingCallbackHandler()]
+    return _callbacks
+
+def use_fake_llm():
+    return os.getenv('LLM_BACKEND', 'openai') == 'fake'
+
+def chat_llm(model="gpt-4o", temperature=0.2):
+    """ChatOpenAI, or the offline fake when LLM_BACKEND=fake"""
+    if use_fake_llm():
+        from agents.fake_llm import FakeChatLLM, fake_latency
+        return FakeChatLLM(latency=fake_latency(), callbacks=llm_callbacks())
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model=model, temperature=temperature, callbacks=llm_callbacks())
+
+def structured_llm(schema, name, model=None, temperature=0.3, max_tokens=2048):
+    """
+    ChatOpenAI whose replies are constrained to a JSON schema (structured outputs)
+
+    The reply content is the JSON text. With LLM_BACKEND=fake this is the
+    offline fake chat model, which answers in the legacy step1..stepN shape.
+    """
+    if use_fake_llm():
+        from agents.fake_llm import FakeChatLLM, fake_latency
+        return FakeChatLLM(latency=fake_latency(), callbacks=llm_callbacks())
+    from langchain_openai import ChatOpenAI
+    from models.outreach_sequence import response_format
+    return ChatOpenAI(
+        model=model or os.getenv('SEQUENCE_MODEL', 'gpt-4o-mini'),
+        temperature=temperature,
+        max_tokens=max_tokens,
+        callbacks=llm_callbacks(),
+        model_kwargs={"response_format": response_format(name, schema)}
+    )
+
+def use_structured_output():
+    """Opt-in, since it moves sequence generation from the legacy completion model to SEQUENCE_MODEL"""
+    return os.getenv('SEQUENCE_STRUCTURED_OUTPUT', 'False') == 'True'
+
+def completion_llm(temperature=0.3, max_tokens=2048):
+    """Legacy OpenAI completion LLM, or the offline fake when LLM_BACKEND=fake"""
+    if use_fake_llm():
+        from agents.fake_llm import FakeCompletionLLM, fake_latency
+        return FakeCompletionLLM(latency=fake_latency(), callbacks=llm_callbacks())
+    from langchain.llms import OpenAI
+    return OpenAI(temperature=temperature, max_tokens=max_tokens, callbacks=llm_callbacks())
+
+def embeddings():
+    """OpenAIEmbeddings, or local hashing embeddings when LLM_BACKEND=fake or EMBEDDING_BACKEND=hashing"""
+    if use_fake_llm() or os.getenv('EMBEDDING_BACKEND', 'openai') == 'hashing':
+        from agents.fake_llm import HashEmbeddings
+        return HashEmbeddings(dimension=int(os.getenv('EMBEDDING_DIMENSION', 256)))
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(model=os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small'))
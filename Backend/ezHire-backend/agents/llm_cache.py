@@ -0,0 +1,198 @@
+import os
+import time
+import asyncio
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from models.database import db_cursor
+
+def llm_text(response):
+    """ChatOpenAI returns a message object, the legacy OpenAI LLM a plain string"""
+    return response.content if hasattr(response, "content") else response
+
+def _llm_params(llm):
+    return {
+        "class": type(llm).__name__,
+        "model": getattr(llm, "model_name", None) or getattr(llm, "model", None),
+        "temperature": getattr(llm, "temperature", None),
+        "max_tokens": getattr(llm, "max_tokens", None),
+    }
+
+class LLMCache:
+    """
+    Two-tier cache of LLM responses keyed by model, parameters and normalized prompt
+
+    The first tier is an in-process LRU; the second is the llm_cache table so
+    entries survive restarts and are shared between workers. Both tiers expire
+    entries after `ttl` seconds and are capped in size.
+    """
+    def __init__(self, max_entries=None, ttl=None, persistent=None, max_rows=None):
+        self.enabled = os.getenv('LLM_CACHE_ENABLED', 'True') == 'True'
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv('LLM_CACHE_MAX_ENTRIES', 1000))
+        self.ttl = ttl if ttl is not None else float(os.getenv('LLM_CACHE_TTL', 86400))
+        self.persistent = persistent if persistent is not None else os.getenv('LLM_CACHE_PERSISTENT', 'True') == 'True'
+        self.max_rows = max_rows if max_rows is not None else int(os.getenv('LLM_CACHE_MAX_ROWS', 10000))
+        self._entries = OrderedDict()  # key -> (text, expires_at)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.stats_counters = {"memory_hits": 0, "db_hits": 0, "misses": 0, "bypassed": 0, "errors": 0}
+
+    def make_key(self, llm, prompt):
+        normalized = " ".join(prompt.split())
+        payload = json.dumps({"params": _llm_params(llm), "prompt": normalized}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _count(self, counter):
+        with self._lock:
+            self.stats_counters[counter] += 1
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                text, expires_at = entry
+                if expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self.stats_counters["memory_hits"] += 1
+                    return text
+                del self._entries[key]
+
+        if self.persistent:
+            try:
+                with db_cursor(commit=True) as cur:
+                    cur.execute(
+                        """
+                        UPDATE llm_cache SET hits = hits + 1, last_hit_at = CURRENT_TIMESTAMP
+                        WHERE key = %s AND expires_at > CURRENT_TIMESTAMP
+                        RETURNING response, EXTRACT(EPOCH FROM expires_at) AS expires_at
+                        """,
+                        (key,)
+                    )
+                    row = cur.fetchone()
+                if row:
+                    self._remember(key, row['response'], float(row['expires_at']))
+                    self._count("db_hits")
+                    return row['response']
+            except Exception as e:
+                print(f"LLM cache read failed: {str(e)}")
+                self._count("errors")
+
+        self._count("misses")
+        return None
+
+    def _remember(self, key, text, expires_at):
+        with self._lock:
+            self._entries[key] = (text, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def set(self, key, text, model=None):
+        self._remember(key, text, time.time() + self.ttl)
+        if not self.persistent:
+            return
+        try:
+            with db_cursor(commit=True) as cur:
+                cur.execute(
+                    """
+                    INSERT INTO llm_cache (key, model, response, expires_at)
+                    VALUES (%s, %s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 second')
+                    ON CONFLICT (key) DO UPDATE
+                    SET response = EXCLUDED.response, expires_at = EXCLUDED.expires_at, created_at = CURRENT_TIMESTAMP
+                    """,
+                    (key, model, text, self.ttl)
+                )
+            with self._lock:
+                self._writes += 1
+                prune = self._writes % 100 == 0
+            if prune:
+                self.prune()
+        except Exception as e:
+            print(f"LLM cache write failed: {str(e)}")
+            self._count("errors")
+
+    def prune(self):
+        """Drop expired rows and the least recently used rows above max_rows"""
+        with db_cursor(commit=True) as cur:
+            cur.execute("DELETE FROM llm_cache WHERE expires_at <= CURRENT_TIMESTAMP")
+            cur.execute(
+                """
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY last_hit_at DESC NULLS LAST, created_at DESC OFFSET %s
+                )
+                """,
+                (self.max_rows,)
+            )
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.persistent:
+            try:
+                with db_cursor(commit=True) as cur:
+                    cur.execute("DELETE FROM llm_cache WHERE key = %s", (key,))
+            except Exception as e:
+                print(f"LLM cache invalidate failed: {str(e)}")
+
+    def invoke(self, llm, prompt, use_cache=True, validate=None):
+        """
+        Return the response text for prompt, from cache when possible
+
+        use_cache=False bypasses both tiers for this call. When validate is
+        given, only responses for which validate(text) is true are stored.
+        """
+        if not (self.enabled and use_cache):
+            self._count("bypassed")
+            return llm_text(llm.invoke(prompt))
+
+        key = self.make_key(llm, prompt)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        text = llm_text(llm.invoke(prompt))
+        if validate is None or validate(text):
+            self.set(key, text, model=_llm_params(llm)["model"])
+        return text
+
+    async def ainvoke(self, llm, prompt, use_cache=True, validate=None):
+        """Async variant of invoke(); the model call uses llm.ainvoke"""
+        if not (self.enabled and use_cache):
+            self._count("bypassed")
+            return llm_text(await llm.ainvoke(prompt))
+
+        key = self.make_key(llm, prompt)
+        # Cache tiers are fast; the database tier runs off the event loop
+        cached = await asyncio.to_thread(self.get, key)
+        if cached is not None:
+            return cached
+
+        text = llm_text(await llm.ainvoke(prompt))
+        if validate is None or validate(text):
+            await asyncio.to_thread(self.set, key, text, _llm_params(llm)["model"])
+        return text
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.stats_counters)
+            size = len(self._entries)
+        hits = counters["memory_hits"] + counters["db_hits"]
+        lookups = hits + counters["misses"]
+        return {
+            **counters,
+            "memory_entries": size,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_llm_cache():
+    """Process-wide LLM response cache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCache()
+    return _cache
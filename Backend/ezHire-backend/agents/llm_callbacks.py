@@ -0,0 +1,83 @@
+import time
+import threading
+from langchain_core.callbacks import BaseCallbackHandler
+from agents.chat_history import count_tokens
+from agents.debug_trace import get_debug_trace
+from agents.tracing import current_trace, current_tool, record_span, record_llm_usage
+
+def _model_name(serialized, kwargs):
+    params = kwargs.get("invocation_params") or {}
+    return (
+        params.get("model_name") or params.get("model")
+        or (serialized or {}).get("kwargs", {}).get("model_name")
+        or (serialized or {}).get("kwargs", {}).get("model")
+        or params.get("_type") or "unknown"
+    )
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    Records every LLM call as an "llm" span with its token usage and cost,
+    and its prompt and response in the debug trace buffer
+
+    The request trace and tool are captured when the call starts, since async
+    callbacks may finish on another thread. Token counts come from the
+    provider's usage report, or are estimated when it has none (streaming,
+    fake backend).
+    """
+    def __init__(self):
+        self._runs = {}  # run_id -> (started, model, trace, tool, prompt text)
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, model, prompt_text):
+        with self._lock:
+            self._runs[run_id] = (time.perf_counter(), model, current_trace(), current_tool(), prompt_text)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, _model_name(serialized, kwargs), "\n".join(prompts))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        text = "\n".join(str(message.content) for batch in messages for message in batch)
+        self._start(run_id, _model_name(serialized, kwargs), text)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        started, model, trace, tool, prompt_text = run
+        llm_output = response.llm_output or {}
+        model = llm_output.get("model_name") or model
+        usage = llm_output.get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens")
+        completion_tokens = usage.get("completion_tokens")
+        response_text = "\n".join(g.text for batch in response.generations for g in batch)
+        if prompt_tokens is None:
+            prompt_tokens = count_tokens(prompt_text)
+        if completion_tokens is None:
+            completion_tokens = count_tokens(response_text)
+
+        seconds = time.perf_counter() - started
+        record_span("llm", model, seconds, tool=tool, trace=trace)
+        cost = record_llm_usage(model, prompt_tokens, completion_tokens, tool=tool)
+        get_debug_trace().record("llm", {
+            "model": model,
+            "prompt": prompt_text,
+            "response": response_text,
+            "seconds": seconds,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost_usd": cost,
+        }, request_id=trace.request_id if trace else None, tool=tool)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        started, model, trace, tool, prompt_text = run
+        record_span("llm", model, time.perf_counter() - started, error=True, tool=tool, trace=trace)
+        get_debug_trace().record("llm_error", {
+            "model": model,
+            "prompt": prompt_text,
+            "error": str(error),
+        }, request_id=trace.request_id if trace else None, tool=tool)
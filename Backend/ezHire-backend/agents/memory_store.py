@@ -0,0 +1,130 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+class ConversationMemoryStore:
+    """
+    Bounded LRU/TTL cache of per-conversation agent memory
+
+    Entries are keyed by conversation_id. On a miss the loader is called to
+    rebuild the memory from the database; after that, turns are appended
+    incrementally so the history is never replayed on the hot path.
+
+    Other worker processes may add turns to the same conversation, so a hit
+    is checked against the stored message count (`counter`, a one-column
+    read) and reloaded when the cached history is behind. A turn that does
+    not directly follow the cached history drops the entry instead of being
+    appended.
+    """
+    def __init__(self, loader, counter=None, max_size=None, ttl=None):
+        self.loader = loader
+        self.counter = counter
+        self.max_size = max_size if max_size is not None else int(os.getenv('AGENT_MEMORY_CACHE_SIZE', 500))
+        self.ttl = ttl if ttl is not None else float(os.getenv('AGENT_MEMORY_TTL', 1800))
+        self._entries = OrderedDict()  # conversation_id -> (memory, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def _get_cached(self, conversation_id):
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            return None
+        memory, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[conversation_id]
+            return None
+        self._entries.move_to_end(conversation_id)
+        self._entries[conversation_id] = (memory, time.monotonic() + self.ttl)
+        return memory
+
+    def _put(self, conversation_id, memory):
+        self._entries[conversation_id] = (memory, time.monotonic() + self.ttl)
+        self._entries.move_to_end(conversation_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _lookup(self, conversation_id):
+        with self._lock:
+            memory = self._get_cached(conversation_id)
+            if memory is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return memory
+
+    def _store_loaded(self, conversation_id, memory):
+        with self._lock:
+            # Another request may have loaded it concurrently; keep the first one
+            cached = self._get_cached(conversation_id)
+            if cached is not None:
+                return cached
+            self._put(conversation_id, memory)
+        return memory
+
+    def _drop_stale(self, conversation_id, memory):
+        with self._lock:
+            self.stale += 1
+            entry = self._entries.get(conversation_id)
+            if entry is not None and entry[0] is memory:
+                del self._entries[conversation_id]
+
+    def get(self, conversation_id):
+        """Return the memory for a conversation, loading it on a cache miss or when it is stale"""
+        memory = self._lookup(conversation_id)
+        if memory is not None:
+            if self.counter is None or self.counter(conversation_id) == memory.last_seq:
+                return memory
+            self._drop_stale(conversation_id, memory)
+
+        # Load outside the lock so a slow query does not block other conversations
+        memory = self.loader(conversation_id)
+        if memory is None:
+            return None
+        return self._store_loaded(conversation_id, memory)
+
+    async def aget(self, conversation_id, loader, counter=None):
+        """Async variant of get() using an async loader and message counter"""
+        memory = self._lookup(conversation_id)
+        if memory is not None:
+            if counter is None or await counter(conversation_id) == memory.last_seq:
+                return memory
+            self._drop_stale(conversation_id, memory)
+
+        memory = await loader(conversation_id)
+        if memory is None:
+            return None
+        return self._store_loaded(conversation_id, memory)
+
+    def append_turn(self, conversation_id, user_message, ai_message, first_seq):
+        """Append a completed turn to a cached conversation and return its memory
+
+        Uncached conversations are left alone: the next get() loads them from
+        the database, which already contains the stored turn. So are cached
+        ones that missed turns stored elsewhere (first_seq is not the next seq).
+        """
+        with self._lock:
+            memory = self._get_cached(conversation_id)
+            if memory is not None and first_seq != memory.last_seq + 1:
+                self.stale += 1
+                del self._entries[conversation_id]
+                return None
+        if memory is not None:
+            memory.add_turn(user_message, ai_message, first_seq)
+        return memory
+
+    def invalidate(self, conversation_id):
+        with self._lock:
+            self._entries.pop(conversation_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+            }
@@ -0,0 +1,192 @@
+"""
+Tolerant parsing of LLM output
+
+Models wrap JSON in code fences, add prose before or after it, use single
+quotes or leave trailing commas. extract_json() recovers the object in all of
+those cases without another model call; validate_sequence() checks the
+step1..stepN shape so callers can ask for one targeted repair when it fails.
+"""
+import re
+import ast
+import json
+from agents.tracing import span
+from models.outreach_sequence import STEP_KEY, normalize_sequence, canonical_sequence, canonical_steps
+
+FINAL_ANSWER = "Final Answer:"
+REQUIRED_STEP_FIELDS = ("channel", "message_content")
+
+_FENCE = re.compile(r"```(?:json|JSON)?\s*\n?(.*?)```", re.DOTALL)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+class OutputParseError(ValueError):
+    """Raised when no JSON object could be recovered from model output"""
+    pass
+
+def strip_fences(text):
+    """Contents of the first ``` fenced block, or the text unchanged"""
+    match = _FENCE.search(text)
+    return match.group(1).strip() if match else text
+
+def json_objects(text):
+    """
+    Yield each balanced top-level {...} substring, left to right
+
+    Braces inside string literals (single or double quoted) are ignored, so
+    prose around the object and braces in message text do not confuse it.
+    """
+    depth = 0
+    start = None
+    quote = None
+    escaped = False
+    for i, char in enumerate(text):
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                quote = None
+        elif char in "\"'" and depth:
+            quote = char
+        elif char == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif char == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                yield text[start:i + 1]
+
+def _loads(candidate):
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        pass
+    candidate = _TRAILING_COMMA.sub(r"\1", candidate)
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        pass
+    # Python-style dicts: single quotes, True/False/None
+    try:
+        value = ast.literal_eval(candidate)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+    return value if isinstance(value, dict) else None
+
+def extract_json(text):
+    """The JSON object in model output, tolerating fences, prose, single quotes and trailing commas"""
+    if not isinstance(text, str):
+        raise OutputParseError("Model output is not text")
+    with span("parse", "json"):
+        stripped = text.strip()
+        # Fast path: the whole output is the object
+        if stripped.startswith("{"):
+            try:
+                value = json.loads(stripped)
+                if isinstance(value, dict):
+                    return value
+            except json.JSONDecodeError:
+                pass
+        for source in dict.fromkeys((strip_fences(stripped), stripped)):
+            for candidate in json_objects(source):
+                value = _loads(candidate)
+                if isinstance(value, dict):
+                    return value
+    raise OutputParseError("No JSON object found in model output")
+
+def final_answer(text, last=True):
+    """
+    Text after the "Final Answer:" marker, or None when there is none
+
+    ReAct output is split at the last marker; tool outputs, which start with
+    the marker and may quote it in their payload, use last=False.
+    """
+    if not isinstance(text, str) or FINAL_ANSWER not in text:
+        return None
+    if last:
+        return text.rsplit(FINAL_ANSWER, 1)[1].strip()
+    return text.split(FINAL_ANSWER, 1)[1].strip()
+
+def parse_final_answer(text, last=True):
+    """A "Final Answer: ..." as a dict when it holds a JSON object, otherwise as a string (None without the marker)"""
+    answer = final_answer(text, last)
+    if answer is None or "{" not in answer:
+        return answer
+    try:
+        return extract_json(answer)
+    except OutputParseError:
+        return answer
+
+def validate_sequence(sequence, steps=None, fields=True):
+    """
+    Problems with a sequence as a list of strings (empty when it is valid)
+
+    A sequence is a dict of step1..stepN, numbered from 1 without gaps, each
+    with at least a channel and message_content. With steps, only those step
+    keys are required. fields=False checks only the shape (object, numbering,
+    steps being objects).
+    """
+    if not isinstance(sequence, dict):
+        return ["The sequence must be a JSON object"]
+    problems = []
+    keys = [key for key in sequence if STEP_KEY.match(str(key))]
+    if steps is None:
+        if not keys:
+            return ["The sequence has no step1..stepN keys"]
+        expected = [f"step{n}" for n in range(1, len(keys) + 1)]
+        if sorted(keys, key=lambda k: int(k[4:])) != expected:
+            problems.append(f"Steps must be numbered {', '.join(expected)}")
+        steps = keys
+    for step in steps:
+        value = sequence.get(step)
+        if not isinstance(value, dict):
+            problems.append(f"{step} must be an object")
+            continue
+        if not fields:
+            continue
+        for field in REQUIRED_STEP_FIELDS:
+            if not isinstance(value.get(field), str) or not value[field].strip():
+                problems.append(f"{step} is missing {field}")
+    return problems
+
+def checked_sequence(value, steps=None):
+    """
+    (sequence, problems) for a normalized sequence, in canonical form
+
+    The shape is checked before canonicalizing, which would otherwise
+    renumber gaps and drop steps that are not objects; the step fields are
+    checked after it, so drifted field names are accepted.
+    """
+    problems = validate_sequence(value, steps, fields=False)
+    sequence = canonical_steps(value, steps) if steps else canonical_sequence(value)
+    problems += [problem for problem in validate_sequence(sequence, steps) if problem not in problems]
+    return sequence, problems
+
+def parse_sequence(text, steps=None):
+    """
+    (sequence, problems) from model output, in canonical form
+
+    sequence is None when no JSON object was found. With steps (a partial
+    edit), the result holds only those step keys.
+    """
+    try:
+        value = normalize_sequence(extract_json(text), keys=steps)
+    except OutputParseError as e:
+        return None, [str(e)]
+    return checked_sequence(value, steps)
+
+def repair_prompt(text, problems, expected):
+    """Prompt for one repair call: fix only the structure of a previous answer"""
+    problems = "\n        ".join(f"- {problem}" for problem in problems)
+    return f"""
+        Your previous answer could not be used. Problems:
+        {problems}
+
+        Expected: {expected}
+
+        Previous answer:
+        {text}
+
+        Return only the corrected JSON object. Keep all wording unchanged; fix only the structure.
+        """
@@ -1,23 +1,62 @@
 import os
-import json
-from langchain.llms import OpenAI
+import re
+from agents.llm_backends import completion_llm, structured_llm, use_structured_output
+from agents.llm_cache import get_llm_cache, llm_text
+from agents.tracing import metrics
+from agents.debug_trace import debug_trace
+from agents.output_parsing import OutputParseError, extract_json, checked_sequence, parse_sequence, repair_prompt
+from models.outreach_sequence import SEQUENCE_SCHEMA, REQUIREMENTS_SCHEMA, canonical_json, canonical_sequence, normalize_sequence
+
+_STEP_KEY = re.compile(r'"(step\d+)"\s*:')
+# Each step of a structured ("steps" array) reply starts with its channel
+_STEP_START = re.compile(r'"channel"\s*:')
+_STEP_NUMBER = re.compile(r"\bstep\s*#?\s*(\d+)", re.IGNORECASE)
+_STEP_ORDINAL = re.compile(
+    r"\b(first|initial|second|third|fourth|fifth|last|final)\s+(?:step|email|message|follow[- ]?up|touch)",
+    re.IGNORECASE
+)
+_WHOLE_SEQUENCE = re.compile(r"\b(all|every|each|whole|entire|overall|add|remove|delete|reorder)\b", re.IGNORECASE)
+_ORDINALS = {"first": 1, "initial": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5}
+
+STEP_SHAPE = '{"channel": ..., "subject_line": ..., "timing": ..., "message_content": ...}'
+SEQUENCE_SHAPE = '{"step1": ' + STEP_SHAPE + ', "step2": {...}, ...}'
+REQUIREMENTS_SHAPE = '{"campaign": {"target_role": ..., "industry": ..., "company_values": ..., "unique_selling_points": ...}, "sequence": ' + SEQUENCE_SHAPE + '}'
+
+output_repairs = metrics.counter("ezhire_output_repairs_total", "Repair calls for unusable model output", ("shape", "outcome"))
+
+def _is_valid_sequence(text):
+    return not parse_sequence(text)[1]
+
+def _requirements_result(text):
+    """((campaign_info, sequence), problems) from a generate_from_requirements response"""
+    try:
+        result = extract_json(text)
+    except OutputParseError as e:
+        return ({}, None), [str(e)]
+    campaign_info = result.get("campaign") if isinstance(result.get("campaign"), dict) else {}
+    # normalize_sequence unwraps "sequence", or takes steps the model put at the top level
+    sequence, problems = checked_sequence(normalize_sequence({key: value for key, value in result.items() if key != "campaign"}))
+    return (campaign_info, sequence), problems
+
+def _is_valid_requirements(text):
+    return not _requirements_result(text)[1]
 
 class OutreachSequenceGenerator:
     def __init__(self):
-        self.llm = OpenAI(temperature=0.3, max_tokens=2048)
+        self.structured = use_structured_output()
+        if self.structured:
+            # Replies are constrained to the schema, so they always parse
+            self.llm = structured_llm(SEQUENCE_SCHEMA, "outreach_sequence")
+            self.requirements_llm = structured_llm(REQUIREMENTS_SCHEMA, "campaign_sequence")
+        else:
+            self.llm = completion_llm(temperature=0.3, max_tokens=2048)
+            self.requirements_llm = self.llm
+        # Deterministic model for the single structural repair of unusable output
+        self.repair_llm = completion_llm(temperature=0.0, max_tokens=2048)
+        self.repair_enabled = os.getenv('OUTPUT_REPAIR_ENABLED', 'True') == 'True'
     
-    def generate_sequence(self, campaign_info):
-        """
-        Generate a tailored outreach sequence based on campaign information
-        
-        campaign_info: Dict containing campaign details like:
-        - target_role
-        - industry
-        - company_values
-        - unique_selling_points
-        - etc.
-        """
-        prompt = f"""
+    def _generation_prompt(self, campaign_info):
+        return f"""
         Create a personalized talent outreach sequence for the following campaign:
         
         Target Role: {campaign_info.get('target_role', 'Software Engineer')}
@@ -30,11 +69,11 @@ class OutreachSequenceGenerator:
         2. Follow-up message (LinkedIn or email)
         3. Final follow-up
         
-        The key for the JSON object should be the step1, step2, etc.
+        {self._step_format()}
 
         For each step, include:
         - channel (Email, LinkedIn, etc.)
-        - subject_line line (if email)
+        - subject_line (if email)
         - timing (e.g., "Send 3 days after initial email")
         - message_content
         
@@ -42,58 +81,320 @@ class OutreachSequenceGenerator:
 
         Format the response strictly as a JSON object.
         """
+
+    def _step_format(self):
+        if self.structured:
+            return 'Put the steps in order in the "steps" array.'
+        return "The key for the JSON object should be the step1, step2, etc."
+
+    def generate_sequence(self, campaign_info, use_cache=True):
+        """
+        Generate a tailored outreach sequence based on campaign information
+        
+        campaign_info: Dict containing campaign details like:
+        - target_role
+        - industry
+        - company_values
+        - unique_selling_points
+        - etc.
+        use_cache: Set to False to always call the model
+        """
+        prompt = self._generation_prompt(campaign_info)
         # - Message content with personalization variables like {candidate_name}, {company_name}, etc.
-        response = self.llm.invoke(prompt)
+        response = get_llm_cache().invoke(self.llm, prompt, use_cache=use_cache, validate=_is_valid_sequence)
         
         # print(f"Sequence LLM Response: {response}")
-        # Parse and validate the response
-        try:
-            sequence = json.loads(response)
-            return sequence
-        except json.JSONDecodeError:
-            # If the LLM doesn't return valid JSON, try to fix it
-            # This is a simplified approach
+        sequence = self._parse_sequence(response)
+        self._cache_repaired(self.llm, prompt, response, sequence, use_cache)
+        return sequence
+
+    async def agenerate_sequence(self, campaign_info, use_cache=True):
+        """Async variant of generate_sequence"""
+        prompt = self._generation_prompt(campaign_info)
+        response = await get_llm_cache().ainvoke(self.llm, prompt, use_cache=use_cache, validate=_is_valid_sequence)
+        sequence = await self._aparse_sequence(response)
+        self._cache_repaired(self.llm, prompt, response, sequence, use_cache)
+        return sequence
+
+    def _parse_sequence(self, response, error="Could not generate valid sequence", steps=None):
+        """
+        Parse a sequence from model output, tolerating fences, prose and quoting
+
+        When the output still is not a valid step1..stepN sequence, one repair
+        call asks the model to fix only its structure.
+        """
+        sequence, problems = parse_sequence(response, steps)
+        if problems and self.repair_enabled:
+            repaired = self._repair(response, problems, self._sequence_shape(steps))
+            if repaired is not None:
+                sequence, problems = self._repaired(parse_sequence(repaired, steps), "sequence")
+        return self._sequence_or_error(response, sequence, problems, error)
+
+    async def _aparse_sequence(self, response, error="Could not generate valid sequence", steps=None):
+        """Async variant of _parse_sequence"""
+        sequence, problems = parse_sequence(response, steps)
+        if problems and self.repair_enabled:
+            repaired = await self._arepair(response, problems, self._sequence_shape(steps))
+            if repaired is not None:
+                sequence, problems = self._repaired(parse_sequence(repaired, steps), "sequence")
+        return self._sequence_or_error(response, sequence, problems, error)
+
+    def _sequence_shape(self, steps):
+        if steps:
+            return f"a JSON object with exactly the keys {', '.join(steps)}, each {STEP_SHAPE}"
+        return SEQUENCE_SHAPE
+
+    def _sequence_or_error(self, response, sequence, problems, error):
+        if problems:
             return {
-                "error": "Could not generate valid sequence",
+                "error": error,
+                "problems": problems,
                 "raw_response": response
             }
+        return sequence
+
+    def _repair(self, response, problems, shape):
+        """One structural repair call; returns the new output, or None if the call failed"""
+        debug_trace("repair", problems=problems, raw_response=response)
+        try:
+            return self.repair_llm.invoke(repair_prompt(response, problems, shape))
+        except Exception as e:
+            print(f"Output repair failed: {str(e)}")
+            return None
+
+    async def _arepair(self, response, problems, shape):
+        debug_trace("repair", problems=problems, raw_response=response)
+        try:
+            return await self.repair_llm.ainvoke(repair_prompt(response, problems, shape))
+        except Exception as e:
+            print(f"Output repair failed: {str(e)}")
+            return None
+
+    def _repaired(self, result, shape):
+        value, problems = result
+        output_repairs.inc(shape=shape, outcome="failed" if problems else "repaired")
+        return value, problems
+
+    def _cache_repaired(self, llm, prompt, response, result, use_cache, is_valid=_is_valid_sequence):
+        """Cache a repaired result under the original prompt, so the next request skips generation and repair"""
+        cache = get_llm_cache()
+        if not (cache.enabled and use_cache) or "error" in result or is_valid(response):
+            return
+        cache.set(cache.make_key(llm, prompt), canonical_json(result), model=getattr(llm, "model_name", None))
+
+    def _step_events(self, text, resume, seen_steps):
+        """Step events for markers in text from `resume` on; returns (events, where to resume next time)"""
+        events = []
+        for match in (_STEP_START if self.structured else _STEP_KEY).finditer(text, resume):
+            resume = match.end()
+            step = f"step{len(seen_steps) + 1}" if self.structured else match.group(1)
+            if step not in seen_steps:
+                seen_steps.append(step)
+                events.append({"event": "step", "data": {"step": step}})
+        return events, resume
     
+    def stream_sequence(self, campaign_info, use_cache=True):
+        """
+        Streaming variant of generate_sequence
+
+        Yields {"event": "token"} events with raw text as it arrives from the
+        model, a {"event": "step"} event the first time each stepN key shows
+        up, and finally {"event": "sequence", "data": sequence}.
+        """
+        prompt = self._generation_prompt(campaign_info)
+        cache = get_llm_cache()
+        cache_key = cache.make_key(self.llm, prompt) if (cache.enabled and use_cache) else None
+        response = cache.get(cache_key) if cache_key else None
+
+        seen_steps = []
+        if response is not None:
+            yield {"event": "token", "data": {"text": response}}
+            yield from self._step_events(response, 0, seen_steps)[0]
+        else:
+            response = ""
+            # A marker split across chunks is found once it completes: scanning
+            # resumes after the last complete marker
+            resume = 0
+            for chunk in self.llm.stream(prompt):
+                text = llm_text(chunk)
+                response += text
+                yield {"event": "token", "data": {"text": text}}
+                events, resume = self._step_events(response, resume, seen_steps)
+                yield from events
+            if cache_key and _is_valid_sequence(response):
+                cache.set(cache_key, response, model=getattr(self.llm, "model_name", None))
+
+        sequence = self._parse_sequence(response)
+        self._cache_repaired(self.llm, prompt, response, sequence, use_cache)
+        yield {"event": "sequence", "data": sequence}
+
+    def generate_from_requirements(self, requirements_text, use_cache=True):
+        """
+        Extract campaign details from free text and generate the sequence in one call
+
+        Returns (campaign_info, sequence). campaign_info is empty if the model
+        did not return it, and sequence carries an "error" key like
+        generate_sequence() when the response could not be parsed.
+        """
+        prompt = self._requirements_prompt(requirements_text)
+        response = get_llm_cache().invoke(self.requirements_llm, prompt, use_cache=use_cache, validate=_is_valid_requirements)
+        (campaign_info, sequence), problems = _requirements_result(response)
+        if problems and self.repair_enabled:
+            repaired = self._repair(response, problems, REQUIREMENTS_SHAPE)
+            if repaired is not None:
+                (campaign_info, sequence), problems = self._repaired(_requirements_result(repaired), "requirements")
+        return self._requirements_or_error(prompt, response, campaign_info, sequence, problems, use_cache)
+
+    async def agenerate_from_requirements(self, requirements_text, use_cache=True):
+        """Async variant of generate_from_requirements"""
+        prompt = self._requirements_prompt(requirements_text)
+        response = await get_llm_cache().ainvoke(self.requirements_llm, prompt, use_cache=use_cache, validate=_is_valid_requirements)
+        (campaign_info, sequence), problems = _requirements_result(response)
+        if problems and self.repair_enabled:
+            repaired = await self._arepair(response, problems, REQUIREMENTS_SHAPE)
+            if repaired is not None:
+                (campaign_info, sequence), problems = self._repaired(_requirements_result(repaired), "requirements")
+        return self._requirements_or_error(prompt, response, campaign_info, sequence, problems, use_cache)
+
+    def _requirements_prompt(self, requirements_text):
+        sequence_shape = '{"steps": [{...}, {...}, {...}]}' if self.structured else '{"step1": {...}, "step2": {...}, "step3": {...}}'
+        return f"""
+        Read these campaign requirements from a recruiter and create a personalized talent outreach sequence for them.
+
+        Requirements: {requirements_text}
+
+        First extract the campaign details. Use these defaults for anything not mentioned:
+        - target_role: Software Engineer
+        - industry: Technology
+        - company_values: Innovation, Collaboration, Excellence
+        - unique_selling_points: Remote-first, Competitive salary, Growth opportunities
+
+        The sequence should include:
+        1. Initial outreach email
+        2. Follow-up message (LinkedIn or email)
+        3. Final follow-up
+
+        For each step, include:
+        - channel (Email, LinkedIn, etc.)
+        - subject_line (if email)
+        - timing (e.g., "Send 3 days after initial email")
+        - message_content
+
+        IMPORTANT: Keep messages concise. Each message content should be under 150 words.
+
+        Format the response strictly as a JSON object of this shape:
+        {{"campaign": {{"target_role": "...", "industry": "...", "company_values": "...", "unique_selling_points": "..."}},
+          "sequence": {sequence_shape}}}
+        """
+
+    def _requirements_or_error(self, prompt, response, campaign_info, sequence, problems, use_cache):
+        if problems:
+            return campaign_info or {}, self._sequence_or_error(response, sequence, problems, "Could not generate valid sequence")
+        self._cache_repaired(self.requirements_llm, prompt, response, {"campaign": campaign_info, "sequence": sequence}, use_cache, _is_valid_requirements)
+        return campaign_info, sequence
+
     def edit_sequence(self, sequence, edit_instructions):
         """
         Edit an existing sequence based on user feedback
         
         sequence: Existing sequence JSON
         edit_instructions: Natural language instructions for edits
+
+        When the instructions name specific steps ("make step 2 shorter",
+        "change the final follow-up"), only those steps are sent to the model
+        and merged back; otherwise the whole sequence is edited.
+        """
+        steps = self.affected_steps(sequence, edit_instructions)
+        prompt = self._edit_prompt(sequence, edit_instructions, steps)
+        
+        response = llm_text(self.llm.invoke(prompt))
+        edited = self._parse_sequence(response, error="Could not generate valid edited sequence", steps=steps)
+        return self._merge_edit(sequence, edited, steps)
+
+    async def aedit_sequence(self, sequence, edit_instructions):
+        """Async variant of edit_sequence"""
+        steps = self.affected_steps(sequence, edit_instructions)
+        prompt = self._edit_prompt(sequence, edit_instructions, steps)
+        response = llm_text(await self.llm.ainvoke(prompt))
+        edited = await self._aparse_sequence(response, error="Could not generate valid edited sequence", steps=steps)
+        return self._merge_edit(sequence, edited, steps)
+
+    def affected_steps(self, sequence, edit_instructions):
         """
-        prompt = f"""
+        Step keys the instructions refer to, or None to edit the whole sequence
+
+        Structural edits (adding, removing or reordering steps, "all steps")
+        and references to steps that do not exist need the whole sequence.
+        """
+        # Chat requests carry the campaign context after the user's words
+        edit_instructions = edit_instructions.split("\nCampaign context:")[0]
+        if not isinstance(sequence, dict) or _WHOLE_SEQUENCE.search(edit_instructions):
+            return None
+        step_keys = sorted((key for key in sequence if key.startswith("step") and key[4:].isdigit()), key=lambda k: int(k[4:]))
+        if not step_keys:
+            return None
+
+        numbers = {int(n) for n in _STEP_NUMBER.findall(edit_instructions)}
+        for word in _STEP_ORDINAL.findall(edit_instructions):
+            word = word.lower()
+            numbers.add(int(step_keys[-1][4:]) if word in ("last", "final") else _ORDINALS[word])
+
+        steps = [f"step{n}" for n in sorted(numbers)]
+        if not steps or any(step not in sequence for step in steps):
+            return None
+        return steps
+
+    def _merge_edit(self, sequence, edited, steps):
+        """Put edited steps back into the full sequence (edited was validated for those steps)"""
+        if steps is None or "error" in edited:
+            return edited
+        merged = dict(sequence)
+        merged.update({step: edited[step] for step in steps})
+        return canonical_sequence(merged)
+
+    def _edit_prompt(self, sequence, edit_instructions, steps=None):
+        if steps:
+            return self._step_edit_prompt({step: sequence[step] for step in steps}, edit_instructions)
+        return f"""
         Edit the following outreach sequence according to these instructions:
         
         Original Sequence:
-        {json.dumps(sequence, indent=2)}
+        {canonical_json(sequence)}
         
         Edit Instructions:
         {edit_instructions}
 
-        The key for the JSON object should be the step1, step2, etc.
+        {self._step_format()}
 
         For each step, include:
-        - Channel (Email, LinkedIn, etc.)
-        - Subject line (if email)
-        - Timing (e.g., "Send 3 days after initial email")
-        - Message content
+        - channel (Email, LinkedIn, etc.)
+        - subject_line (if email)
+        - timing (e.g., "Send 3 days after initial email")
+        - message_content
         
         IMPORTANT: Keep messages concise. Each message content should be under 150 words.
         
         Return the edited sequence as a JSON object with the same structure.
         """
-        
-        response = self.llm(prompt)
-        
-        try:
-            edited_sequence = json.loads(response)
-            return edited_sequence
-        except json.JSONDecodeError:
-            return {
-                "error": "Could not generate valid edited sequence",
-                "raw_response": response
-            }
+
+    def _step_edit_prompt(self, steps, edit_instructions):
+        return f"""
+        Edit these steps of an outreach sequence according to the instructions.
+
+        Steps:
+        {canonical_json(steps)}
+
+        Edit Instructions:
+        {edit_instructions}
+
+        Keep each step's fields (channel, subject_line, timing, message_content).
+        IMPORTANT: Keep messages concise. Each message content should be under 150 words.
+
+        {self._step_edit_format(steps)}
+        """
+
+    def _step_edit_format(self, steps):
+        if self.structured:
+            return f'Return only these steps, in this order ({", ".join(steps)}), in the "steps" array.'
+        return f"Return only these steps as a JSON object with the same keys ({', '.join(steps)})."
+
@@ -0,0 +1,85 @@
+"""
+Process-wide, lazily created agent objects
+
+Routes and the job queue share one HROutreachManager, which shares its
+HRAgent and OutreachSequenceGenerator. Nothing is built (and LangChain is
+not even imported) until the first request needs it, so workers boot fast.
+The intent router and semantic cache are separate singletons so their stats
+can be read without building the agent.
+"""
+import threading
+
+_lock = threading.RLock()
+_outreach_generator = None
+_hr_agent = None
+_outreach_manager = None
+_embedder = None
+_intent_router = None
+_semantic_cache = None
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        with _lock:
+            if _embedder is None:
+                from agents.llm_backends import embeddings
+                _embedder = embeddings()
+    return _embedder
+
+def get_intent_router():
+    global _intent_router
+    if _intent_router is None:
+        with _lock:
+            if _intent_router is None:
+                from agents.intent_router import IntentRouter
+                _intent_router = IntentRouter()
+    return _intent_router
+
+def get_semantic_cache():
+    global _semantic_cache
+    if _semantic_cache is None:
+        with _lock:
+            if _semantic_cache is None:
+                from agents.semantic_cache import SemanticCache
+                _semantic_cache = SemanticCache()
+    return _semantic_cache
+
+def get_outreach_generator():
+    global _outreach_generator
+    if _outreach_generator is None:
+        with _lock:
+            if _outreach_generator is None:
+                from agents.outreach_agent import OutreachSequenceGenerator
+                _outreach_generator = OutreachSequenceGenerator()
+    return _outreach_generator
+
+def get_hr_agent():
+    global _hr_agent
+    if _hr_agent is None:
+        with _lock:
+            if _hr_agent is None:
+                from agents.hr_agent import HRAgent
+                _hr_agent = HRAgent(outreach_generator=get_outreach_generator())
+    return _hr_agent
+
+def get_outreach_manager():
+    global _outreach_manager
+    if _outreach_manager is None:
+        with _lock:
+            if _outreach_manager is None:
+                from agents.app_manager import HROutreachManager
+                _outreach_manager = HROutreachManager(
+                    hr_agent=get_hr_agent(),
+                    outreach_generator=get_outreach_generator()
+                )
+    return _outreach_manager
+
+def initialized():
+    """Which of the shared objects have been built so far"""
+    return {
+        "outreach_generator": _outreach_generator is not None,
+        "hr_agent": _hr_agent is not None,
+        "outreach_manager": _outreach_manager is not None,
+        "intent_router": _intent_router is not None,
+        "semantic_cache": _semantic_cache is not None,
+    }
@@ -0,0 +1,129 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from agents.tracing import span
+from models.vector_store import LocalVectorIndex, content_id
+
+BEST_PRACTICES = "Search_Best_Practices"
+GENERAL = "General_Conversation"
+
+class SemanticCache:
+    """
+    Answer cache keyed by meaning instead of exact prompt text
+
+    Queries are embedded and looked up in an in-process vector index; a
+    stored answer is returned when its query is at least `threshold` cosine
+    similar to the new one. Entries expire after a per-tool TTL and are
+    purged from the index on every store and at least every purge_interval
+    seconds on lookup; the least recently used ones are evicted above
+    max_entries. Without an
+    embedder, the shared one is created on the first lookup, so building the
+    cache (e.g. to read its stats) stays cheap.
+    """
+    def __init__(self, embedder=None, threshold=None, max_entries=None, ttls=None, purge_interval=60.0):
+        self._embedder = embedder
+        self.enabled = os.getenv('SEMANTIC_CACHE_ENABLED', 'True') == 'True'
+        self.threshold = threshold if threshold is not None else float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.92))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', 5000))
+        self.ttls = ttls or {
+            BEST_PRACTICES: float(os.getenv('SEMANTIC_CACHE_TTL_BEST_PRACTICES', 86400)),
+            GENERAL: float(os.getenv('SEMANTIC_CACHE_TTL_GENERAL', 3600)),
+        }
+        self.purge_interval = purge_interval
+        self.index = LocalVectorIndex()
+        self._order = OrderedDict()  # entry id -> (tool, expires_at), least recently used first
+        self._purged_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.counters = {}
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            from agents.registry import get_embedder
+            self._embedder = get_embedder()
+        return self._embedder
+
+    def _count(self, tool, counter):
+        with self._lock:
+            tool_counters = self.counters.setdefault(tool, {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0})
+            tool_counters[counter] += 1
+
+    def embed(self, query):
+        with span("embedding", "query"):
+            return self.embedder.embed_query(query)
+
+    async def aembed(self, query):
+        with span("embedding", "query"):
+            return await self.embedder.aembed_query(query)
+
+    def purge(self):
+        """Drop expired entries from the index so lookups stop scoring them; returns how many"""
+        now = time.time()
+        with self._lock:
+            self._purged_at = time.monotonic()
+            expired = [(entry_id, tool) for entry_id, (tool, expires_at) in self._order.items() if expires_at <= now]
+            for entry_id, _ in expired:
+                del self._order[entry_id]
+        if expired:
+            self.index.delete([entry_id for entry_id, _ in expired])
+            for _, tool in expired:
+                self._count(tool, "expirations")
+        return len(expired)
+
+    def lookup(self, tool, query, vector):
+        """Cached answer for a query similar enough to `query`, or None"""
+        if not self.enabled or tool not in self.ttls:
+            return None
+        if time.monotonic() - self._purged_at >= self.purge_interval:
+            self.purge()
+        matches = self.index.query(vector, top_k=1, filter={"tool": tool, "expires_at": {"$gt": time.time()}})
+        if matches and matches[0]["score"] >= self.threshold:
+            with self._lock:
+                if matches[0]["id"] in self._order:
+                    self._order.move_to_end(matches[0]["id"])
+            self._count(tool, "hits")
+            return matches[0]["metadata"]["answer"]
+        self._count(tool, "misses")
+        return None
+
+    def store(self, tool, query, vector, answer):
+        if not self.enabled or tool not in self.ttls or not answer:
+            return
+        self.purge()
+        entry_id = f"{tool}:{content_id(' '.join(query.lower().split()))}"
+        expires_at = time.time() + self.ttls[tool]
+        self.index.upsert([entry_id], [vector], [{
+            "tool": tool,
+            "query": query,
+            "answer": answer,
+            "expires_at": expires_at,
+        }])
+        with self._lock:
+            self._order[entry_id] = (tool, expires_at)
+            self._order.move_to_end(entry_id)
+            evicted = []
+            while len(self._order) > self.max_entries:
+                evicted.append(self._order.popitem(last=False)[0])
+        if evicted:
+            self.index.delete(evicted)
+            for _ in evicted:
+                self._count(tool, "evictions")
+        self._count(tool, "stores")
+
+    def stats(self):
+        with self._lock:
+            counters = {tool: dict(values) for tool, values in self.counters.items()}
+            size = len(self._order)
+        for values in counters.values():
+            lookups = values["hits"] + values["misses"]
+            values["hit_rate"] = values["hits"] / lookups if lookups else 0.0
+        hits = sum(values["hits"] for values in counters.values())
+        lookups = hits + sum(values["misses"] for values in counters.values())
+        return {
+            "enabled": self.enabled,
+            "entries": size,
+            "threshold": self.threshold,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "tools": counters,
+        }
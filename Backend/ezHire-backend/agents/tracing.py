@@ -0,0 +1,277 @@
+import os
+import time
+import uuid
+import bisect
+import inspect
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# USD per 1K tokens as (prompt, completion); LLM_PRICE_<MODEL> overrides as "prompt,completion"
+MODEL_PRICES = {
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4": (0.03, 0.06),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-3.5-turbo-instruct": (0.0015, 0.002),
+    "text-embedding-3-small": (0.00002, 0.0),
+}
+
+# The request being served and the agent tool running inside it
+_current_trace = ContextVar("current_trace", default=None)
+_current_tool = ContextVar("current_tool", default=None)
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_label_value(value)}"' for name, value in labels) + "}"
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple((name, labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_format_labels(key)} {value}"]
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, observed = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(counts):
+                counts[index] += 1
+            self._values[key] = (counts, total + value, observed + 1)
+
+    def _samples(self, key, value):
+        counts, total, observed = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {cumulative}")
+        lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {observed}")
+        lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+        lines.append(f"{self.name}_count{_format_labels(key)} {observed}")
+        return lines
+
+class MetricsRegistry:
+    """Process-wide counters, gauges and histograms in the Prometheus text format"""
+    def __init__(self):
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._add(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+http_requests = metrics.counter("ezhire_http_requests_total", "HTTP requests served", ("method", "endpoint", "status"))
+http_seconds = metrics.histogram("ezhire_http_request_seconds", "HTTP request latency", ("method", "endpoint"))
+span_seconds = metrics.histogram("ezhire_span_seconds", "Time spent in LLM calls, DB queries, parsing and tools", ("kind", "name", "tool"))
+span_errors = metrics.counter("ezhire_span_errors_total", "Spans that raised", ("kind", "name", "tool"))
+llm_tokens = metrics.counter("ezhire_llm_tokens_total", "LLM tokens used", ("model", "type", "tool"))
+llm_cost = metrics.counter("ezhire_llm_cost_usd_total", "Estimated LLM cost in USD", ("model", "tool"))
+db_pool = metrics.gauge("ezhire_db_pool_connections", "Database pool connections", ("state",))
+
+class Trace:
+    """Spans recorded while serving one request"""
+    __slots__ = ("request_id", "started", "spans", "_lock")
+
+    def __init__(self, request_id=None):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self.spans = []  # (kind, name, tool, seconds)
+        self._lock = threading.Lock()
+
+    def add(self, kind, name, tool, seconds):
+        with self._lock:
+            self.spans.append((kind, name, tool, seconds))
+
+    def breakdown(self):
+        """{kind: {"count": n, "seconds": total}}"""
+        totals = {}
+        with self._lock:
+            spans = list(self.spans)
+        for kind, _, _, seconds in spans:
+            entry = totals.setdefault(kind, {"count": 0, "seconds": 0.0})
+            entry["count"] += 1
+            entry["seconds"] += seconds
+        return totals
+
+    def server_timing(self):
+        """Server-Timing header value: one entry per span kind plus the total"""
+        entries = [
+            f'{kind};dur={entry["seconds"] * 1000:.1f};desc="{entry["count"]} calls"'
+            for kind, entry in sorted(self.breakdown().items())
+        ]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+def current_trace():
+    return _current_trace.get()
+
+def current_tool():
+    return _current_tool.get()
+
+def start_trace(request_id=None):
+    """Begin tracing a request; returns a token for end_trace()"""
+    return _current_trace.set(Trace(request_id))
+
+def end_trace(token):
+    if token is not None:
+        _current_trace.reset(token)
+
+def record_span(kind, name, seconds, error=False, tool=None, trace=None):
+    """Record a finished span in the metrics and, when tracing a request, in its trace"""
+    tool = tool if tool is not None else _current_tool.get()
+    trace = trace if trace is not None else _current_trace.get()
+    labels = {"kind": kind, "name": name, "tool": tool or ""}
+    span_seconds.observe(seconds, **labels)
+    if error:
+        span_errors.inc(**labels)
+    if trace is not None:
+        trace.add(kind, name, tool, seconds)
+
+@contextmanager
+def span(kind, name):
+    """Time a block as a span of the given kind (llm, db, parse, embedding, tool, agent)"""
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        record_span(kind, name, time.perf_counter() - started, error)
+
+def traced_tool(tool_name, func):
+    """Wrap an agent tool so it runs as a span and tags the spans inside it with its name"""
+    if func is None:
+        return None
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            token = _current_tool.set(tool_name)
+            try:
+                with span("tool", tool_name):
+                    return await func(*args, **kwargs)
+            finally:
+                _current_tool.reset(token)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _current_tool.set(tool_name)
+        try:
+            with span("tool", tool_name):
+                return func(*args, **kwargs)
+        finally:
+            _current_tool.reset(token)
+    return wrapper
+
+def model_price(model):
+    override = os.getenv(f"LLM_PRICE_{model.upper().replace('-', '_').replace('.', '_')}")
+    if override:
+        prompt, completion = override.split(",")
+        return float(prompt), float(completion)
+    return MODEL_PRICES.get(model, (0.0, 0.0))
+
+def record_llm_usage(model, prompt_tokens, completion_tokens, tool=None):
+    """Count tokens and estimated cost of one LLM call; returns the cost in USD"""
+    tool = (tool if tool is not None else _current_tool.get()) or ""
+    prompt_price, completion_price = model_price(model)
+    cost = (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+    llm_tokens.inc(prompt_tokens, model=model, type="prompt", tool=tool)
+    llm_tokens.inc(completion_tokens, model=model, type="completion", tool=tool)
+    llm_cost.inc(cost, model=model, tool=tool)
+    return cost
+
+def timing_header_requested(headers):
+    """Server-Timing is added when TRACE_TIMING_HEADER=True or the request sends X-Trace-Timing: true"""
+    if os.getenv('TRACE_TIMING_HEADER', 'False') == 'True':
+        return True
+    return headers.get('X-Trace-Timing', '').lower() == 'true'
+
+def finish_request(method, endpoint, status, headers):
+    """
+    Record the current request's metrics; returns the response headers to add
+
+    X-Request-ID is always returned, Server-Timing only when requested.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return {}
+    http_requests.inc(method=method, endpoint=endpoint, status=status)
+    http_seconds.observe(time.perf_counter() - trace.started, method=method, endpoint=endpoint)
+    response_headers = {"X-Request-ID": trace.request_id}
+    if timing_header_requested(headers):
+        response_headers["Server-Timing"] = trace.server_timing()
+    return response_headers
+
+def render_metrics(pool=None):
+    """Prometheus exposition of all metrics; pool is a pool_stats() dict"""
+    if pool:
+        for state in ("size", "idle", "in_use"):
+            db_pool.set(pool[state], state=state)
+    return metrics.render()
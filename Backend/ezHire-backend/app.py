@@ -2,35 +2,64 @@ from flask import Flask
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
-from models.database import setup_database
-from models.vector_store import initialize_pinecone
+from models.database import pool_stats
+from models.migrations import ensure_schema
+# from models.vector_store import initialize_pinecone
+from agents.llm_cache import get_llm_cache
+from agents.admission import get_admission_controller
+from agents.registry import initialized
 from routes.chat_routes import chat_bp
 from routes.campaign_routes import campaign_bp
+from routes.job_routes import job_bp
+from routes.metrics_routes import metrics_bp
+from routes.admin_routes import admin_bp
+from agents.job_queue import get_job_queue
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Flask application
-app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})  # Enable CORS for all routes
+def create_app(check_schema=True, start_workers=True):
+    """
+    Build the Flask application
 
-# Configure database and vector store
-setup_database()
-# pinecone_index = initialize_pinecone()
+    The agents are not created here: the first request that needs them
+    builds one shared set (see agents/registry.py). Run with
+    `gunicorn "app:create_app()"` or `python app.py`.
+    """
+    app = Flask(__name__)
+    CORS(app, resources={r"/*": {"origins": "*"}})  # Enable CORS for all routes
 
-# Register blueprints
-app.register_blueprint(chat_bp)
-app.register_blueprint(campaign_bp)
+    # Configure database and vector store
+    if check_schema:
+        ensure_schema()
+    # pinecone_index = initialize_pinecone()
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Health check endpoint"""
-    return {
-        "status": "running",
-        "database": "connected" if os.getenv('DATABASE_URL') else "disconnected",
-        # "pinecone": "connected" if pinecone_index else "disconnected"
-    }
+    # Register blueprints
+    app.register_blueprint(chat_bp)
+    app.register_blueprint(campaign_bp)
+    app.register_blueprint(job_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(admin_bp)
+
+    # Background workers for queued sequence generation/edits (JOB_WORKERS=0 disables them)
+    if start_workers:
+        get_job_queue().start()
+
+    @app.route('/health', methods=['GET'])
+    def health_check():
+        """Health check endpoint"""
+        return {
+            "status": "running",
+            "database": "connected" if os.getenv('DATABASE_URL') else "disconnected",
+            "database_pool": pool_stats(),
+            "llm_cache": get_llm_cache().stats(),
+            "admission": get_admission_controller().stats(),
+            "agents": initialized(),
+            # "pinecone": "connected" if pinecone_index else "disconnected"
+        }
+
+    return app
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5080))
-    app.run(host='0.0.0.0', port=port, debug=os.getenv('FLASK_DEBUG', 'False') == 'True')
+    create_app().run(host='0.0.0.0', port=port, debug=os.getenv('FLASK_DEBUG', 'False') == 'True')
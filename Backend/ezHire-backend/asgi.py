@@ -0,0 +1,146 @@
+"""
+ASGI entry point with a native asyncio request path
+
+Serves the LLM-heavy endpoints (/chat, sequence generation and edits) with
+async views, so a single process can keep hundreds of chats in flight while
+they wait on OpenAI and Postgres. Everything else stays on the Flask app in
+app.py. Run with an ASGI server, e.g.:
+
+    hypercorn asgi:app --bind 0.0.0.0:5081
+"""
+import os
+import asyncio
+from dotenv import load_dotenv
+from quart import Quart, g, request, jsonify
+from quart_cors import cors
+from models.migrations import ensure_schema
+from models.async_database import get_async_pool, close_async_pool
+from agents.registry import get_outreach_manager
+from agents.tracing import start_trace, end_trace, finish_request, render_metrics
+from agents.admission import AdmissionRejected, get_admission_controller
+
+load_dotenv()
+
+app = cors(Quart(__name__), allow_origin="*")
+
+@app.before_serving
+async def startup():
+    await asyncio.to_thread(ensure_schema)
+    await get_async_pool()
+
+@app.after_serving
+async def shutdown():
+    await close_async_pool()
+
+@app.before_request
+async def start_request_trace():
+    g.trace_token = start_trace(request.headers.get('X-Request-ID'))
+
+@app.after_request
+async def finish_request_trace(response):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    response.headers.update(finish_request(request.method, endpoint, response.status_code, request.headers))
+    return response
+
+@app.teardown_request
+async def end_request_trace(exc):
+    end_trace(g.pop('trace_token', None))
+
+def _error_status(result):
+    """404 for a missing campaign or sequence, 502 when the model output could not be used"""
+    return 404 if str(result["error"]).endswith("not found") else 502
+
+def _admission_key(data):
+    return str((data or {}).get('user_id') or request.headers.get('X-User-ID') or request.remote_addr)
+
+async def _admitted(user_id, call):
+    """Await call() once the admission controller grants a slot; a 429 response when it does not"""
+    try:
+        async with get_admission_controller().aadmit(user_id):
+            return await call()
+    except AdmissionRejected as e:
+        response = jsonify({"error": str(e), "reason": e.reason, "retry_after": e.retry_after})
+        return response, 429, {"Retry-After": str(e.retry_after)}
+
+@app.route('/metrics', methods=['GET'])
+async def get_metrics():
+    """Prometheus metrics: request latency, LLM/DB/parse spans, tokens and cost"""
+    pool = await get_async_pool()
+    return render_metrics({
+        "size": pool.get_size(),
+        "idle": pool.get_idle_size(),
+        "in_use": pool.get_size() - pool.get_idle_size(),
+    }), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+@app.route('/health', methods=['GET'])
+async def health_check():
+    """Health check endpoint"""
+    pool = await get_async_pool()
+    return {
+        "status": "running",
+        "database": "connected" if os.getenv('DATABASE_URL') else "disconnected",
+        "database_pool": {"size": pool.get_size(), "idle": pool.get_idle_size()},
+        "admission": get_admission_controller().stats()
+    }
+
+@app.route('/chat', methods=['POST'])
+async def chat():
+    data = await request.get_json()
+    user_id = data.get('user_id')
+    campaign_id = data.get('campaign_id')
+    message = data.get('message')
+    conversation_id = data.get('conversation_id')
+
+    if not all([user_id, message]):
+        return jsonify({"error": "Missing required fields"}), 400
+
+    result = await _admitted(_admission_key(data), lambda: get_outreach_manager().ahandle_chat(
+        user_id=user_id,
+        campaign_id=campaign_id,
+        message=message,
+        conversation_id=conversation_id
+    ))
+    if isinstance(result, tuple):
+        return result
+
+    return jsonify(result)
+
+@app.route('/campaigns/<int:campaign_id>/sequence', methods=['POST'])
+async def generate_sequence(campaign_id):
+    data = await request.get_json()
+
+    result = await _admitted(_admission_key(data), lambda: get_outreach_manager().agenerate_campaign_sequence(
+        campaign_id=campaign_id,
+        additional_info={
+            "company_values": data.get('company_values'),
+            "unique_selling_points": data.get('unique_selling_points')
+        },
+        use_cache=data.get('use_cache', True)
+    ))
+    if isinstance(result, tuple):
+        return result
+
+    if "error" in result:
+        return jsonify(result), _error_status(result)
+
+    return jsonify(result)
+
+@app.route('/sequences/<int:sequence_id>/edit', methods=['POST'])
+async def edit_sequence(sequence_id):
+    data = await request.get_json()
+    edit_instructions = data.get('edit_instructions')
+
+    if not edit_instructions:
+        return jsonify({"error": "Missing edit instructions"}), 400
+
+    result = await _admitted(_admission_key(data), lambda: get_outreach_manager().aedit_sequence(
+        sequence_id=sequence_id,
+        edit_instructions=edit_instructions
+    ))
+    if isinstance(result, tuple):
+        return result
+
+    if "error" in result:
+        return jsonify(result), _error_status(result)
+
+    return jsonify(result)
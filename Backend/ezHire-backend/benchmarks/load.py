@@ -0,0 +1,227 @@
+"""
+Offline load test for /chat, sequence generation and sequence edits
+
+Runs the Flask app in-process on a local port with the fake LLM backend
+(configurable latency, realistic ReAct/JSON output) against the Postgres at
+DATABASE_URL, drives it with concurrent HTTP clients and reports latency
+percentiles, throughput and database connection usage per scenario.
+
+    python -m benchmarks.load --scenario all --requests 200 --concurrency 16 --latency 0.5
+
+Use a scratch database: the run creates a benchmark user and campaigns.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import statistics
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+CHAT_MESSAGES = [
+    "Create an outreach sequence for senior backend engineers",
+    "What are the best practices for reaching out to passive candidates?",
+    "Make the second email more casual",
+    "Hi there, what can you help me with?",
+    "Generate a LinkedIn-first sequence for data scientists in fintech",
+    "Any tips for writing subject lines that get opened?",
+    "Edit step 3 to mention our remote-first culture",
+    "Thanks, that looks great",
+]
+
+def percentile(values, p):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), round(p / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+def _post(base_url, path, body):
+    request = urllib.request.Request(
+        f"{base_url}{path}",
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=300) as response:
+            return response.status, json.loads(response.read() or b"{}")
+    except urllib.error.HTTPError as e:
+        return e.code, {}
+
+def _seed(campaigns):
+    """Benchmark user, campaigns and one sequence per campaign; returns (user_id, campaign_ids, sequence_ids)"""
+    from models.database import db_cursor
+    from agents.fake_llm import fake_sequence
+
+    with db_cursor(commit=True) as cur:
+        cur.execute(
+            """
+            INSERT INTO users (name, email) VALUES ('Benchmark', 'benchmark@ezhire.local')
+            ON CONFLICT (email) DO UPDATE SET name = EXCLUDED.name RETURNING id
+            """
+        )
+        user_id = cur.fetchone()['id']
+        campaign_ids, sequence_ids = [], []
+        for n in range(campaigns):
+            cur.execute(
+                "INSERT INTO campaigns (user_id, name, target_role, industry) VALUES (%s, %s, %s, %s) RETURNING id",
+                (user_id, f"Benchmark campaign {n}", "Software Engineer", "Technology")
+            )
+            campaign_ids.append(cur.fetchone()['id'])
+            cur.execute(
+                "INSERT INTO outreach_sequences (campaign_id, sequence_data, version) VALUES (%s, %s, 1) RETURNING id",
+                (campaign_ids[-1], json.dumps(fake_sequence()))
+            )
+            sequence_ids.append(cur.fetchone()['id'])
+    return user_id, campaign_ids, sequence_ids
+
+class ConnectionSampler:
+    """Samples the pool and the server-side connection count while a scenario runs"""
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.max_in_use = 0
+        self.max_server_connections = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        from models.database import get_db_connection, pool_stats
+        # A dedicated connection, so sampling does not take one from the pool
+        conn = get_db_connection()
+        conn.autocommit = True
+        try:
+            while not self._stop.wait(self.interval):
+                stats = pool_stats() or {}
+                self.max_in_use = max(self.max_in_use, stats.get("in_use", 0))
+                with conn.cursor() as cur:
+                    cur.execute("SELECT COUNT(*) AS count FROM pg_stat_activity WHERE datname = current_database()")
+                    self.max_server_connections = max(self.max_server_connections, cur.fetchone()['count'] - 1)
+        finally:
+            conn.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def run_scenario(name, base_url, make_request, requests, concurrency):
+    from models.database import pool_stats
+
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        path, body = make_request(i)
+        started = time.perf_counter()
+        status, _ = _post(base_url, path, body)
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if status >= 400:
+                errors += 1
+
+    with ConnectionSampler() as sampler:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(one, range(requests)))
+        duration = time.perf_counter() - started
+
+    return {
+        "scenario": name,
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "rps": round(requests / duration, 2) if duration else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1) if latencies else 0.0,
+        "max_pool_in_use": sampler.max_in_use,
+        "max_server_connections": sampler.max_server_connections,
+        "pool": pool_stats(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test with the fake LLM backend")
+    parser.add_argument('--scenario', choices=["chat", "generate", "edit", "all"], default="all")
+    parser.add_argument('--requests', type=int, default=100, help="requests per scenario")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.2, help="seconds each fake LLM call takes")
+    parser.add_argument('--campaigns', type=int, default=10)
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--no-cache', action='store_true', help="disable the LLM and semantic caches")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+
+    if not os.getenv('DATABASE_URL'):
+        sys.exit("DATABASE_URL must point to a local Postgres")
+
+    # Must be set before the app and its agents are created
+    os.environ['LLM_BACKEND'] = 'fake'
+    os.environ['FAKE_LLM_LATENCY'] = str(args.latency)
+    os.environ.setdefault('JOB_WORKERS', '0')
+    # All clients share one benchmark user, which the per-user limits would turn into 429s
+    os.environ.setdefault('ADMISSION_ENABLED', 'False')
+    if args.no_cache:
+        os.environ['LLM_CACHE_ENABLED'] = 'False'
+        os.environ['SEMANTIC_CACHE_ENABLED'] = 'False'
+
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    app = create_app(start_workers=False)
+    server = make_server("127.0.0.1", args.port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    user_id, campaign_ids, sequence_ids = _seed(args.campaigns)
+    rng = random.Random(42)
+    scenarios = {
+        "chat": lambda i: ("/chat", {
+            "user_id": user_id,
+            "campaign_id": rng.choice(campaign_ids),
+            "message": CHAT_MESSAGES[i % len(CHAT_MESSAGES)]
+        }),
+        "generate": lambda i: ("/campaigns/%d/sequence?sync=true" % rng.choice(campaign_ids), {
+            "company_values": "Ownership, Curiosity",
+            "unique_selling_points": f"Remote-first, benchmark run {i}",
+            "use_cache": not args.no_cache
+        }),
+        "edit": lambda i: ("/sequences/%d/edit?sync=true" % rng.choice(sequence_ids), {
+            "edit_instructions": f"Make step {i % 3 + 1} more concise"
+        }),
+    }
+    selected = list(scenarios) if args.scenario == "all" else [args.scenario]
+
+    results = []
+    try:
+        for name in selected:
+            # Warm up: builds the shared agents and opens pool connections
+            run_scenario(name, base_url, scenarios[name], min(args.concurrency, args.requests), args.concurrency)
+            results.append(run_scenario(name, base_url, scenarios[name], args.requests, args.concurrency))
+    finally:
+        server.shutdown()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"fake LLM latency {args.latency}s, {args.concurrency} concurrent clients, caches {'off' if args.no_cache else 'on'}")
+    print(f"{'scenario':<10}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}{'pool max':>10}{'pg conns':>10}")
+    for r in results:
+        print(f"{r['scenario']:<10}{r['rps']:>8}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}"
+              f"{r['errors']:>8}{r['max_pool_in_use']:>10}{r['max_server_connections']:>10}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Worker startup benchmark
+
+Measures, in fresh interpreters, how long it takes to import the app module,
+build the app with create_app(), and serve the first /health and /chat
+requests (the first /chat builds the shared agents). Uses the fake LLM
+backend unless LLM_BACKEND is already set; /chat needs DATABASE_URL.
+
+    python -m benchmarks.startup --runs 5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _measure_once(skip_chat):
+    timings = {}
+    start = time.perf_counter()
+    import app as app_module
+    timings["import"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    app = app_module.create_app(start_workers=False)
+    timings["create_app"] = time.perf_counter() - start
+
+    client = app.test_client()
+    start = time.perf_counter()
+    client.get('/health')
+    timings["first_health"] = time.perf_counter() - start
+
+    if not skip_chat:
+        start = time.perf_counter()
+        response = client.post('/chat', json={"user_id": 1, "message": "What are best practices for recruiting outreach?"})
+        timings["first_chat"] = time.perf_counter() - start
+        if response.status_code != 200:
+            print(f"First /chat returned {response.status_code}", file=sys.stderr)
+
+        start = time.perf_counter()
+        client.post('/chat', json={"user_id": 1, "message": "Any tips for follow-up timing?"})
+        timings["second_chat"] = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux
+    timings["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--skip-chat', action='store_true', help="Only measure import, create_app and /health")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_measure_once(args.skip_chat)))
+        return
+
+    env = dict(os.environ)
+    env.setdefault('LLM_BACKEND', 'fake')
+    command = [sys.executable, '-m', 'benchmarks.startup', '--child'] + (['--skip-chat'] if args.skip_chat else [])
+
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.run(command, cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True)
+        runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    print(f"{'metric':<14}{'median':>10}{'min':>10}{'max':>10}")
+    for metric in runs[0]:
+        values = [run[metric] for run in runs]
+        unit = 1 if metric == "max_rss_mb" else 1000
+        print(f"{metric:<14}{statistics.median(values) * unit:>10.1f}{min(values) * unit:>10.1f}{max(values) * unit:>10.1f}")
+    print("(times in ms, max_rss_mb in MB)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import os
+import json
+import asyncio
+from contextlib import asynccontextmanager
+import asyncpg
+from dotenv import load_dotenv
+from agents.tracing import record_span
+from models.database import statement_name
+from models.outreach_sequence import canonical_json
+
+load_dotenv()
+
+_pool = None
+_pool_lock = asyncio.Lock()
+
+def _log_query(query):
+    record_span("db", statement_name(query.query), query.elapsed, error=query.exception is not None)
+
+async def _init_connection(conn):
+    # Decode JSON/JSONB columns to Python objects like psycopg2 does, and
+    # encode parameters in the same canonical form as the sync path stores
+    for type_name in ("json", "jsonb"):
+        await conn.set_type_codec(type_name, encoder=canonical_json, decoder=json.loads, schema="pg_catalog")
+    # Time every statement as a "db" span (query loggers need asyncpg >= 0.29)
+    if hasattr(conn, "add_query_logger"):
+        conn.add_query_logger(_log_query)
+
+async def get_async_pool():
+    """Return the process-wide asyncpg pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await asyncpg.create_pool(
+                    os.getenv('DATABASE_URL'),
+                    min_size=int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+                    max_size=int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+                    timeout=float(os.getenv('DB_POOL_TIMEOUT', 10)),
+                    init=_init_connection,
+                )
+    return _pool
+
+async def close_async_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+@asynccontextmanager
+async def adb_connection(transaction=False):
+    """
+    Async counterpart of db_cursor(): yields a pooled asyncpg connection.
+
+    With transaction=True the block runs in a transaction that is committed
+    on a clean exit and rolled back on an exception.
+    """
+    pool = await get_async_pool()
+    async with pool.acquire(timeout=float(os.getenv('DB_POOL_TIMEOUT', 10))) as conn:
+        if transaction:
+            async with conn.transaction():
+                yield conn
+        else:
+            yield conn
+
+async def afetchone(query, *args):
+    """Run a query and return the first row as a dict (or None)"""
+    async with adb_connection() as conn:
+        row = await conn.fetchrow(query, *args)
+    return dict(row) if row else None
+
+async def afetchall(query, *args):
+    async with adb_connection() as conn:
+        rows = await conn.fetch(query, *args)
+    return [dict(row) for row in rows]
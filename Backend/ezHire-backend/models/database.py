@@ -1,66 +1,277 @@
 import os
+import time
+import threading
+from contextlib import contextmanager
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
+from agents.tracing import span
 
 load_dotenv()
 
+def statement_name(query):
+    """First keyword of a SQL statement (SELECT, INSERT, ...), used as the span name"""
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    if not isinstance(query, str):
+        return "QUERY"
+    words = query.split(None, 1)
+    return words[0].upper() if words else "QUERY"
+
+class TracingCursor(RealDictCursor):
+    """RealDictCursor that times each statement as a "db" span"""
+    def execute(self, query, vars=None):
+        with span("db", statement_name(query)):
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        with span("db", statement_name(query)):
+            return super().executemany(query, vars_list)
+
 def get_db_connection():
+    """Open a new raw connection. Application code should use db_cursor() instead."""
     conn = psycopg2.connect(os.getenv('DATABASE_URL'))
-    conn.cursor_factory = RealDictCursor
+    conn.cursor_factory = TracingCursor
     return conn
 
-def setup_database():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # Create users table
-    cur.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id SERIAL PRIMARY KEY,
-        name VARCHAR(100) NOT NULL,
-        email VARCHAR(100) UNIQUE NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # Create campaigns table
-    cur.execute('''
-    CREATE TABLE IF NOT EXISTS campaigns (
-        id SERIAL PRIMARY KEY,
-        user_id INTEGER REFERENCES users(id),
-        name VARCHAR(100) NOT NULL,
-        description TEXT,
-        target_role VARCHAR(100),
-        industry VARCHAR(100),
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # Create outreach_sequences table
-    cur.execute('''
-    CREATE TABLE IF NOT EXISTS outreach_sequences (
-        id SERIAL PRIMARY KEY,
-        campaign_id INTEGER REFERENCES campaigns(id),
-        sequence_data JSONB NOT NULL,
-        version INTEGER DEFAULT 1,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # Create conversations table to store chat history
-    cur.execute('''
-    CREATE TABLE IF NOT EXISTS conversations (
-        id SERIAL PRIMARY KEY,
-        user_id INTEGER REFERENCES users(id),
-        campaign_id INTEGER REFERENCES campaigns(id),
-        messages JSONB NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out before the timeout"""
+    pass
+
+class ConnectionPool:
+    """
+    Thread-safe Postgres connection pool
+
+    Connections are created lazily up to max_size, kept warm down to min_size,
+    and health checked on checkout when they have been idle for longer than
+    health_check_interval seconds.
+    """
+    def __init__(self, min_size=1, max_size=10, timeout=10.0, health_check_interval=30.0, connect=get_db_connection):
+        if min_size > max_size:
+            raise ValueError("min_size cannot be larger than max_size")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._connect = connect
+        self._cond = threading.Condition()
+        self._idle = []  # list of (conn, last_used)
+        self._size = 0
+        self._closed = False
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "connections_created": 0,
+            "connections_discarded": 0,
+            "health_checks": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+
+        for _ in range(min_size):
+            self._idle.append((self._new_connection(), time.monotonic()))
+
+    def _new_connection(self):
+        conn = self._connect()
+        self._size += 1
+        self._stats["connections_created"] += 1
+        return conn
+
+    def _forget(self, conn):
+        self._size -= 1
+        self._stats["connections_discarded"] += 1
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _discard(self, conn):
+        self._forget(conn)
+        self._close(conn)
+
+    def _needs_check(self, conn, last_used):
+        return conn.closed or time.monotonic() - last_used >= self.health_check_interval
+
+    @staticmethod
+    def _is_healthy(conn):
+        if conn.closed:
+            return False
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self, timeout=None):
+        """Check out a connection, waiting up to timeout seconds for one to free up"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    if not self._needs_check(conn, last_used):
+                        break
+                    # Probe without the lock, so a slow or half-dead server does
+                    # not block every other checkout and return; the popped
+                    # connection still counts towards the pool size meanwhile
+                    if not conn.closed:
+                        self._stats["health_checks"] += 1
+                    self._cond.release()
+                    try:
+                        healthy = self._is_healthy(conn)
+                        if not healthy:
+                            self._close(conn)
+                    finally:
+                        self._cond.acquire()
+                    if healthy:
+                        break
+                    self._forget(conn)
+                    self._cond.notify()
+                    continue
+
+                if self._size < self.max_size:
+                    # Reserve the slot before releasing the lock to connect
+                    self._size += 1
+                    self._cond.release()
+                    try:
+                        conn = self._connect()
+                    except Exception:
+                        self._cond.acquire()
+                        self._size -= 1
+                        self._cond.notify()
+                        raise
+                    self._cond.acquire()
+                    self._stats["connections_created"] += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"Timed out after {timeout}s waiting for a database connection")
+                self._cond.wait(remaining)
+
+            waited = time.monotonic() - started
+            self._stats["checkouts"] += 1
+            self._stats["wait_time_total"] += waited
+            self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+            return conn
+
+    def putconn(self, conn, discard=False):
+        """Return a connection to the pool"""
+        if not (discard or conn.closed):
+            try:
+                # Never hand out a connection with an open transaction
+                # (rolled back outside the lock, like the health check)
+                conn.rollback()
+            except Exception:
+                discard = True
+        with self._cond:
+            discard = discard or self._closed or conn.closed
+            if discard:
+                self._forget(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+        if discard:
+            self._close(conn)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager that checks out a connection and always returns it"""
+        conn = self.getconn(timeout)
+        discard = False
+        try:
+            yield conn
+        except psycopg2.InterfaceError:
+            discard = True
+            raise
+        except psycopg2.OperationalError:
+            discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def stats(self):
+        """Snapshot of pool size, utilization and wait time counters"""
+        with self._cond:
+            in_use = self._size - len(self._idle)
+            stats = dict(self._stats)
+            stats.update({
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": in_use,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "utilization": in_use / self.max_size if self.max_size else 0.0,
+                "wait_time_avg": stats["wait_time_total"] / stats["checkouts"] if stats["checkouts"] else 0.0,
+            })
+            return stats
+
+    def close(self):
+        """Close all idle connections and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+            self._cond.notify_all()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    min_size=int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+                    max_size=int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+                    timeout=float(os.getenv('DB_POOL_TIMEOUT', 10)),
+                    health_check_interval=float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', 30)),
+                )
+    return _pool
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+def pool_stats():
+    """Pool counters, or None if the pool has not been created yet"""
+    return _pool.stats() if _pool is not None else None
+
+@contextmanager
+def db_cursor(commit=False):
+    """
+    Check out a pooled connection and yield a RealDictCursor.
+
+    With commit=True the transaction is committed when the block exits cleanly.
+    Any exception rolls the transaction back before the connection is returned.
+    """
+    with get_pool().connection() as conn:
+        cur = conn.cursor()
+        try:
+            yield cur
+            if commit:
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
@@ -0,0 +1,166 @@
+"""
+Bulk ingestion of HR knowledge into the vector store
+
+Streams documents from files, splits them into overlapping chunks, skips
+chunks whose content hash is already indexed, embeds the rest in large
+batches and upserts each batch in bulk. Only one batch is held in memory at
+a time, so memory stays flat whatever the corpus size.
+
+    python -m models.knowledge_ingest playbooks/ messages.jsonl --type playbook
+
+Supported inputs: .txt/.md files (one document each) and .jsonl files with
+one {"text": ..., <metadata>} object per line. Directories are walked.
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from agents.llm_backends import embeddings
+from models.vector_store import get_knowledge_index, store_hr_knowledge, existing_knowledge_ids, content_id, LocalVectorIndex
+
+TEXT_EXTENSIONS = (".txt", ".md")
+
+def iter_documents(paths, default_metadata=None):
+    """Yield (text, metadata) for every document under paths, one at a time"""
+    default_metadata = default_metadata or {}
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                yield from iter_documents([os.path.join(root, name) for name in sorted(files)], default_metadata)
+            continue
+
+        if path.endswith(".jsonl"):
+            with open(path, encoding="utf-8") as f:
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    text = record.pop("text", "")
+                    yield text, {**default_metadata, "source": f"{path}:{line_number}", **record}
+        elif path.endswith(TEXT_EXTENSIONS):
+            with open(path, encoding="utf-8") as f:
+                yield f.read(), {**default_metadata, "source": path}
+
+def chunk_text(text, chunk_size=1000, overlap=150):
+    """Split text into chunks of up to chunk_size characters on paragraph boundaries"""
+    if not 0 <= overlap < chunk_size:
+        raise ValueError(f"overlap must be at least 0 and less than chunk_size ({chunk_size}), got {overlap}")
+    text = text.strip()
+    if len(text) <= chunk_size:
+        return [text] if text else []
+
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = " ".join(paragraph.split())
+        # Paragraphs longer than a chunk are cut with the same overlap
+        while len(paragraph) > chunk_size:
+            pieces.append(paragraph[:chunk_size])
+            paragraph = paragraph[chunk_size - overlap:]
+        if paragraph:
+            pieces.append(paragraph)
+
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 2 > chunk_size:
+            chunks.append(current)
+            # Carry the tail of the previous chunk over for context when it fits
+            carry = current[-overlap:] if overlap else ""
+            current = carry if len(carry) + len(piece) + 2 <= chunk_size else ""
+        current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def iter_chunks(documents, chunk_size=1000, overlap=150):
+    """Yield (chunk_id, text, metadata); ids are content hashes so re-ingesting is idempotent"""
+    for text, metadata in documents:
+        for position, chunk in enumerate(chunk_text(text, chunk_size, overlap)):
+            yield content_id(chunk), chunk, {**metadata, "chunk": position}
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def ingest(documents, index=None, embedder=None, batch_size=256, chunk_size=1000, overlap=150, progress=True):
+    """
+    Chunk, dedupe, embed and upsert documents ((text, metadata) pairs)
+
+    Returns counts and throughput for the run.
+    """
+    index = index if index is not None else get_knowledge_index()
+    embedder = embedder or embeddings()
+    stats = {"chunks": 0, "embedded": 0, "skipped": 0, "batches": 0}
+    started = time.perf_counter()
+
+    for batch in _batches(iter_chunks(documents, chunk_size, overlap), batch_size):
+        # Drop chunks repeated inside the batch or already in the index
+        unique = {}
+        for chunk_id, text, metadata in batch:
+            unique.setdefault(chunk_id, (text, metadata))
+        known = existing_knowledge_ids(index, list(unique))
+        new_ids = [chunk_id for chunk_id in unique if chunk_id not in known]
+
+        if new_ids:
+            texts = [unique[chunk_id][0] for chunk_id in new_ids]
+            store_hr_knowledge(
+                index, texts,
+                metadatas=[unique[chunk_id][1] for chunk_id in new_ids],
+                ids=new_ids,
+                vectors=embedder.embed_documents(texts),
+                persist=False
+            )
+
+        stats["chunks"] += len(batch)
+        stats["embedded"] += len(new_ids)
+        stats["skipped"] += len(batch) - len(new_ids)
+        stats["batches"] += 1
+        if progress:
+            elapsed = time.perf_counter() - started
+            print(f"batch {stats['batches']}: {stats['chunks']} chunks, {stats['embedded']} embedded, "
+                  f"{stats['skipped']} skipped, {stats['chunks'] / elapsed:.1f} chunks/s", file=sys.stderr)
+
+    if isinstance(index, LocalVectorIndex) and index.path and stats["embedded"]:
+        index.save()
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = round(elapsed, 3)
+    stats["chunks_per_second"] = round(stats["chunks"] / elapsed, 1) if elapsed else 0.0
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest HR knowledge documents into the vector store")
+    parser.add_argument('paths', nargs='+', help=".txt/.md/.jsonl files or directories")
+    parser.add_argument('--type', default="playbook", help="metadata type for documents that do not set one (e.g. playbook, best_practice, outreach_message)")
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--overlap', type=int, default=150)
+    parser.add_argument('--embedder', choices=["default", "hashing"], default="default",
+                        help="hashing uses deterministic local embeddings (no API calls)")
+    args = parser.parse_args()
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    if not 0 <= args.overlap < args.chunk_size:
+        parser.error("--overlap must be at least 0 and less than --chunk-size")
+
+    if args.embedder == "hashing":
+        os.environ['EMBEDDING_BACKEND'] = 'hashing'
+
+    stats = ingest(
+        iter_documents(args.paths, {"type": args.type}),
+        batch_size=args.batch_size,
+        chunk_size=args.chunk_size,
+        overlap=args.overlap
+    )
+    print(json.dumps(stats))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,374 @@
+"""
+Versioned schema migrations
+
+Each migration runs once, in its own transaction, and is recorded in the
+schema_migrations table. A Postgres advisory lock makes sure only one
+process applies them when several workers boot at the same time. Run them
+as a deploy step with:
+
+    python -m models.migrations
+
+and set DB_AUTO_MIGRATE=False so that app workers only check the schema
+version at startup.
+"""
+import os
+from models.database import db_cursor
+
+# Arbitrary key for pg_advisory_lock, shared by every process running migrations
+MIGRATION_LOCK_KEY = 724305
+
+def _initial_schema(cur):
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id SERIAL PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        email VARCHAR(100) UNIQUE NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS campaigns (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER REFERENCES users(id),
+        name VARCHAR(100) NOT NULL,
+        description TEXT,
+        target_role VARCHAR(100),
+        industry VARCHAR(100),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS outreach_sequences (
+        id SERIAL PRIMARY KEY,
+        campaign_id INTEGER REFERENCES campaigns(id),
+        sequence_data JSONB NOT NULL,
+        version INTEGER DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS conversations (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER REFERENCES users(id),
+        campaign_id INTEGER REFERENCES campaigns(id),
+        messages JSONB NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+def _conversation_messages(cur):
+    # Messages are stored one row per message; conversations.message_count
+    # hands out sequence numbers and conversations.messages is legacy
+    cur.execute('''
+    ALTER TABLE conversations ADD COLUMN IF NOT EXISTS message_count INTEGER NOT NULL DEFAULT 0
+    ''')
+    cur.execute('''
+    ALTER TABLE conversations ALTER COLUMN messages DROP NOT NULL
+    ''')
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS conversation_messages (
+        id BIGSERIAL PRIMARY KEY,
+        conversation_id INTEGER NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+        seq INTEGER NOT NULL,
+        role VARCHAR(20) NOT NULL,
+        content JSONB NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (conversation_id, seq)
+    )
+    ''')
+
+    # Move messages from the legacy conversations.messages JSONB array
+    cur.execute('''
+    INSERT INTO conversation_messages (conversation_id, seq, role, content)
+    SELECT c.id, m.ordinality, m.value->>'role', m.value->'content'
+    FROM conversations c
+    CROSS JOIN LATERAL jsonb_array_elements(c.messages) WITH ORDINALITY AS m(value, ordinality)
+    WHERE c.message_count = 0
+      AND jsonb_typeof(c.messages) = 'array'
+    ON CONFLICT (conversation_id, seq) DO NOTHING
+    ''')
+    cur.execute('''
+    UPDATE conversations
+    SET message_count = jsonb_array_length(messages), messages = NULL
+    WHERE message_count = 0
+      AND jsonb_typeof(messages) = 'array'
+    ''')
+
+def _conversation_summary(cur):
+    # Rolling summary of the turns that fell out of the agent's history window
+    cur.execute('''
+    ALTER TABLE conversations
+        ADD COLUMN IF NOT EXISTS summary TEXT,
+        ADD COLUMN IF NOT EXISTS summary_seq INTEGER NOT NULL DEFAULT 0
+    ''')
+
+def _llm_cache(cur):
+    # Persistent tier of the LLM response cache
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS llm_cache (
+        key CHAR(64) PRIMARY KEY,
+        model VARCHAR(100),
+        response TEXT NOT NULL,
+        hits INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_hit_at TIMESTAMP,
+        expires_at TIMESTAMP NOT NULL
+    )
+    ''')
+
+def _jobs(cur):
+    # Background jobs (sequence generation and editing)
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id SERIAL PRIMARY KEY,
+        kind VARCHAR(50) NOT NULL,
+        payload JSONB NOT NULL,
+        status VARCHAR(20) NOT NULL DEFAULT 'queued',
+        result JSONB,
+        error TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP
+    )
+    ''')
+    cur.execute('''
+    CREATE INDEX IF NOT EXISTS jobs_queued_idx ON jobs (id) WHERE status = 'queued'
+    ''')
+
+def _hot_query_indexes(cur):
+    # Campaign listing: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+    cur.execute('''
+    CREATE INDEX IF NOT EXISTS campaigns_user_created_idx
+        ON campaigns (user_id, created_at DESC, id DESC)
+    ''')
+    # Latest version of a campaign's sequence, and the version listing (scanned backwards)
+    cur.execute('''
+    CREATE INDEX IF NOT EXISTS outreach_sequences_campaign_version_idx
+        ON outreach_sequences (campaign_id, version DESC, created_at DESC, id DESC)
+    ''')
+    # A user's conversations; lookups by id alone use the primary key
+    cur.execute('''
+    CREATE INDEX IF NOT EXISTS conversations_user_updated_idx
+        ON conversations (user_id, updated_at DESC)
+    ''')
+    # Cache pruning deletes expired rows
+    cur.execute('''
+    CREATE INDEX IF NOT EXISTS llm_cache_expires_idx ON llm_cache (expires_at)
+    ''')
+
+def _conversation_state(cur):
+    # Pointer to each campaign's latest sequence, maintained by a trigger so
+    # every insert path (chat tools, API, batch, async) keeps it current.
+    # "Latest" matches ORDER BY version DESC, created_at DESC.
+    cur.execute('''
+    ALTER TABLE campaigns
+        ADD COLUMN IF NOT EXISTS latest_sequence_id INTEGER REFERENCES outreach_sequences(id) ON DELETE SET NULL,
+        ADD COLUMN IF NOT EXISTS latest_version INTEGER NOT NULL DEFAULT 0
+    ''')
+    cur.execute('''
+    UPDATE campaigns c
+    SET latest_sequence_id = s.id, latest_version = COALESCE(s.version, 1)
+    FROM (
+        SELECT DISTINCT ON (campaign_id) id, campaign_id, version
+        FROM outreach_sequences
+        ORDER BY campaign_id, version DESC, created_at DESC, id DESC
+    ) s
+    WHERE s.campaign_id = c.id
+    ''')
+    cur.execute('''
+    CREATE OR REPLACE FUNCTION set_campaign_latest_sequence() RETURNS trigger AS $$
+    BEGIN
+        UPDATE campaigns
+        SET latest_sequence_id = NEW.id, latest_version = COALESCE(NEW.version, 1)
+        WHERE id = NEW.campaign_id AND latest_version <= COALESCE(NEW.version, 1);
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    ''')
+    cur.execute('''
+    DROP TRIGGER IF EXISTS outreach_sequences_latest ON outreach_sequences
+    ''')
+    cur.execute('''
+    CREATE TRIGGER outreach_sequences_latest
+        AFTER INSERT ON outreach_sequences
+        FOR EACH ROW EXECUTE FUNCTION set_campaign_latest_sequence()
+    ''')
+
+    # What each conversation is working on (see agents/conversation_state.py)
+    cur.execute('''
+    ALTER TABLE conversations
+        ADD COLUMN IF NOT EXISTS active_campaign_id INTEGER REFERENCES campaigns(id) ON DELETE SET NULL,
+        ADD COLUMN IF NOT EXISTS last_sequence_id INTEGER REFERENCES outreach_sequences(id) ON DELETE SET NULL,
+        ADD COLUMN IF NOT EXISTS last_sequence_version INTEGER
+    ''')
+    cur.execute('''
+    UPDATE conversations SET active_campaign_id = campaign_id
+    WHERE active_campaign_id IS NULL AND campaign_id IS NOT NULL
+    ''')
+
+def _sequence_deltas(cur):
+    # Edited versions may be stored as a JSON patch against a snapshot
+    # (see models/sequence_store.py) instead of a full copy
+    cur.execute('''
+    ALTER TABLE outreach_sequences
+        ALTER COLUMN sequence_data DROP NOT NULL,
+        ADD COLUMN IF NOT EXISTS base_id INTEGER REFERENCES outreach_sequences(id),
+        ADD COLUMN IF NOT EXISTS patch JSONB
+    ''')
+    cur.execute('''
+    ALTER TABLE outreach_sequences DROP CONSTRAINT IF EXISTS outreach_sequences_snapshot_or_delta
+    ''')
+    cur.execute('''
+    ALTER TABLE outreach_sequences ADD CONSTRAINT outreach_sequences_snapshot_or_delta
+        CHECK (sequence_data IS NOT NULL OR (base_id IS NOT NULL AND patch IS NOT NULL))
+    ''')
+
+def _unique_sequence_versions(cur):
+    # Edits used to pick their version number without a lock, so concurrent
+    # edits of one campaign could store the same version twice. Move the later
+    # duplicates past the campaign's highest version, then enforce uniqueness
+    # (version 1 may repeat: every generation starts a new version 1).
+    cur.execute('''
+    WITH duplicates AS (
+        SELECT id, campaign_id,
+            ROW_NUMBER() OVER (PARTITION BY campaign_id, version ORDER BY created_at, id) AS n
+        FROM outreach_sequences
+        WHERE version > 1 AND campaign_id IS NOT NULL
+    ), highest AS (
+        SELECT campaign_id, MAX(version) AS version FROM outreach_sequences GROUP BY campaign_id
+    ), renumbered AS (
+        SELECT d.id, h.version + ROW_NUMBER() OVER (PARTITION BY d.campaign_id ORDER BY d.id) AS version
+        FROM duplicates d JOIN highest h ON h.campaign_id = d.campaign_id
+        WHERE d.n > 1
+    )
+    UPDATE outreach_sequences s SET version = r.version
+    FROM renumbered r WHERE s.id = r.id
+    ''')
+    cur.execute('''
+    UPDATE campaigns c
+    SET latest_sequence_id = s.id, latest_version = COALESCE(s.version, 1)
+    FROM (
+        SELECT DISTINCT ON (campaign_id) id, campaign_id, version
+        FROM outreach_sequences
+        ORDER BY campaign_id, version DESC, created_at DESC, id DESC
+    ) s
+    WHERE s.campaign_id = c.id
+    ''')
+    cur.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS outreach_sequences_campaign_version_key
+        ON outreach_sequences (campaign_id, version) WHERE version > 1
+    ''')
+
+def _job_owners(cur):
+    # Who queued a job, to cap queued/running jobs per user
+    cur.execute('''
+    ALTER TABLE jobs ADD COLUMN IF NOT EXISTS owner VARCHAR(100)
+    ''')
+    cur.execute('''
+    CREATE INDEX IF NOT EXISTS jobs_owner_active_idx ON jobs (owner) WHERE status IN ('queued', 'running')
+    ''')
+
+def _job_retry_backoff(cur):
+    # Failed jobs are retried no earlier than run_after
+    cur.execute('''
+    ALTER TABLE jobs ADD COLUMN IF NOT EXISTS run_after TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    ''')
+    cur.execute('''
+    DROP INDEX IF EXISTS jobs_queued_idx
+    ''')
+    cur.execute('''
+    CREATE INDEX IF NOT EXISTS jobs_queued_run_after_idx ON jobs (run_after, id) WHERE status = 'queued'
+    ''')
+
+# (version, name, apply(cur)); append new migrations, never edit applied ones.
+# The early migrations are idempotent so databases created by the old
+# setup_database() DDL are adopted as-is.
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "conversation messages table", _conversation_messages),
+    (3, "conversation summary", _conversation_summary),
+    (4, "llm cache", _llm_cache),
+    (5, "jobs", _jobs),
+    (6, "hot query indexes", _hot_query_indexes),
+    (7, "conversation state and latest sequence pointer", _conversation_state),
+    (8, "sequence deltas", _sequence_deltas),
+    (9, "unique sequence versions", _unique_sequence_versions),
+    (10, "job owners", _job_owners),
+    (11, "job retry backoff", _job_retry_backoff),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def _create_migrations_table(cur):
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+def schema_version():
+    """Highest applied migration, or 0 for a database that was never migrated"""
+    with db_cursor() as cur:
+        cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL AS migrated")
+        if not cur.fetchone()['migrated']:
+            return 0
+        cur.execute("SELECT COALESCE(MAX(version), 0) AS version FROM schema_migrations")
+        return cur.fetchone()['version']
+
+def migrate():
+    """Apply pending migrations; returns the versions that were applied"""
+    applied = []
+    with db_cursor() as cur:
+        conn = cur.connection
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+        try:
+            _create_migrations_table(cur)
+            conn.commit()
+            # Read after taking the lock: another process may have just migrated
+            cur.execute("SELECT version FROM schema_migrations")
+            done = {row['version'] for row in cur.fetchall()}
+
+            for version, name, apply in MIGRATIONS:
+                if version in done:
+                    continue
+                try:
+                    apply(cur)
+                    cur.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                        (version, name)
+                    )
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                print(f"Applied migration {version}: {name}")
+                applied.append(version)
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+            conn.commit()
+    return applied
+
+def ensure_schema():
+    """
+    Cheap startup check that the database is at LATEST_VERSION
+
+    Pending migrations are applied when DB_AUTO_MIGRATE is True (the default,
+    convenient for local development); otherwise a warning is printed and the
+    deploy is expected to run `python -m models.migrations`.
+    """
+    version = schema_version()
+    if version >= LATEST_VERSION:
+        return version
+    if os.getenv('DB_AUTO_MIGRATE', 'True') == 'True':
+        migrate()
+        return LATEST_VERSION
+    print(f"Database schema is at version {version}, expected {LATEST_VERSION}; run `python -m models.migrations`")
+    return version
+
+if __name__ == '__main__':
+    applied = migrate()
+    print(f"Schema is at version {LATEST_VERSION} ({len(applied)} migration(s) applied)")
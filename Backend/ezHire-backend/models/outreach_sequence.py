@@ -0,0 +1,165 @@
+"""
+Typed outreach sequence
+
+Sequences travel as {"step1": {...}, "step2": {...}} dicts (API responses,
+JSONB rows, version deltas). SequenceStep and OutreachSequence pin the field
+names (channel, subject_line, timing, message_content), and canonical_json()
+gives the minified form that is stored and put into prompts.
+
+For generation, the model fills SEQUENCE_SCHEMA ({"steps": [...]}) through the
+provider's structured-output mode: strict JSON schemas cannot have
+open-ended step1..stepN keys, so the steps come back as an ordered array.
+"""
+import re
+import json
+
+FIELDS = ("channel", "subject_line", "timing", "message_content")
+
+# Field names models drift to, after lowercasing and joining words with "_"
+_ALIASES = {
+    "channel": "channel", "medium": "channel", "platform": "channel",
+    "subject_line": "subject_line", "subject": "subject_line", "subjectline": "subject_line",
+    "email_subject": "subject_line",
+    "timing": "timing", "delay": "timing", "when": "timing", "send_timing": "timing",
+    "message_content": "message_content", "message": "message_content", "content": "message_content",
+    "body": "message_content", "text": "message_content", "message_body": "message_content",
+}
+
+STEP_KEY = re.compile(r"^step[\s_-]*(\d+)$", re.IGNORECASE)
+_WRAPPERS = ("sequence", "steps", "outreach_sequence")
+
+STEP_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "channel": {"type": "string"},
+        "subject_line": {"type": ["string", "null"]},
+        "timing": {"type": "string"},
+        "message_content": {"type": "string"},
+    },
+    "required": list(FIELDS),
+    "additionalProperties": False,
+}
+
+SEQUENCE_SCHEMA = {
+    "type": "object",
+    "properties": {"steps": {"type": "array", "items": STEP_SCHEMA}},
+    "required": ["steps"],
+    "additionalProperties": False,
+}
+
+CAMPAIGN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        field: {"type": "string"}
+        for field in ("target_role", "industry", "company_values", "unique_selling_points")
+    },
+    "required": ["target_role", "industry", "company_values", "unique_selling_points"],
+    "additionalProperties": False,
+}
+
+REQUIREMENTS_SCHEMA = {
+    "type": "object",
+    "properties": {"campaign": CAMPAIGN_SCHEMA, "sequence": SEQUENCE_SCHEMA},
+    "required": ["campaign", "sequence"],
+    "additionalProperties": False,
+}
+
+def canonical_json(value):
+    """Minified JSON with keys in their given order"""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+def _field_name(key):
+    return _ALIASES.get(re.sub(r"[\s_-]+", "_", str(key).strip().lower()))
+
+def normalize_sequence(value, keys=None):
+    """
+    Bring common variants into the step1..stepN shape
+
+    Unwraps {"sequence": ...} / {"steps": [...]} (also nested, as in
+    structured output), turns a list of steps into step1..stepN, or into
+    `keys` when exactly that many steps came back, and renames keys like
+    "Step 1" or "step_1".
+    """
+    while isinstance(value, dict) and not any(STEP_KEY.match(str(key).strip()) for key in value):
+        wrapper = next((name for name in _WRAPPERS if isinstance(value.get(name), (dict, list))), None)
+        if wrapper is None:
+            break
+        value = value[wrapper]
+    if isinstance(value, list):
+        names = keys if keys and len(keys) == len(value) else [f"step{n}" for n in range(1, len(value) + 1)]
+        return dict(zip(names, value))
+    if not isinstance(value, dict):
+        return value
+    normalized = {}
+    for key, step in value.items():
+        match = STEP_KEY.match(str(key).strip())
+        normalized[f"step{int(match.group(1))}" if match else key] = step
+    return normalized
+
+class SequenceStep:
+    """One touch of a sequence"""
+    __slots__ = FIELDS
+
+    def __init__(self, channel, message_content, timing=None, subject_line=None):
+        self.channel = channel
+        self.subject_line = subject_line or None
+        self.timing = timing
+        self.message_content = message_content
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a step from model output, mapping drifted field names onto the stable ones"""
+        fields = {}
+        # Exact field names win over aliases
+        for key, value in sorted(data.items(), key=lambda item: item[0] not in FIELDS):
+            name = _field_name(key)
+            if name and name not in fields:
+                fields[name] = value.strip() if isinstance(value, str) else value
+        return cls(
+            channel=fields.get("channel"),
+            message_content=fields.get("message_content"),
+            timing=fields.get("timing"),
+            subject_line=fields.get("subject_line"),
+        )
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in FIELDS if getattr(self, field) is not None}
+
+class OutreachSequence:
+    """Ordered steps of an outreach sequence"""
+    __slots__ = ("steps",)
+
+    def __init__(self, steps):
+        self.steps = list(steps)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build from a step1..stepN dict, a {"steps": [...]} object or a list of steps"""
+        data = normalize_sequence(data)
+        keys = sorted((key for key in data if key.startswith("step") and key[4:].isdigit()), key=lambda k: int(k[4:]))
+        return cls(SequenceStep.from_dict(data[key]) for key in keys if isinstance(data[key], dict))
+
+    def __len__(self):
+        return len(self.steps)
+
+    def to_dict(self):
+        return {f"step{n}": step.to_dict() for n, step in enumerate(self.steps, 1)}
+
+    def to_json(self):
+        return canonical_json(self.to_dict())
+
+def canonical_steps(value, keys):
+    """Only the given step keys of a normalized sequence, each canonicalized (for partial edits)"""
+    if not isinstance(value, dict):
+        return value
+    return {key: SequenceStep.from_dict(value[key]).to_dict() for key in keys if isinstance(value.get(key), dict)}
+
+def canonical_sequence(data):
+    """A sequence dict in canonical form; error results pass through unchanged"""
+    if not isinstance(data, dict) or "error" in data:
+        return data
+    return OutreachSequence.from_dict(data).to_dict()
+
+def response_format(name, schema):
+    """OpenAI response_format for structured outputs constrained to schema"""
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
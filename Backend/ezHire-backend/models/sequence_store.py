@@ -0,0 +1,139 @@
+"""
+Delta storage for outreach sequence versions
+
+A version row is either a full snapshot (sequence_data set) or a JSON patch
+(RFC 6902 add/remove/replace operations) against a snapshot (base_id +
+patch). Patches are always taken against the snapshot, never chained, so any
+version is rebuilt from at most two rows fetched with one join. A new
+snapshot is written when the patch grows past a fraction of the full
+document or the version has drifted too far from its snapshot.
+"""
+import os
+import json
+from models.outreach_sequence import canonical_json
+
+SNAPSHOT_EVERY = int(os.getenv('SEQUENCE_SNAPSHOT_EVERY', 10))
+SNAPSHOT_RATIO = float(os.getenv('SEQUENCE_SNAPSHOT_RATIO', 0.5))
+
+# Columns and join that every reader of sequence versions selects; pass the
+# rows through materialize() to get sequence_data back
+SEQUENCE_COLUMNS = """s.id, s.campaign_id, s.version, s.created_at, s.base_id, s.patch,
+    COALESCE(b.sequence_data, s.sequence_data) AS snapshot_data,
+    COALESCE(b.version, s.version) AS snapshot_version"""
+BASE_JOIN = "LEFT JOIN outreach_sequences b ON b.id = s.base_id"
+
+def _escape(key):
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+def _unescape(token):
+    return token.replace("~1", "/").replace("~0", "~")
+
+def diff(old, new, path=""):
+    """JSON patch operations turning old into new (objects are diffed key by key)"""
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            if key not in old:
+                ops.append({"op": "add", "path": f"{path}/{_escape(key)}", "value": value})
+            elif old[key] != value:
+                ops.extend(diff(old[key], value, f"{path}/{_escape(key)}"))
+        return ops
+    if old == new:
+        return []
+    return [{"op": "replace", "path": path, "value": new}]
+
+def apply_patch(document, patch):
+    """Apply diff() output to a copy of document"""
+    document = json.loads(json.dumps(document))
+    for op in patch:
+        if op["path"] == "":
+            document = op.get("value")
+            continue
+        tokens = [_unescape(token) for token in op["path"].split("/")[1:]]
+        parent = document
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        key = int(tokens[-1]) if isinstance(parent, list) else tokens[-1]
+        if op["op"] == "remove":
+            del parent[key]
+        elif op["op"] == "add" and isinstance(parent, list):
+            parent.insert(key, op["value"])
+        else:
+            parent[key] = op["value"]
+    return document
+
+def _loads(value):
+    return json.loads(value) if isinstance(value, str) else value
+
+def materialize(row):
+    """Rebuild sequence_data for a row selected with SEQUENCE_COLUMNS"""
+    if row is None:
+        return None
+    row = dict(row)
+    snapshot = _loads(row.pop('snapshot_data'))
+    patch = _loads(row.pop('patch'))
+    row['sequence_data'] = apply_patch(snapshot, patch) if patch else snapshot
+    return row
+
+def version_values(parent, sequence, version):
+    """
+    (sequence_data, base_id, patch) to store `sequence` as an edit of `parent`
+
+    parent is a row selected with SEQUENCE_COLUMNS (before materialize()).
+    Returns a snapshot (sequence, None, None) or a delta (None, base_id, patch).
+    """
+    snapshot_id = parent['base_id'] or parent['id']
+    snapshot = _loads(parent['snapshot_data'])
+    patch = diff(snapshot, sequence)
+    too_far = version - (parent['snapshot_version'] or 1) >= SNAPSHOT_EVERY
+    too_big = len(json.dumps(patch)) > SNAPSHOT_RATIO * len(json.dumps(sequence))
+    if too_far or too_big or not isinstance(sequence, dict):
+        return sequence, None, None
+    return None, snapshot_id, patch
+
+def _next_version(parent, latest_version):
+    # Editing an older version still creates the newest one
+    return max(parent['version'] or 1, latest_version or 0) + 1
+
+def store_version(cur, parent, sequence):
+    """
+    Insert `sequence` as the newest version of parent's campaign; returns (id, version)
+
+    The version number is taken under a lock on the campaign row, in the
+    caller's transaction, so concurrent edits of one campaign get distinct
+    versions. parent is a row selected with SEQUENCE_COLUMNS.
+    """
+    latest_version = None
+    if parent['campaign_id'] is not None:
+        cur.execute("SELECT latest_version FROM campaigns WHERE id = %s FOR UPDATE", (parent['campaign_id'],))
+        row = cur.fetchone()
+        latest_version = row['latest_version'] if row else None
+    version = _next_version(parent, latest_version)
+    sequence_data, base_id, patch = version_values(parent, sequence, version)
+    cur.execute(
+        "INSERT INTO outreach_sequences (campaign_id, sequence_data, version, base_id, patch) VALUES (%s, %s, %s, %s, %s) RETURNING id",
+        (parent['campaign_id'], canonical_json(sequence_data) if sequence_data is not None else None,
+         version, base_id, canonical_json(patch) if patch is not None else None)
+    )
+    return cur.fetchone()['id'], version
+
+async def astore_version(conn, parent, sequence):
+    """
+    store_version() on an asyncpg connection; call inside a transaction
+
+    sequence_data and patch are passed as objects: adb_connection()'s JSON
+    codec encodes them with canonical_json, like store_version() does.
+    """
+    latest_version = None
+    if parent['campaign_id'] is not None:
+        latest_version = await conn.fetchval("SELECT latest_version FROM campaigns WHERE id = $1 FOR UPDATE", parent['campaign_id'])
+    version = _next_version(parent, latest_version)
+    sequence_data, base_id, patch = version_values(parent, sequence, version)
+    sequence_id = await conn.fetchval(
+        "INSERT INTO outreach_sequences (campaign_id, sequence_data, version, base_id, patch) VALUES ($1, $2, $3, $4, $5) RETURNING id",
+        parent['campaign_id'], sequence_data, version, base_id, patch
+    )
+    return sequence_id, version
@@ -1,33 +1,277 @@
 import os
-import pinecone
-from pinecone import Pinecone
+import json
+import hashlib
+import threading
+import numpy as np
 from dotenv import load_dotenv
+from agents.llm_backends import embeddings
+from agents.tracing import span
 
 load_dotenv()
 
 def initialize_pinecone():
+    # Optional backend; only imported when VECTOR_STORE=pinecone
+    from pinecone import Pinecone
+
     pc = Pinecone(
         api_key=os.getenv('PINECONE_API_KEY')
     )
-    
+
     index_name = "helix"
     if index_name not in pc.list_indexes():
         pc.create_index(
             name=index_name,
-            dimension=1536, 
+            dimension=1536,
             metric="cosine"
         )
-    
+
     return pc.Index(index_name)
 
-def store_hr_knowledge(index, texts, metadatas=None):
+def _matches(metadata, filter):
+    """Pinecone-style metadata filter: {"key": value} or {"key": {"$in": [...]}} etc."""
+    for key, condition in filter.items():
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, expected in condition.items():
+            if op == "$eq" and value != expected:
+                return False
+            if op == "$ne" and value == expected:
+                return False
+            if op == "$in" and value not in expected:
+                return False
+            if op == "$nin" and value in expected:
+                return False
+            if op in ("$gt", "$gte", "$lt", "$lte"):
+                if value is None:
+                    return False
+                if op == "$gt" and not value > expected:
+                    return False
+                if op == "$gte" and not value >= expected:
+                    return False
+                if op == "$lt" and not value < expected:
+                    return False
+                if op == "$lte" and not value <= expected:
+                    return False
+    return True
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class LocalVectorIndex:
+    """
+    In-process vector index with cosine similarity
+
+    Vectors are L2-normalized and kept in one float32 matrix, so a query is a
+    single matrix-vector product followed by a partial sort. With a path, the
+    index is saved as <path>.npy (vectors) and <path>.json (ids, metadata);
+    loading memory-maps the vectors and copies them only on the first write.
+    """
+    def __init__(self, dimension=None, path=None, mmap=True):
+        self.dimension = dimension
+        self.path = path
+        self._lock = threading.RLock()
+        self._matrix = np.zeros((0, dimension or 0), dtype=np.float32)
+        self._size = 0
+        self.ids = []
+        self.metadatas = []
+        self._rows = {}
+        if path and os.path.exists(f"{path}.npy"):
+            self.load(path, mmap=mmap)
+
+    def __len__(self):
+        return self._size
+
+    def _reserve(self, size):
+        """Make room for `size` rows in a writable matrix"""
+        capacity = self._matrix.shape[0]
+        if capacity >= size and self._matrix.flags.writeable:
+            return
+        matrix = np.zeros((max(size, capacity * 2, 64), self.dimension), dtype=np.float32)
+        if self._size:
+            # The initial matrix of an index without a dimension yet is (0, 0)
+            matrix[:self._size] = self._matrix[:self._size]
+        self._matrix = matrix
+
+    def upsert(self, ids, vectors, metadatas=None):
+        """Insert or replace vectors by id"""
+        if not ids:
+            return 0
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1))
+        metadatas = metadatas or [{} for _ in ids]
+
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = vectors.shape[1]
+            if vectors.shape[1] != self.dimension:
+                raise ValueError(f"Expected vectors of dimension {self.dimension}, got {vectors.shape[1]}")
+            self._reserve(self._size + len(ids))
+
+            rows = []
+            for id, metadata in zip(ids, metadatas):
+                row = self._rows.get(id)
+                if row is None:
+                    row = self._size
+                    self._size += 1
+                    self._rows[id] = row
+                    self.ids.append(id)
+                    self.metadatas.append(metadata)
+                else:
+                    self.metadatas[row] = metadata
+                rows.append(row)
+            self._matrix[rows] = vectors
+        return len(ids)
+
+    def existing(self, ids):
+        """The subset of ids already stored"""
+        with self._lock:
+            return {id for id in ids if id in self._rows}
+
+    def delete(self, ids):
+        """Remove vectors by id (the last row is moved into the freed slot)"""
+        with self._lock:
+            for id in ids:
+                row = self._rows.pop(id, None)
+                if row is None:
+                    continue
+                self._reserve(self._size)
+                last = self._size - 1
+                if row != last:
+                    self._matrix[row] = self._matrix[last]
+                    self.ids[row] = self.ids[last]
+                    self.metadatas[row] = self.metadatas[last]
+                    self._rows[self.ids[row]] = row
+                self.ids.pop()
+                self.metadatas.pop()
+                self._size -= 1
+
+    def query(self, vector, top_k=5, filter=None):
+        """Top-k matches by cosine similarity as [{"id", "score", "metadata"}], best first"""
+        query = _normalize(np.asarray(vector, dtype=np.float32).ravel())
+        with self._lock:
+            size = self._size
+            if size == 0 or top_k <= 0:
+                return []
+            scores = self._matrix[:size] @ query
+            candidates = size
+            if filter:
+                mask = np.fromiter((_matches(metadata, filter) for metadata in self.metadatas[:size]), dtype=bool, count=size)
+                candidates = int(mask.sum())
+                scores = np.where(mask, scores, -np.inf)
+            k = min(top_k, candidates)
+            if k == 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [{"id": self.ids[i], "score": float(scores[i]), "metadata": self.metadatas[i]} for i in top]
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path:
+            raise ValueError("No path to save the index to")
+        with self._lock:
+            # Write to temporary files first so readers never see a half-written index
+            np.save(f"{path}.tmp.npy", self._matrix[:self._size])
+            with open(f"{path}.tmp.json", "w") as f:
+                json.dump({"dimension": self.dimension, "ids": self.ids, "metadatas": self.metadatas}, f)
+            os.replace(f"{path}.tmp.npy", f"{path}.npy")
+            os.replace(f"{path}.tmp.json", f"{path}.json")
+
+    def load(self, path, mmap=True):
+        with open(f"{path}.json") as f:
+            data = json.load(f)
+        with self._lock:
+            self._matrix = np.load(f"{path}.npy", mmap_mode='r' if mmap else None)
+            self._size = self._matrix.shape[0]
+            self.dimension = data["dimension"]
+            self.ids = data["ids"]
+            self.metadatas = data["metadatas"]
+            self._rows = {id: row for row, id in enumerate(self.ids)}
+
+    def stats(self):
+        return {
+            "vectors": self._size,
+            "dimension": self.dimension,
+            "memory_mapped": isinstance(self._matrix, np.memmap),
+        }
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_knowledge_index():
+    """
+    Process-wide HR knowledge index
+
+    VECTOR_STORE=local (default) uses LocalVectorIndex, persisted at
+    VECTOR_STORE_PATH when set; VECTOR_STORE=pinecone uses Pinecone.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                if os.getenv('VECTOR_STORE', 'local') == 'pinecone':
+                    _index = initialize_pinecone()
+                else:
+                    _index = LocalVectorIndex(path=os.getenv('VECTOR_STORE_PATH') or None)
+    return _index
+
+def content_id(text):
+    """Stable id for a piece of knowledge, so storing the same text twice is idempotent"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def existing_knowledge_ids(index, ids):
+    """Ids already present in the index (local or Pinecone)"""
+    if not ids:
+        return set()
+    if isinstance(index, LocalVectorIndex):
+        return index.existing(ids)
+    return set(index.fetch(ids=list(ids)).vectors.keys())
+
+def store_hr_knowledge(index, texts, metadatas=None, ids=None, embedder=None, vectors=None, persist=True):
     """
-    Store HR knowledge in Pinecone
+    Store HR knowledge in the vector index (local or Pinecone)
+
+    Texts are embedded unless precomputed vectors are passed; each text is
+    kept in its metadata under "text". Returns the ids that were stored.
     """
-    pass
+    if not texts:
+        return []
+    metadatas = [dict(metadata or {}, text=text) for metadata, text in zip(metadatas or [None] * len(texts), texts)]
+    ids = ids or [content_id(text) for text in texts]
+    if vectors is None:
+        vectors = (embedder or embeddings()).embed_documents(texts)
 
-def query_hr_knowledge(index, query, top_k=5):
+    if isinstance(index, LocalVectorIndex):
+        index.upsert(ids, vectors, metadatas)
+        if persist and index.path:
+            index.save()
+    else:
+        index.upsert(vectors=[
+            {"id": id, "values": list(vector), "metadata": metadata}
+            for id, vector, metadata in zip(ids, vectors, metadatas)
+        ])
+    return ids
+
+def query_hr_knowledge(index, query, top_k=5, filter=None, embedder=None, vector=None):
     """
-    Query HR knowledge from Pinecone
+    Query HR knowledge from the vector index (local or Pinecone)
+
+    Returns [{"id", "score", "text", "metadata"}], best match first.
     """
-    pass
+    if isinstance(index, LocalVectorIndex) and len(index) == 0:
+        return []
+    if vector is None:
+        with span("embedding", "query"):
+            vector = (embedder or embeddings()).embed_query(query)
+
+    if isinstance(index, LocalVectorIndex):
+        with span("vector", "local"):
+            matches = index.query(vector, top_k=top_k, filter=filter)
+    else:
+        with span("vector", "pinecone"):
+            result = index.query(vector=list(vector), top_k=top_k, filter=filter, include_metadata=True)
+        matches = [{"id": m["id"], "score": m["score"], "metadata": m.get("metadata") or {}} for m in result["matches"]]
+
+    return [dict(match, text=match["metadata"].get("text", "")) for match in matches]
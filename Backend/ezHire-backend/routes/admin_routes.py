@@ -0,0 +1,48 @@
+import os
+import hmac
+from functools import wraps
+from flask import Blueprint, request, jsonify
+from agents.debug_trace import get_debug_trace
+
+admin_bp = Blueprint('admin', __name__)
+
+MAX_TRACE_RECORDS = 1000
+
+def admin_only(view):
+    """Require ADMIN_TOKEN in the X-Admin-Token header; without ADMIN_TOKEN the endpoint does not exist"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = os.getenv('ADMIN_TOKEN')
+        if not token:
+            return jsonify({"error": "Not found"}), 404
+        if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token):
+            return jsonify({"error": "Forbidden"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+@admin_bp.route('/admin/debug-traces', methods=['GET'])
+@admin_only
+def get_debug_traces():
+    """Recent debug records (LLM prompts/responses, parses, routing), newest first
+
+    Query parameters:
+    - limit: number of records (default 100, 1 to 1000)
+    - request_id: only records of this request (see the X-Request-ID response header)
+    - kind: only records of this kind, e.g. llm, parse, route, turn
+    """
+    try:
+        limit = max(1, min(int(request.args.get('limit', 100)), MAX_TRACE_RECORDS))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    buffer = get_debug_trace()
+    return jsonify({
+        "records": buffer.recent(limit, request_id=request.args.get('request_id'), kind=request.args.get('kind')),
+        "stats": buffer.stats(),
+    })
+
+@admin_bp.route('/admin/debug-traces', methods=['DELETE'])
+@admin_only
+def clear_debug_traces():
+    get_debug_trace().clear()
+    return jsonify({"cleared": True})
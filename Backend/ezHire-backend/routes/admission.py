@@ -0,0 +1,47 @@
+from functools import wraps
+from flask import request, jsonify, make_response
+from agents.admission import AdmissionRejected, get_admission_controller
+
+def admission_key():
+    """Whom a request counts against: its user_id, the X-User-ID header, or the client address"""
+    data = request.get_json(silent=True) or {}
+    return str(data.get('user_id') or request.headers.get('X-User-ID') or request.remote_addr)
+
+def too_many_requests(error):
+    response = jsonify({"error": str(error), "reason": error.reason, "retry_after": error.retry_after})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+def admission_controlled(when=None):
+    """
+    Run the view only once the admission controller grants a slot, or return 429
+
+    Streamed responses keep the slot until the stream is closed. With `when`,
+    only requests for which it returns True are admission controlled (e.g.
+    the ?sync=true path of endpoints that otherwise just queue a job).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            controller = get_admission_controller()
+            if not controller.enabled or (when is not None and not when()):
+                return view(*args, **kwargs)
+
+            user_id = admission_key()
+            try:
+                admitted_at = controller.acquire(user_id)
+            except AdmissionRejected as e:
+                return too_many_requests(e)
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                controller.release(user_id, admitted_at)
+                raise
+            if response.is_streamed:
+                response.call_on_close(lambda: controller.release(user_id, admitted_at))
+            else:
+                controller.release(user_id, admitted_at)
+            return response
+        return wrapper
+    return decorator
@@ -1,9 +1,43 @@
 from flask import Blueprint, request, jsonify
-from agents.app_manager import HROutreachManager
-from models.database import get_db_connection
+from agents.registry import get_outreach_manager
+from agents.job_queue import JobLimitReached, get_job_queue
+from models.database import db_cursor
+from models.sequence_store import BASE_JOIN, materialize
+from routes.sse import sse_response
+from routes.admission import admission_controlled, admission_key
+from routes.pagination import PaginationError, page_limit, encode_cursor, decode_cursor, selected_fields
 
 campaign_bp = Blueprint('campaign', __name__)
-outreach_manager = HROutreachManager()
+
+MAX_BATCH_SIZE = 100
+CAMPAIGN_FIELDS = ("id", "user_id", "name", "description", "target_role", "industry", "created_at", "updated_at")
+SEQUENCE_FIELDS = ("id", "campaign_id", "sequence_data", "version", "created_at")
+# Retry-After when a user already has JOB_USER_MAX_ACTIVE jobs queued or running
+JOB_LIMIT_RETRY_AFTER = 30
+
+job_queue = get_job_queue()
+job_queue.register("generate_sequence", lambda payload: get_outreach_manager().generate_campaign_sequence(**payload))
+job_queue.register("edit_sequence", lambda payload: get_outreach_manager().edit_sequence(**payload))
+
+def _run_sync():
+    """?sync=true keeps the old blocking behaviour of the generate/edit endpoints"""
+    return request.args.get('sync', 'false').lower() == 'true'
+
+def _error_status(result):
+    """404 for a missing campaign or sequence, 502 when the model output could not be used"""
+    return 404 if str(result["error"]).endswith("not found") else 502
+
+def _enqueue(kind, payload):
+    try:
+        job_id = job_queue.enqueue(kind, payload, owner=admission_key())
+    except JobLimitReached as e:
+        response = jsonify({"error": str(e), "reason": "job_limit", "retry_after": JOB_LIMIT_RETRY_AFTER})
+        return response, 429, {"Retry-After": str(JOB_LIMIT_RETRY_AFTER)}
+    return jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/jobs/{job_id}"
+    }), 202
 
 @campaign_bp.route('/campaigns', methods=['POST'])
 def create_campaign():
@@ -17,7 +51,7 @@ def create_campaign():
     if not all([user_id, name]):
         return jsonify({"error": "Missing required fields"}), 400
     
-    result = outreach_manager.create_campaign(
+    result = get_outreach_manager().create_campaign(
         user_id=user_id,
         name=name,
         description=description,
@@ -28,65 +62,148 @@ def create_campaign():
     return jsonify(result)
 
 @campaign_bp.route('/campaigns/<int:campaign_id>/sequence', methods=['POST'])
+@admission_controlled(when=_run_sync)
 def generate_sequence(campaign_id):
+    """Queue sequence generation and return a job id (use ?sync=true to wait for the result)"""
     data = request.json
-    
-    result = outreach_manager.generate_campaign_sequence(
-        campaign_id=campaign_id,
-        additional_info={
+    payload = {
+        "campaign_id": campaign_id,
+        "additional_info": {
             "company_values": data.get('company_values'),
             "unique_selling_points": data.get('unique_selling_points')
-        }
-    )
+        },
+        "use_cache": data.get('use_cache', True)
+    }
+
+    if not _run_sync():
+        return _enqueue("generate_sequence", payload)
+    
+    result = get_outreach_manager().generate_campaign_sequence(**payload)
     
     if "error" in result:
-        return jsonify(result), 404
+        return jsonify(result), _error_status(result)
         
     return jsonify(result)
 
+@campaign_bp.route('/campaigns/sequences/batch', methods=['POST'])
+def generate_sequences_batch():
+    """Generate sequences for several campaigns at once (each generation takes its own admission slot)"""
+    data = request.json or {}
+    campaign_ids = data.get('campaign_ids')
+
+    if not campaign_ids or not isinstance(campaign_ids, list):
+        return jsonify({"error": "campaign_ids must be a non-empty list"}), 400
+    if len(campaign_ids) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"At most {MAX_BATCH_SIZE} campaigns per batch"}), 400
+    try:
+        campaign_ids = [int(campaign_id) for campaign_id in campaign_ids]
+    except (TypeError, ValueError):
+        return jsonify({"error": "campaign_ids must be integers"}), 400
+    try:
+        max_concurrency = int(data['max_concurrency']) if data.get('max_concurrency') is not None else None
+        max_retries = int(data['max_retries']) if data.get('max_retries') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "max_concurrency and max_retries must be integers"}), 400
+
+    result = get_outreach_manager().generate_campaign_sequences_batch(
+        campaign_ids=campaign_ids,
+        additional_info=data.get('additional_info'),
+        max_concurrency=max_concurrency,
+        max_retries=max_retries,
+        use_cache=data.get('use_cache', True),
+        admission_key=admission_key()
+    )
+
+    return jsonify(result)
+
+@campaign_bp.route('/campaigns/<int:campaign_id>/sequence/stream', methods=['POST'])
+@admission_controlled()
+def generate_sequence_stream(campaign_id):
+    """Same as generate_sequence, streamed as server-sent events (token, step, done)"""
+    data = request.json or {}
+
+    return sse_response(get_outreach_manager().stream_campaign_sequence(
+        campaign_id=campaign_id,
+        additional_info={
+            "company_values": data.get('company_values'),
+            "unique_selling_points": data.get('unique_selling_points')
+        },
+        use_cache=data.get('use_cache', True)
+    ))
+
 @campaign_bp.route('/sequences/<int:sequence_id>/edit', methods=['POST'])
+@admission_controlled(when=_run_sync)
 def edit_sequence(sequence_id):
+    """Queue a sequence edit and return a job id (use ?sync=true to wait for the result)"""
     data = request.json
     edit_instructions = data.get('edit_instructions')
     
     if not edit_instructions:
         return jsonify({"error": "Missing edit instructions"}), 400
+
+    payload = {
+        "sequence_id": sequence_id,
+        "edit_instructions": edit_instructions
+    }
+
+    if not _run_sync():
+        return _enqueue("edit_sequence", payload)
     
-    result = outreach_manager.edit_sequence(
-        sequence_id=sequence_id,
-        edit_instructions=edit_instructions
-    )
+    result = get_outreach_manager().edit_sequence(**payload)
     
     if "error" in result:
-        return jsonify(result), 404
+        return jsonify(result), _error_status(result)
         
     return jsonify(result)
 
 @campaign_bp.route('/campaigns', methods=['GET'])
 def get_campaigns():
-    """Get all campaigns for a user"""
+    """Get a user's campaigns, newest first
+
+    Query parameters:
+    - limit: number of campaigns per page (default 50, max 200)
+    - after: cursor from a previous page's next_cursor
+    - fields: comma-separated columns to return (id and created_at are always included)
+    """
     user_id = request.args.get('user_id')
     
     if not user_id:
         return jsonify({"error": "Missing user_id parameter"}), 400
+
+    try:
+        limit = page_limit()
+        after = decode_cursor(2)
+        fields = selected_fields(CAMPAIGN_FIELDS, required=("id", "created_at"))
+        after_created_at, after_id = after if after else (None, None)
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
         
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute("SELECT * FROM campaigns WHERE user_id = %s ORDER BY created_at DESC", (user_id,))
-    campaigns = cur.fetchall()
-    
-    cur.close()
-    conn.close()
+    with db_cursor() as cur:
+        # Fetch one extra row to know whether another page exists
+        cur.execute(
+            f"""
+            SELECT {", ".join(fields)} FROM campaigns
+            WHERE user_id = %s AND (%s::TIMESTAMP IS NULL OR (created_at, id) < (%s::TIMESTAMP, %s))
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s
+            """,
+            (user_id, after_created_at, after_created_at, after_id, limit + 1)
+        )
+        rows = cur.fetchall()
+
+    has_more = len(rows) > limit
+    campaigns = rows[:limit]
     
     return jsonify({
-        "campaigns": campaigns
+        "campaigns": campaigns,
+        "has_more": has_more,
+        "next_cursor": encode_cursor(campaigns[-1]['created_at'], campaigns[-1]['id']) if has_more else None
     })
 
 @campaign_bp.route('/campaigns/<int:campaign_id>', methods=['GET'])
 def get_campaign(campaign_id):
     """Get a specific campaign"""
-    campaign = outreach_manager._get_campaign(campaign_id)
+    campaign = get_outreach_manager()._get_campaign(campaign_id)
     
     if not campaign:
         return jsonify({"error": "Campaign not found"}), 404
@@ -95,16 +212,66 @@ def get_campaign(campaign_id):
 
 @campaign_bp.route('/campaigns/<int:campaign_id>/sequences', methods=['GET'])
 def get_campaign_sequences(campaign_id):
-    """Get all sequences for a campaign"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute("SELECT * FROM outreach_sequences WHERE campaign_id = %s ORDER BY version", (campaign_id,))
-    sequences = cur.fetchall()
-    
-    cur.close()
-    conn.close()
+    """Get a campaign's sequence versions, oldest first
+
+    Query parameters:
+    - limit: number of versions per page (default 50, max 200)
+    - after: cursor from a previous page's next_cursor
+    - fields: comma-separated columns to return, e.g. fields=id,version,created_at
+      to leave out sequence_data (id, version and created_at are always included)
+    - latest: true to return only the newest version
+    """
+    latest = request.args.get('latest', 'false').lower() == 'true'
+    try:
+        limit = 1 if latest else page_limit()
+        after = None if latest else decode_cursor(3)
+        fields = selected_fields(SEQUENCE_FIELDS, required=("id", "version", "created_at"))
+        after_version, after_created_at, after_id = after if after else (None, None, None)
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Delta versions are rebuilt from their snapshot; skip the join when
+    # sequence_data is not requested
+    columns = [f"s.{field}" for field in fields if field != "sequence_data"]
+    with_data = "sequence_data" in fields
+    if with_data:
+        columns += ["s.patch", "COALESCE(b.sequence_data, s.sequence_data) AS snapshot_data"]
+    base_join = BASE_JOIN if with_data else ""
+
+    with db_cursor() as cur:
+        if latest:
+            # Newest version through the campaign's maintained pointer
+            cur.execute(
+                f"""
+                SELECT {", ".join(columns)} FROM campaigns c
+                JOIN outreach_sequences s ON s.id = c.latest_sequence_id
+                {base_join}
+                WHERE c.id = %s
+                """,
+                (campaign_id,)
+            )
+        else:
+            cur.execute(
+                f"""
+                SELECT {", ".join(columns)} FROM outreach_sequences s
+                {base_join}
+                WHERE s.campaign_id = %s
+                  AND (%s::INTEGER IS NULL OR (s.version, s.created_at, s.id) > (%s::INTEGER, %s::TIMESTAMP, %s))
+                ORDER BY s.version, s.created_at, s.id
+                LIMIT %s
+                """,
+                (campaign_id, after_version, after_version, after_created_at, after_id, limit + 1)
+            )
+        rows = cur.fetchall()
+
+    if with_data:
+        rows = [materialize(row) for row in rows]
+
+    has_more = len(rows) > limit
+    sequences = rows[:limit]
     
     return jsonify({
-        "sequences": sequences
-    })
\ No newline at end of file
+        "sequences": sequences,
+        "has_more": has_more,
+        "next_cursor": encode_cursor(sequences[-1]['version'], sequences[-1]['created_at'], sequences[-1]['id']) if has_more else None
+    })
@@ -1,11 +1,16 @@
 from flask import Blueprint, request, jsonify
-from agents.app_manager import HROutreachManager
-from models.database import get_db_connection
+from agents.registry import get_outreach_manager, get_intent_router, get_semantic_cache
+from agents.conversation_state import ConversationState
+from models.database import db_cursor
+from routes.sse import sse_response
+from routes.admission import admission_controlled
+from routes.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
 chat_bp = Blueprint('chat', __name__)
-outreach_manager = HROutreachManager()
+
 
 @chat_bp.route('/chat', methods=['POST'])
+@admission_controlled()
 def chat():
     data = request.json
     user_id = data.get('user_id')
@@ -17,7 +22,7 @@ def chat():
         return jsonify({"error": "Missing required fields"}), 400
     
     # Use the centralized manager to handle the chat
-    result = outreach_manager.handle_chat(
+    result = get_outreach_manager().handle_chat(
         user_id=user_id,
         campaign_id=campaign_id,
         message=message,
@@ -26,29 +31,94 @@ def chat():
     
     return jsonify({
         "response": result["response"],
-        "conversation_id": result["conversation_id"]
+        "conversation_id": result["conversation_id"],
+        "usage": result["usage"]
     })
 
+@chat_bp.route('/chat/stream', methods=['POST'])
+@admission_controlled()
+def chat_stream():
+    """Same as /chat, streamed as server-sent events (route, token, done)"""
+    data = request.json
+    user_id = data.get('user_id')
+    campaign_id = data.get('campaign_id')
+    message = data.get('message')
+    conversation_id = data.get('conversation_id')
+    
+    if not all([user_id, message]):
+        return jsonify({"error": "Missing required fields"}), 400
+
+    return sse_response(get_outreach_manager().stream_chat(
+        user_id=user_id,
+        campaign_id=campaign_id,
+        message=message,
+        conversation_id=conversation_id
+    ))
+
 @chat_bp.route('/conversations/<int:conversation_id>', methods=['GET'])
 def get_conversation(conversation_id):
-    """Get conversation history"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute("SELECT * FROM conversations WHERE id = %s", (conversation_id,))
-    conversation = cur.fetchone()
-    
-    cur.close()
-    conn.close()
+    """Get conversation history, newest page first
+
+    Query parameters:
+    - limit: number of messages per page (default 50, max 200)
+    - before: cursor from a previous page's next_cursor to load older messages
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        before = request.args.get('before', type=int)
+    except ValueError:
+        return jsonify({"error": "Invalid limit parameter"}), 400
+
+    with db_cursor() as cur:
+        cur.execute(
+            """
+            SELECT id, user_id, campaign_id, message_count, active_campaign_id, last_sequence_id, last_sequence_version,
+                created_at, updated_at
+            FROM conversations WHERE id = %s
+            """,
+            (conversation_id,)
+        )
+        conversation = cur.fetchone()
+
+        if conversation:
+            # Fetch one extra row to know whether an older page exists
+            cur.execute(
+                """
+                SELECT seq, role, content, created_at
+                FROM conversation_messages
+                WHERE conversation_id = %s AND (%s::INTEGER IS NULL OR seq < %s)
+                ORDER BY seq DESC
+                LIMIT %s
+                """,
+                (conversation_id, before, before, limit + 1)
+            )
+            rows = cur.fetchall()
     
     if not conversation:
         return jsonify({"error": "Conversation not found"}), 404
+
+    has_more = len(rows) > limit
+    messages = list(reversed(rows[:limit]))
         
     return jsonify({
         "conversation_id": conversation['id'],
         "user_id": conversation['user_id'],
         "campaign_id": conversation['campaign_id'],
-        "messages": conversation['messages'],
+        "messages": messages,
+        "message_count": conversation['message_count'],
+        "state": ConversationState.from_row(conversation).as_dict(),
+        "has_more": has_more,
+        "next_cursor": messages[0]['seq'] if has_more else None,
         "created_at": conversation['created_at'],
         "updated_at": conversation['updated_at']
-    })
\ No newline at end of file
+    })
+
+@chat_bp.route('/chat/router-stats', methods=['GET'])
+def get_router_stats():
+    """How often the fast-path intent router skipped the routing LLM call"""
+    return jsonify(get_intent_router().stats())
+
+@chat_bp.route('/chat/cache-stats', methods=['GET'])
+def get_cache_stats():
+    """Hit rates of the semantic answer cache, per tool"""
+    return jsonify(get_semantic_cache().stats())
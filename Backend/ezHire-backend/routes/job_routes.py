@@ -0,0 +1,19 @@
+from flask import Blueprint, jsonify
+from agents.job_queue import get_job_queue
+
+job_bp = Blueprint('jobs', __name__)
+
+@job_bp.route('/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status and, once finished, result of a background job"""
+    job = get_job_queue().get(job_id)
+    
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+        
+    return jsonify(job)
+
+@job_bp.route('/jobs/stats', methods=['GET'])
+def get_job_stats():
+    """Job counts by status"""
+    return jsonify(get_job_queue().stats())
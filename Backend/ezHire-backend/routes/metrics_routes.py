@@ -0,0 +1,24 @@
+from flask import Blueprint, Response, g, request
+from agents.tracing import start_trace, end_trace, finish_request, render_metrics
+from models.database import pool_stats
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.before_app_request
+def start_request_trace():
+    g.trace_token = start_trace(request.headers.get('X-Request-ID'))
+
+@metrics_bp.after_app_request
+def finish_request_trace(response):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    response.headers.update(finish_request(request.method, endpoint, response.status_code, request.headers))
+    return response
+
+@metrics_bp.teardown_app_request
+def end_request_trace(exc):
+    end_trace(g.pop('trace_token', None))
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics: request latency, LLM/DB/parse spans, tokens and cost"""
+    return Response(render_metrics(pool_stats()), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,52 @@
+import json
+import base64
+from datetime import datetime
+from flask import request
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+class PaginationError(ValueError):
+    pass
+
+def page_limit():
+    """?limit= clamped to 1..MAX_PAGE_SIZE"""
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise PaginationError("Invalid limit parameter")
+    return min(max(limit, 1), MAX_PAGE_SIZE)
+
+def encode_cursor(*values):
+    """Opaque keyset cursor for the sort key of the last row on a page"""
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+def decode_cursor(size, name='after'):
+    """Decode ?after= back to its `size` sort-key values, or None when absent"""
+    cursor = request.args.get(name)
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError):
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise PaginationError(f"Invalid {name} cursor")
+    return values
+
+def selected_fields(allowed, required=("id",)):
+    """
+    Columns to select for ?fields=a,b,c
+
+    Unknown names are rejected; the columns in `required` are always
+    included because the cursor is built from them.
+    """
+    fields = request.args.get('fields')
+    if not fields:
+        return list(allowed)
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise PaginationError(f"Unknown fields: {', '.join(unknown)}")
+    return [name for name in allowed if name in names or name in required]
@@ -0,0 +1,25 @@
+import json
+from flask import Response, stream_with_context
+
+def format_sse(event, data):
+    """Encode one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def sse_response(events):
+    """Stream an iterable of {"event": ..., "data": ...} dicts as text/event-stream"""
+    def generate():
+        try:
+            for event in events:
+                yield format_sse(event["event"], event["data"])
+        except Exception as e:
+            yield format_sse("error", {"error": str(e)})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            "Cache-Control": "no-cache",
+            # Stop nginx from buffering the stream
+            "X-Accel-Buffering": "no"
+        }
+    )
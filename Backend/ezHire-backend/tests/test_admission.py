@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import pytest
+
+from agents.admission import AdmissionController, AdmissionRejected
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setenv('ADMISSION_ENABLED', 'True')
+
+def _controller(**kwargs):
+    settings = dict(max_concurrency=2, user_concurrency=1, queue_size=2, user_queue_size=1, queue_timeout=1)
+    settings.update(kwargs)
+    return AdmissionController(**settings)
+
+def _acquire_in_thread(controller, user_id, timeout=None):
+    """Start a blocking acquire(); returns (thread, outcome) where outcome gets "admitted" or the rejection"""
+    outcome = []
+
+    def run():
+        try:
+            controller.acquire(user_id, timeout)
+            outcome.append("admitted")
+        except AdmissionRejected as e:
+            outcome.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, outcome
+
+def _wait_for_queue(controller, depth):
+    for _ in range(200):
+        if controller.stats()["queue_depth"] == depth:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError(f"queue never reached depth {depth}")
+
+def test_free_slots_are_granted_immediately():
+    controller = _controller()
+    controller.acquire("alice")
+    controller.acquire("bob")
+    stats = controller.stats()
+    assert stats["in_flight"] == 2
+    assert stats["users_in_flight"] == 2
+    assert stats["admitted"] == 2
+
+def test_user_over_its_limit_waits_for_its_own_slot():
+    controller = _controller()
+    controller.acquire("alice")
+    thread, outcome = _acquire_in_thread(controller, "alice")
+    _wait_for_queue(controller, 1)
+    # Another user is not held up by alice's queued request
+    controller.acquire("bob")
+    assert outcome == []
+
+    controller.release("alice")
+    thread.join(1)
+    assert outcome == ["admitted"]
+    assert controller.stats()["in_flight"] == 2
+
+def test_full_user_queue_is_rejected_straight_away():
+    controller = _controller()
+    controller.acquire("alice")
+    thread, _ = _acquire_in_thread(controller, "alice")
+    _wait_for_queue(controller, 1)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire("alice")
+    assert rejected.value.reason == "user_queue_full"
+    assert rejected.value.retry_after >= 1
+    controller.release("alice")
+    thread.join(1)
+
+def test_full_queue_is_rejected():
+    controller = _controller(max_concurrency=1, queue_size=1)
+    controller.acquire("alice")
+    thread, _ = _acquire_in_thread(controller, "bob")
+    _wait_for_queue(controller, 1)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire("carol")
+    assert rejected.value.reason == "queue_full"
+    controller.release("alice")
+    thread.join(1)
+
+def test_wait_times_out_with_retry_after():
+    controller = _controller()
+    controller.acquire("alice")
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire("alice", timeout=0.05)
+    assert rejected.value.reason == "timeout"
+    assert rejected.value.retry_after >= 1
+    stats = controller.stats()
+    assert stats["queue_depth"] == 0
+    assert stats["rejected"] == 1
+
+def test_released_slot_goes_to_the_first_waiter_under_its_limit():
+    controller = _controller(max_concurrency=2, user_concurrency=2, user_queue_size=2, queue_size=4)
+    controller.acquire("alice")
+    controller.acquire("alice")
+    first, first_outcome = _acquire_in_thread(controller, "alice")
+    _wait_for_queue(controller, 1)
+    second, second_outcome = _acquire_in_thread(controller, "bob")
+    _wait_for_queue(controller, 2)
+
+    controller.release("alice")
+    first.join(1)
+    assert first_outcome == ["admitted"]
+    assert second_outcome == []
+    controller.release("alice")
+    second.join(1)
+    assert second_outcome == ["admitted"]
+
+def test_admit_releases_on_error():
+    controller = _controller()
+    with pytest.raises(RuntimeError):
+        with controller.admit("alice"):
+            raise RuntimeError("model unavailable")
+    assert controller.stats()["in_flight"] == 0
+
+def test_disabled_controller_admits_everything(monkeypatch):
+    monkeypatch.setenv('ADMISSION_ENABLED', 'False')
+    controller = _controller()
+    for _ in range(5):
+        with controller.admit("alice"):
+            pass
+    assert controller.stats()["admitted"] == 0
+
+def test_aadmit_waits_without_blocking_the_loop():
+    controller = _controller()
+
+    async def run():
+        order = []
+
+        async def worker(name, hold):
+            async with controller.aadmit("alice"):
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        await asyncio.gather(worker("first", 0.05), worker("second", 0))
+        return order
+
+    assert asyncio.run(run()) == ["first", "second"]
+    assert controller.stats()["in_flight"] == 0
+
+def test_cancelled_async_waiter_leaves_the_queue():
+    controller = _controller()
+    controller.acquire("alice")
+
+    async def run():
+        waiter = asyncio.ensure_future(controller.aacquire("alice"))
+        await asyncio.sleep(0.01)
+        assert controller.stats()["queue_depth"] == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(run())
+    assert controller.stats()["queue_depth"] == 0
+    controller.release("alice")
+    assert controller.stats()["in_flight"] == 0
+
+def test_rejected_request_answers_429_with_retry_after(monkeypatch):
+    flask = pytest.importorskip("flask")
+    from agents import admission
+    from routes.admission import admission_controlled
+
+    controller = _controller(queue_timeout=0.05)
+    monkeypatch.setattr(admission, "_controller", controller)
+    app = flask.Flask(__name__)
+
+    @app.route("/slow", methods=["POST"])
+    @admission_controlled()
+    def slow():
+        return {"ok": True}
+
+    client = app.test_client()
+    assert client.post("/slow", json={"user_id": 1}).status_code == 200
+    assert controller.stats()["in_flight"] == 0
+
+    controller.acquire("1")
+    response = client.post("/slow", json={"user_id": 1})
+    assert response.status_code == 429
+    assert response.get_json()["reason"] == "timeout"
+    assert int(response.headers["Retry-After"]) >= 1
+    # Other users are admitted meanwhile
+    assert client.post("/slow", json={"user_id": 2}).status_code == 200
@@ -0,0 +1,93 @@
+import pytest
+
+from agents.chat_history import ConversationHistory, count_tokens
+
+def _history(turns, **kwargs):
+    history = ConversationHistory(**kwargs)
+    for i in range(turns):
+        history.add_turn(f"question {i}", f"answer {i}", first_seq=2 * i + 1)
+    return history
+
+class Summarizer:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, summary, transcript):
+        self.calls.append((summary, transcript))
+        return f"{summary}+{transcript.count('Human:')} turns".lstrip("+")
+
+def test_count_tokens():
+    assert count_tokens("") == 0
+    assert count_tokens(None) == 0
+    assert count_tokens("hello world") > 0
+
+def test_render_includes_summary_and_messages():
+    history = _history(1, summary="earlier talk", summary_seq=0)
+    assert history.render() == "Summary of earlier conversation: earlier talk\nHuman: question 0\nAI: answer 0"
+
+def test_short_history_is_not_compacted():
+    history = _history(3, max_turns=6, token_budget=1000)
+    summarize = Summarizer()
+    assert not history.needs_compaction()
+    assert not history.compact(summarize)
+    assert summarize.calls == []
+
+def test_turns_beyond_max_turns_are_folded_into_the_summary():
+    history = _history(5, max_turns=2, token_budget=1000)
+    summarize = Summarizer()
+    assert history.needs_compaction()
+    assert history.compact(summarize)
+
+    assert summarize.calls[0][0] == ""
+    assert "question 2" in summarize.calls[0][1]
+    assert "question 3" not in summarize.calls[0][1]
+    assert history.summary == "3 turns"
+    assert history.summary_seq == 6
+    assert [seq for seq, _, _ in history.messages] == [7, 8, 9, 10]
+    assert history.last_seq == 10
+
+def test_token_budget_folds_whole_turns_but_keeps_the_latest():
+    history = ConversationHistory(max_turns=6, token_budget=30)
+    for i in range(3):
+        history.add_turn("long question " * 10, "long answer " * 10, first_seq=2 * i + 1)
+    assert history.compact(Summarizer())
+    # Each turn alone is over budget, so only the latest one stays verbatim
+    assert [seq for seq, _, _ in history.messages] == [5, 6]
+    assert history.summary_seq == 4
+
+def test_summary_builds_on_the_previous_one():
+    history = _history(4, max_turns=1, token_budget=1000, summary="earlier", summary_seq=0)
+    summarize = Summarizer()
+    history.compact(summarize)
+    assert summarize.calls[0][0] == "earlier"
+    assert history.summary == "earlier+3 turns"
+
+def test_turns_added_while_summarizing_stay_in_the_window():
+    history = _history(3, max_turns=1, token_budget=1000)
+
+    def summarize(summary, transcript):
+        history.add_turn("late question", "late answer", first_seq=7)
+        return "summary"
+
+    assert history.compact(summarize)
+    assert [seq for seq, _, _ in history.messages] == [5, 6, 7, 8]
+
+def test_failed_summary_leaves_the_history_unchanged():
+    history = _history(3, max_turns=1, token_budget=1000)
+
+    def summarize(summary, transcript):
+        raise RuntimeError("model unavailable")
+
+    with pytest.raises(RuntimeError):
+        history.compact(summarize)
+    assert history.summary == ""
+    assert len(history.messages) == 6
+    # Not stuck in the compacting state
+    assert history.compact(Summarizer())
+
+def test_out_of_order_turns_are_sorted():
+    history = ConversationHistory()
+    history.add_turn("second", "second answer", first_seq=3)
+    history.add_turn("first", "first answer", first_seq=1)
+    assert [seq for seq, _, _ in history.messages] == [1, 2, 3, 4]
+    assert history.last_seq == 4
@@ -0,0 +1,158 @@
+import threading
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+from models.database import ConnectionPool, PoolTimeout
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, vars=None):
+        self.conn.queries.append(query)
+        if self.conn.probing is not None:
+            self.conn.probing.set()
+            self.conn.proceed.wait(2)
+        if not self.conn.healthy:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.healthy = True
+        self.fail_rollback = False
+        self.queries = []
+        self.rollbacks = 0
+        self.probing = None
+        self.proceed = None
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        if self.fail_rollback:
+            raise psycopg2.InterfaceError("connection already closed")
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+@pytest.fixture
+def connections():
+    return []
+
+@pytest.fixture
+def connect(connections):
+    def connect():
+        conn = FakeConnection()
+        connections.append(conn)
+        return conn
+    return connect
+
+def test_min_size_cannot_exceed_max_size(connect):
+    with pytest.raises(ValueError):
+        ConnectionPool(min_size=3, max_size=2, connect=connect)
+
+def test_connections_are_created_lazily_and_reused(connect, connections):
+    pool = ConnectionPool(min_size=1, max_size=3, health_check_interval=60, connect=connect)
+    assert len(connections) == 1
+
+    first = pool.getconn()
+    second = pool.getconn()
+    assert first is connections[0]
+    assert second is connections[1]
+
+    pool.putconn(first)
+    assert pool.getconn() is first
+    stats = pool.stats()
+    assert stats["size"] == 2
+    assert stats["in_use"] == 2
+    assert stats["checkouts"] == 3
+    assert stats["connections_created"] == 2
+
+def test_returned_connections_are_rolled_back(connect):
+    pool = ConnectionPool(min_size=0, max_size=1, health_check_interval=60, connect=connect)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert conn.rollbacks == 1
+    assert pool.stats()["idle"] == 1
+
+def test_failed_rollback_discards_the_connection(connect):
+    pool = ConnectionPool(min_size=0, max_size=1, health_check_interval=60, connect=connect)
+    conn = pool.getconn()
+    conn.fail_rollback = True
+    pool.putconn(conn)
+    assert conn.closed
+    stats = pool.stats()
+    assert stats["size"] == 0
+    assert stats["connections_discarded"] == 1
+
+def test_checkout_times_out_when_exhausted(connect):
+    pool = ConnectionPool(min_size=0, max_size=1, timeout=0.05, health_check_interval=60, connect=connect)
+    pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert pool.stats()["timeouts"] == 1
+
+def test_waiting_checkout_gets_a_returned_connection(connect):
+    pool = ConnectionPool(min_size=0, max_size=1, timeout=2, health_check_interval=60, connect=connect)
+    conn = pool.getconn()
+    timer = threading.Timer(0.05, pool.putconn, (conn,))
+    timer.start()
+    assert pool.getconn() is conn
+    timer.join()
+    assert pool.stats()["wait_time_max"] > 0
+
+def test_idle_connections_are_health_checked(connect, connections):
+    pool = ConnectionPool(min_size=1, max_size=1, health_check_interval=0, connect=connect)
+    conn = connections[0]
+    assert pool.getconn() is conn
+    assert conn.queries == ["SELECT 1"]
+    assert pool.stats()["health_checks"] == 1
+
+def test_unhealthy_connection_is_replaced(connect, connections):
+    pool = ConnectionPool(min_size=1, max_size=1, health_check_interval=0, connect=connect)
+    dead = connections[0]
+    dead.healthy = False
+
+    conn = pool.getconn()
+    assert conn is not dead
+    assert dead.closed
+    stats = pool.stats()
+    assert stats["size"] == 1
+    assert stats["connections_discarded"] == 1
+
+def test_probe_does_not_hold_the_pool_lock(connect, connections):
+    pool = ConnectionPool(min_size=1, max_size=2, health_check_interval=0, connect=connect)
+    slow = connections[0]
+    slow.probing, slow.proceed = threading.Event(), threading.Event()
+
+    checkout = threading.Thread(target=pool.getconn)
+    checkout.start()
+    assert slow.probing.wait(2)
+    # The lock is free while the first checkout probes, so stats() and a
+    # second checkout go through
+    assert pool.stats()["size"] == 1
+    assert pool.getconn(timeout=1) is connections[1]
+    slow.proceed.set()
+    checkout.join(2)
+    assert pool.stats()["in_use"] == 2
+
+def test_connection_context_discards_on_operational_error(connect, connections):
+    pool = ConnectionPool(min_size=0, max_size=1, health_check_interval=60, connect=connect)
+    with pytest.raises(psycopg2.OperationalError):
+        with pool.connection():
+            raise psycopg2.OperationalError("terminating connection")
+    assert connections[0].closed
+    assert pool.stats()["size"] == 0
+
+def test_closed_pool_refuses_checkouts(connect, connections):
+    pool = ConnectionPool(min_size=2, max_size=2, connect=connect)
+    pool.close()
+    assert all(conn.closed for conn in connections)
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
@@ -0,0 +1,59 @@
+import pytest
+
+from agents.intent_router import IntentRouter, GENERATE, EDIT, BEST_PRACTICES, GENERAL
+
+@pytest.fixture
+def router():
+    return IntentRouter(threshold=0.75)
+
+def _tool(router, text):
+    route = router.route(text)
+    return route[0] if route else None
+
+@pytest.mark.parametrize("text", [
+    "Can you make the sequence more casual",
+    "Make the outreach more personal",
+    "Create a new version of the sequence that is more formal",
+    "Make it shorter",
+    "Edit sequence 12 to be more formal",
+    "Change step 2 of the sequence to mention remote work",
+])
+def test_edit_requests_are_routed_to_edit(router, text):
+    assert _tool(router, text) == EDIT
+
+@pytest.mark.parametrize("text", [
+    "Can you make the sequence more casual",
+    "Make the outreach more personal",
+    "Create a new version of the sequence that is more formal",
+    "Write a shorter sequence",
+    "Draft the follow-up emails again",
+])
+def test_edit_hints_never_take_the_generate_fast_path(router, text):
+    assert _tool(router, text) != GENERATE
+
+@pytest.mark.parametrize("text", [
+    "Generate an outreach sequence for senior backend engineers",
+    "Create a sequence for our data scientist hiring campaign",
+    "Draft an outreach cadence for product designers",
+])
+def test_generate_requests(router, text):
+    assert _tool(router, text) == GENERATE
+
+def test_best_practices_and_small_talk(router):
+    assert _tool(router, "What are the best practices for response rates?") == BEST_PRACTICES
+    assert _tool(router, "thanks!") == GENERAL
+
+def test_unclear_requests_fall_through(router):
+    assert router.route("Tell me about the campaign") is None
+    assert router.route("") is None
+    assert router.stats()["fallthrough"] == 2
+
+def test_vetoed_classifier_answer_falls_through():
+    router = IntentRouter(threshold=0.75, classifier=lambda text: (GENERATE, 0.99))
+    assert router.route("Make the outreach more personal") == (EDIT, 0.75)
+    assert router.route("Write a shorter one") is None
+    assert router.route("Write something") == (GENERATE, 0.99)
+
+def test_custom_vetoes():
+    router = IntentRouter(threshold=0.75, vetoes={})
+    assert _tool(router, "Generate a sequence with a warmer tone for engineers") == GENERATE
@@ -0,0 +1,157 @@
+"""
+Job queue tests against a real Postgres
+
+Set DATABASE_URL to a scratch database (migrations are applied to it);
+the tests are skipped when it is not set or not reachable.
+"""
+import os
+import uuid
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+from agents.job_queue import JobQueue, JobLimitReached
+from models.database import db_cursor, get_db_connection
+from models.migrations import ensure_schema
+
+pytestmark = pytest.mark.skipif(not os.getenv('DATABASE_URL'), reason="DATABASE_URL is not set")
+
+@pytest.fixture(scope="module")
+def schema():
+    try:
+        ensure_schema()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"Postgres is not reachable: {e}")
+
+@pytest.fixture
+def kind(schema):
+    """A job kind of this test only, so claims never pick up other jobs"""
+    kind = f"test-{uuid.uuid4().hex[:12]}"
+    yield kind
+    with db_cursor(commit=True) as cur:
+        cur.execute("DELETE FROM jobs WHERE kind = %s", (kind,))
+
+@pytest.fixture
+def queue():
+    return JobQueue(workers=0, max_attempts=2, stale_after=60, user_limit=2, retry_backoff=30, retry_backoff_max=60)
+
+def _row(job_id):
+    with db_cursor() as cur:
+        cur.execute(
+            "SELECT status, attempts, error, result, run_after > CURRENT_TIMESTAMP AS delayed FROM jobs WHERE id = %s",
+            (job_id,)
+        )
+        return cur.fetchone()
+
+def _make_due(job_id):
+    with db_cursor(commit=True) as cur:
+        cur.execute("UPDATE jobs SET run_after = CURRENT_TIMESTAMP - INTERVAL '1 second' WHERE id = %s", (job_id,))
+
+def _make_stale(job_id):
+    with db_cursor(commit=True) as cur:
+        cur.execute("UPDATE jobs SET started_at = CURRENT_TIMESTAMP - INTERVAL '120 seconds' WHERE id = %s", (job_id,))
+
+def test_enqueue_and_claim(queue, kind):
+    queue.register(kind, lambda payload: payload)
+    job_id = queue.enqueue(kind, {"campaign_id": 1})
+
+    job = queue._claim()
+    assert job["id"] == job_id
+    assert job["payload"] == {"campaign_id": 1}
+    assert job["attempts"] == 1
+    assert queue.get(job_id)["status"] == "running"
+    assert queue._claim() is None
+
+def test_enqueue_rejects_unknown_kind(queue, kind):
+    with pytest.raises(ValueError):
+        queue.enqueue(kind, {})
+
+def test_claim_skips_locked_jobs(queue, kind):
+    queue.register(kind, lambda payload: payload)
+    first = queue.enqueue(kind, {})
+    second = queue.enqueue(kind, {})
+
+    other = get_db_connection()
+    try:
+        cur = other.cursor()
+        cur.execute("SELECT id FROM jobs WHERE id = %s FOR UPDATE", (first,))
+        # Another worker holds the oldest job: claim the next one instead of waiting
+        assert queue._claim()["id"] == second
+        other.rollback()
+    finally:
+        other.close()
+    assert queue._claim()["id"] == first
+
+def test_successful_job(queue, kind):
+    queue.register(kind, lambda payload: {"sequence_id": 7})
+    job_id = queue.enqueue(kind, {})
+
+    assert queue.run_once()
+    row = _row(job_id)
+    assert row["status"] == "succeeded"
+    assert row["result"] == {"sequence_id": 7}
+
+def test_failed_job_is_retried_after_backoff(queue, kind):
+    def fail(payload):
+        raise RuntimeError("model unavailable")
+    queue.register(kind, fail)
+    job_id = queue.enqueue(kind, {})
+
+    assert queue.run_once()
+    row = _row(job_id)
+    assert row["status"] == "queued"
+    assert row["attempts"] == 1
+    assert row["error"] == "model unavailable"
+    assert row["delayed"]
+    # Not picked up again until the backoff has passed
+    assert not queue.run_once()
+
+    _make_due(job_id)
+    assert queue.run_once()
+    row = _row(job_id)
+    assert row["status"] == "failed"
+    assert row["attempts"] == 2
+
+def test_handled_error_fails_without_retry(queue, kind):
+    queue.register(kind, lambda payload: {"error": "Campaign not found"})
+    job_id = queue.enqueue(kind, {})
+
+    assert queue.run_once()
+    row = _row(job_id)
+    assert row["status"] == "failed"
+    assert row["attempts"] == 1
+    assert row["result"] == {"error": "Campaign not found"}
+
+def test_backoff_grows_and_is_capped(queue):
+    assert 24 <= queue.backoff(1) <= 36
+    assert 48 <= queue.backoff(2) <= 72
+    assert queue.backoff(10) <= 72
+
+def test_requeue_stale(queue, kind):
+    queue.register(kind, lambda payload: payload)
+    job_id = queue.enqueue(kind, {})
+
+    queue._claim()
+    _make_stale(job_id)
+    assert queue.requeue_stale() >= 1
+    row = _row(job_id)
+    assert row["status"] == "queued"
+    assert not row["delayed"]
+
+    # The second abandoned attempt uses up max_attempts
+    assert queue._claim()["attempts"] == 2
+    _make_stale(job_id)
+    queue.requeue_stale()
+    assert _row(job_id)["status"] == "failed"
+
+def test_enqueue_limit_per_owner(queue, kind):
+    queue.register(kind, lambda payload: payload)
+    owner = f"user-{uuid.uuid4().hex[:8]}"
+    queue.enqueue(kind, {}, owner=owner)
+    queue.enqueue(kind, {}, owner=owner)
+
+    with pytest.raises(JobLimitReached):
+        queue.enqueue(kind, {}, owner=owner)
+    # Other users and ownerless jobs are not affected
+    queue.enqueue(kind, {}, owner=f"{owner}-other")
+    queue.enqueue(kind, {})
@@ -0,0 +1,77 @@
+import json
+import pytest
+
+from models.knowledge_ingest import chunk_text, ingest, iter_chunks, iter_documents
+from models.vector_store import LocalVectorIndex
+
+class FakeEmbedder:
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[len(text), sum(map(ord, text)) % 97, 1.0] for text in texts]
+
+def test_short_text_is_one_chunk():
+    assert chunk_text("  Keep it short.  ", chunk_size=100, overlap=10) == ["Keep it short."]
+    assert chunk_text("   ", chunk_size=100, overlap=10) == []
+
+def test_paragraphs_are_packed_up_to_the_chunk_size():
+    paragraphs = [f"Paragraph {i} " + "x" * 30 for i in range(6)]
+    chunks = chunk_text("\n\n".join(paragraphs), chunk_size=100, overlap=0)
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert "\n\n".join(chunks) == "\n\n".join(paragraphs)
+
+def test_chunks_carry_the_overlap_when_it_fits():
+    paragraphs = [f"p{i} " + "y" * 40 for i in range(4)]
+    chunks = chunk_text("\n\n".join(paragraphs), chunk_size=100, overlap=10)
+    assert len(chunks) > 1
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.startswith(previous[-10:])
+        assert len(chunk) <= 100
+
+def test_long_paragraphs_are_cut_with_overlap():
+    text = "".join(chr(ord("a") + i % 26) for i in range(250))
+    chunks = chunk_text(text, chunk_size=100, overlap=20)
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert chunks[0] == text[:100]
+    assert chunks[1].startswith(text[80:100])
+
+@pytest.mark.parametrize("chunk_size, overlap", [(100, 100), (100, 150), (100, -1), (0, 0)])
+def test_overlap_must_be_smaller_than_the_chunk_size(chunk_size, overlap):
+    # overlap >= chunk_size used to loop forever on long paragraphs
+    with pytest.raises(ValueError):
+        chunk_text("z" * 500, chunk_size=chunk_size, overlap=overlap)
+
+def test_chunk_ids_are_content_hashes():
+    documents = [("same text", {"source": "a"}), ("same text", {"source": "b"})]
+    chunks = list(iter_chunks(documents, chunk_size=100, overlap=10))
+    assert chunks[0][0] == chunks[1][0]
+    assert chunks[1][2] == {"source": "b", "chunk": 0}
+
+def test_iter_documents_reads_text_and_jsonl(tmp_path):
+    (tmp_path / "guide.md").write_text("Be specific.", encoding="utf-8")
+    (tmp_path / "messages.jsonl").write_text(
+        json.dumps({"text": "Hi there", "type": "outreach_message"}) + "\n\n" + json.dumps({"text": "Hello"}) + "\n",
+        encoding="utf-8"
+    )
+    (tmp_path / "ignored.csv").write_text("a,b", encoding="utf-8")
+
+    documents = list(iter_documents([str(tmp_path)], {"type": "playbook"}))
+    assert [text for text, _ in documents] == ["Be specific.", "Hi there", "Hello"]
+    assert documents[0][1]["type"] == "playbook"
+    assert documents[1][1]["type"] == "outreach_message"
+    assert documents[2][1]["source"].endswith("messages.jsonl:3")
+
+def test_ingest_skips_chunks_already_indexed():
+    index = LocalVectorIndex()
+    embedder = FakeEmbedder()
+    documents = [("First tip", {}), ("Second tip", {}), ("First tip", {})]
+
+    stats = ingest(documents, index=index, embedder=embedder, batch_size=2, progress=False)
+    assert (stats["chunks"], stats["embedded"], stats["skipped"], stats["batches"]) == (3, 2, 1, 2)
+    assert embedder.embedded == ["First tip", "Second tip"]
+
+    stats = ingest(documents, index=index, embedder=embedder, progress=False)
+    assert stats["embedded"] == 0
+    assert len(index) == 2
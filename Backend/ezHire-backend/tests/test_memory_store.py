@@ -0,0 +1,130 @@
+import asyncio
+import pytest
+
+from agents import memory_store
+from agents.chat_history import ConversationHistory
+from agents.memory_store import ConversationMemoryStore
+
+class Loader:
+    """Builds histories from an in-memory message_count table"""
+    def __init__(self):
+        self.message_counts = {}
+        self.calls = []
+
+    def __call__(self, conversation_id):
+        self.calls.append(conversation_id)
+        if conversation_id not in self.message_counts:
+            return None
+        history = ConversationHistory(max_turns=6, token_budget=10000)
+        for seq in range(1, self.message_counts[conversation_id] + 1):
+            history.add_message(seq, "user" if seq % 2 else "assistant", f"message {seq}")
+        return history
+
+    def count(self, conversation_id):
+        return self.message_counts.get(conversation_id)
+
+@pytest.fixture
+def loader():
+    loader = Loader()
+    loader.message_counts.update({1: 2, 2: 4, 3: 0})
+    return loader
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(memory_store.time, "monotonic", lambda: now[0])
+    return now
+
+def test_miss_loads_then_hits(loader):
+    store = ConversationMemoryStore(loader, max_size=10, ttl=60)
+    memory = store.get(1)
+    assert memory.last_seq == 2
+    assert store.get(1) is memory
+    assert loader.calls == [1]
+    assert store.stats()["hits"] == 1
+    assert store.stats()["misses"] == 1
+
+def test_unknown_conversation_is_not_cached(loader):
+    store = ConversationMemoryStore(loader, max_size=10, ttl=60)
+    assert store.get(99) is None
+    assert store.stats()["size"] == 0
+
+def test_least_recently_used_entry_is_evicted(loader):
+    store = ConversationMemoryStore(loader, max_size=2, ttl=60)
+    store.get(1)
+    store.get(2)
+    store.get(1)  # 2 is now the least recently used
+    store.get(3)
+    assert store.stats()["size"] == 2
+    store.get(1)
+    store.get(2)
+    assert loader.calls == [1, 2, 3, 2]
+
+def test_entries_expire_after_ttl(loader, clock):
+    store = ConversationMemoryStore(loader, max_size=10, ttl=60)
+    store.get(1)
+    clock[0] += 30
+    store.get(1)  # a hit extends the TTL
+    clock[0] += 45
+    store.get(1)
+    assert loader.calls == [1]
+    clock[0] += 61
+    store.get(1)
+    assert loader.calls == [1, 1]
+
+def test_memory_behind_the_stored_count_is_reloaded(loader):
+    store = ConversationMemoryStore(loader, counter=loader.count, max_size=10, ttl=60)
+    memory = store.get(1)
+    # Another worker stored a turn of this conversation
+    loader.message_counts[1] = 4
+    reloaded = store.get(1)
+    assert reloaded is not memory
+    assert reloaded.last_seq == 4
+    assert store.stats()["stale"] == 1
+    assert store.get(1) is reloaded
+
+def test_append_turn_extends_cached_memory(loader):
+    store = ConversationMemoryStore(loader, counter=loader.count, max_size=10, ttl=60)
+    memory = store.get(1)
+    assert store.append_turn(1, "hello", "hi there", first_seq=3) is memory
+    assert memory.last_seq == 4
+    assert memory.messages[-1] == (4, "assistant", "hi there")
+
+def test_append_turn_after_missed_turns_drops_the_entry(loader):
+    store = ConversationMemoryStore(loader, max_size=10, ttl=60)
+    store.get(1)
+    assert store.append_turn(1, "hello", "hi there", first_seq=5) is None
+    assert store.stats()["size"] == 0
+    assert store.stats()["stale"] == 1
+
+def test_append_turn_leaves_uncached_conversations_alone(loader):
+    store = ConversationMemoryStore(loader, max_size=10, ttl=60)
+    assert store.append_turn(1, "hello", "hi there", first_seq=3) is None
+    assert loader.calls == []
+
+def test_invalidate(loader):
+    store = ConversationMemoryStore(loader, max_size=10, ttl=60)
+    store.get(1)
+    store.invalidate(1)
+    store.get(1)
+    assert loader.calls == [1, 1]
+
+def test_aget_uses_the_async_loader_and_counter(loader):
+    store = ConversationMemoryStore(loader, max_size=10, ttl=60)
+
+    async def aload(conversation_id):
+        return loader(conversation_id)
+
+    async def acount(conversation_id):
+        return loader.count(conversation_id)
+
+    async def run():
+        first = await store.aget(2, aload, acount)
+        assert await store.aget(2, aload, acount) is first
+        loader.message_counts[2] = 6
+        return first, await store.aget(2, aload, acount)
+
+    first, reloaded = asyncio.run(run())
+    assert reloaded is not first
+    assert reloaded.last_seq == 6
+    assert loader.calls == [2, 2]
@@ -0,0 +1,122 @@
+import json
+import pytest
+
+from agents.output_parsing import (
+    OutputParseError, checked_sequence, extract_json, final_answer, json_objects, parse_final_answer,
+    parse_sequence, validate_sequence,
+)
+
+STEP = {"channel": "Email", "subject_line": "Hello", "timing": "Day 1", "message_content": "Hi {name}"}
+SEQUENCE = {"step1": STEP, "step2": dict(STEP, channel="LinkedIn")}
+
+@pytest.mark.parametrize("text", [
+    json.dumps(SEQUENCE),
+    f"```json\n{json.dumps(SEQUENCE, indent=2)}\n```",
+    f"Sure! Here is the sequence:\n{json.dumps(SEQUENCE)}\nLet me know if you want changes.",
+    json.dumps(SEQUENCE, indent=2).replace('"\n  }', '",\n  }'),
+    repr(SEQUENCE),
+])
+def test_extract_json_tolerates_common_model_output(text):
+    assert extract_json(text) == SEQUENCE
+
+def test_extract_json_accepts_trailing_commas():
+    assert extract_json('{"a": [1, 2,], "b": {"c": 3,},}') == {"a": [1, 2], "b": {"c": 3}}
+
+def test_braces_inside_strings_are_ignored():
+    text = 'Note {draft}: {"message": "Use {candidate_name} and a } brace", "ok": true} trailing'
+    assert extract_json(text) == {"message": "Use {candidate_name} and a } brace", "ok": True}
+
+def test_json_objects_yields_each_top_level_object():
+    assert list(json_objects('{"a": 1} and {"b": {"c": 2}}')) == ['{"a": 1}', '{"b": {"c": 2}}']
+
+@pytest.mark.parametrize("text", ["no json here", "{not: valid", None, 42])
+def test_extract_json_raises_when_nothing_is_found(text):
+    with pytest.raises(OutputParseError):
+        extract_json(text)
+
+def test_final_answer_markers():
+    text = "Thought: done\nFinal Answer: first\nFinal Answer: second"
+    assert final_answer(text) == "second"
+    assert final_answer(text, last=False) == "first\nFinal Answer: second"
+    assert final_answer("no marker") is None
+
+def test_parse_final_answer():
+    assert parse_final_answer('Final Answer: {"sequence_id": 3}') == {"sequence_id": 3}
+    assert parse_final_answer("Final Answer: All done {soon") == "All done {soon"
+    assert parse_final_answer("Final Answer: plain text") == "plain text"
+
+def test_validate_sequence_problems():
+    assert validate_sequence(SEQUENCE) == []
+    assert validate_sequence(["step1"]) == ["The sequence must be a JSON object"]
+    assert validate_sequence({"intro": "hi"}) == ["The sequence has no step1..stepN keys"]
+    assert validate_sequence({"step1": STEP, "step3": STEP}) == ["Steps must be numbered step1, step2"]
+    assert validate_sequence({"step1": "text"}) == ["step1 must be an object"]
+    assert validate_sequence({"step1": {"channel": "Email"}}) == ["step1 is missing message_content"]
+    assert validate_sequence({"step1": {"channel": "Email"}}, fields=False) == []
+    assert validate_sequence({"step2": STEP}, steps=["step2"]) == []
+
+def test_checked_sequence_reports_gaps_before_canonicalizing():
+    # Canonicalizing alone would renumber step3 to step2 and hide the gap
+    _, problems = checked_sequence({"step1": STEP, "step3": STEP})
+    assert problems == ["Steps must be numbered step1, step2"]
+
+def test_parse_sequence_normalizes_variants():
+    variants = [
+        {"steps": [STEP, dict(STEP, channel="LinkedIn")]},
+        {"sequence": SEQUENCE},
+        {"Step 1": STEP, "Step 2": dict(STEP, channel="LinkedIn")},
+    ]
+    for variant in variants:
+        sequence, problems = parse_sequence(json.dumps(variant))
+        assert problems == []
+        assert sequence == SEQUENCE
+
+def test_parse_sequence_accepts_drifted_field_names():
+    drifted = {"step1": {"medium": "Email", "subject": "Hello", "delay": "Day 1", "body": "Hi {name}"}}
+    sequence, problems = parse_sequence(json.dumps(drifted))
+    assert problems == []
+    assert sequence == {"step1": STEP}
+
+def test_parse_sequence_without_json():
+    assert parse_sequence("I could not do that") == (None, ["No JSON object found in model output"])
+
+def test_parse_sequence_with_steps_keeps_only_those():
+    sequence, problems = parse_sequence(json.dumps({"step2": STEP}), steps=["step2"])
+    assert problems == []
+    assert list(sequence) == ["step2"]
+
+class RepairLLM:
+    def __init__(self, answer):
+        self.answer = answer
+        self.prompts = []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        if isinstance(self.answer, Exception):
+            raise self.answer
+        return self.answer
+
+@pytest.fixture
+def generator(monkeypatch):
+    monkeypatch.setenv('LLM_BACKEND', 'fake')
+    from agents.outreach_agent import OutreachSequenceGenerator
+    return OutreachSequenceGenerator()
+
+def test_invalid_output_is_repaired_with_one_call(generator):
+    generator.repair_llm = RepairLLM(json.dumps(SEQUENCE))
+    assert generator._parse_sequence('{"step1": "Hi there"}') == SEQUENCE
+    assert len(generator.repair_llm.prompts) == 1
+    assert "step1 must be an object" in generator.repair_llm.prompts[0]
+
+def test_valid_output_needs_no_repair(generator):
+    generator.repair_llm = RepairLLM(AssertionError("not called"))
+    assert generator._parse_sequence(f"```json\n{json.dumps(SEQUENCE)}\n```") == SEQUENCE
+    assert generator.repair_llm.prompts == []
+
+@pytest.mark.parametrize("answer", ["still not json", RuntimeError("model unavailable")])
+def test_failed_repair_returns_an_error(generator, answer):
+    generator.repair_llm = RepairLLM(answer)
+    result = generator._parse_sequence("no json at all")
+    assert result["error"] == "Could not generate valid sequence"
+    assert result["raw_response"] == "no json at all"
+    assert result["problems"]
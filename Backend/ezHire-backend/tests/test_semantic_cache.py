@@ -0,0 +1,57 @@
+import pytest
+
+from agents import semantic_cache
+from agents.semantic_cache import SemanticCache, BEST_PRACTICES, GENERAL
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(semantic_cache.time, "time", lambda: now[0])
+    monkeypatch.setattr(semantic_cache.time, "monotonic", lambda: now[0])
+    return now
+
+@pytest.fixture
+def cache(monkeypatch, clock):
+    monkeypatch.setenv('SEMANTIC_CACHE_ENABLED', 'True')
+    return SemanticCache(embedder=object(), threshold=0.9, max_entries=3,
+                         ttls={BEST_PRACTICES: 100, GENERAL: 10}, purge_interval=30)
+
+def test_similar_query_hits(cache):
+    cache.store(BEST_PRACTICES, "How do I improve response rates?", [1, 0, 0], "Personalize the first line")
+    assert cache.lookup(BEST_PRACTICES, "How can I raise response rates?", [0.98, 0.05, 0]) == "Personalize the first line"
+    assert cache.lookup(BEST_PRACTICES, "Something else", [0, 1, 0]) is None
+    assert cache.lookup(GENERAL, "How do I improve response rates?", [1, 0, 0]) is None
+    assert cache.stats()["tools"][BEST_PRACTICES]["hits"] == 1
+
+def test_expired_entries_are_not_returned(cache, clock):
+    cache.store(GENERAL, "hello", [1, 0, 0], "Hi!")
+    clock[0] += 11
+    assert cache.lookup(GENERAL, "hello", [1, 0, 0]) is None
+
+def test_store_purges_expired_entries(cache, clock):
+    cache.store(GENERAL, "hello", [1, 0, 0], "Hi!")
+    cache.store(BEST_PRACTICES, "tips", [0, 1, 0], "Be brief")
+    clock[0] += 11
+    cache.store(BEST_PRACTICES, "more tips", [0, 0, 1], "Follow up")
+    assert len(cache.index) == 2
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["tools"][GENERAL]["expirations"] == 1
+
+def test_lookup_purges_at_most_every_purge_interval(cache, clock):
+    cache.store(GENERAL, "hello", [1, 0, 0], "Hi!")
+    clock[0] += 11
+    cache.lookup(BEST_PRACTICES, "tips", [0, 1, 0])
+    assert len(cache.index) == 1
+    clock[0] += 20
+    cache.lookup(BEST_PRACTICES, "tips", [0, 1, 0])
+    assert len(cache.index) == 0
+
+def test_least_recently_used_entries_are_evicted(cache):
+    for i, vector in enumerate(([1, 0, 0], [0, 1, 0], [0, 0, 1])):
+        cache.store(BEST_PRACTICES, f"query {i}", vector, f"answer {i}")
+    cache.lookup(BEST_PRACTICES, "query 0", [1, 0, 0])
+    cache.store(BEST_PRACTICES, "query 3", [1, 1, 0], "answer 3")
+    assert len(cache.index) == 3
+    assert cache.lookup(BEST_PRACTICES, "query 1", [0, 1, 0]) is None
+    assert cache.lookup(BEST_PRACTICES, "query 0", [1, 0, 0]) == "answer 0"
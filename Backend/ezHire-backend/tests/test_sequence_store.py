@@ -0,0 +1,118 @@
+import json
+import pytest
+
+from models import sequence_store
+from models.sequence_store import apply_patch, diff, materialize, store_version, version_values
+
+def _step(n, **overrides):
+    step = {
+        "channel": "email",
+        "subject_line": f"Subject {n}",
+        "timing": f"Day {n * 3}",
+        "message_content": f"Hi {{name}}, this is message {n} about the role. " * 4,
+    }
+    step.update(overrides)
+    return step
+
+def _sequence(steps=3, **overrides):
+    return {f"step{n}": _step(n, **overrides) for n in range(1, steps + 1)}
+
+def _row(id, version, snapshot, base_id=None, patch=None, snapshot_version=None, campaign_id=7):
+    """A row as selected with SEQUENCE_COLUMNS"""
+    return {
+        "id": id, "campaign_id": campaign_id, "version": version, "created_at": None,
+        "base_id": base_id, "patch": patch, "snapshot_data": snapshot,
+        "snapshot_version": snapshot_version if snapshot_version is not None else version,
+    }
+
+@pytest.mark.parametrize("old, new", [
+    (_sequence(), _sequence()),
+    (_sequence(), _sequence(timing="Day 1")),
+    (_sequence(3), _sequence(4)),
+    (_sequence(4), _sequence(2)),
+    ({"a/b": 1, "c~d": {"e": 2}}, {"a/b": 3, "c~d": {"f": 4}}),
+    ({"steps": [1, 2, 3]}, {"steps": [1, 3]}),
+    ({"step1": {"channel": "email"}}, ["not", "a", "dict"]),
+])
+def test_diff_and_apply_patch_round_trip(old, new):
+    patch = diff(old, new)
+    assert apply_patch(old, patch) == new
+
+def test_diff_of_equal_documents_is_empty():
+    assert diff(_sequence(), _sequence()) == []
+
+def test_diff_touches_only_changed_fields():
+    new = _sequence()
+    new["step2"]["subject_line"] = "Quick question"
+    assert diff(_sequence(), new) == [{"op": "replace", "path": "/step2/subject_line", "value": "Quick question"}]
+
+def test_apply_patch_does_not_modify_its_input():
+    old = _sequence()
+    apply_patch(old, diff(old, _sequence(1)))
+    assert old == _sequence()
+
+def test_materialize_snapshot_and_delta_rows():
+    snapshot = _sequence()
+    edited = _sequence(channel="linkedin")
+    patch = diff(snapshot, edited)
+
+    assert materialize(_row(1, 1, json.dumps(snapshot)))["sequence_data"] == snapshot
+    row = materialize(_row(2, 2, snapshot, base_id=1, patch=json.dumps(patch), snapshot_version=1))
+    assert row["sequence_data"] == edited
+    assert "patch" not in row and "snapshot_data" not in row
+    assert materialize(None) is None
+
+def test_small_edit_is_stored_as_a_delta_against_the_snapshot():
+    parent = _row(5, 3, _sequence(), base_id=1, patch=[], snapshot_version=1)
+    edited = _sequence()
+    edited["step1"]["timing"] = "Day 0"
+
+    sequence_data, base_id, patch = version_values(parent, edited, 4)
+    assert sequence_data is None
+    assert base_id == 1
+    assert apply_patch(_sequence(), patch) == edited
+
+def test_large_edit_is_stored_as_a_snapshot():
+    parent = _row(1, 1, _sequence())
+    rewritten = _sequence(message_content="Completely different text. " * 10)
+    assert version_values(parent, rewritten, 2) == (rewritten, None, None)
+
+def test_snapshot_is_taken_every_snapshot_every_versions(monkeypatch):
+    monkeypatch.setattr(sequence_store, "SNAPSHOT_EVERY", 3)
+    parent = _row(4, 3, _sequence(), base_id=1, snapshot_version=1)
+    edited = _sequence()
+    edited["step1"]["timing"] = "Day 0"
+
+    assert version_values(parent, edited, 3)[0] is None
+    assert version_values(parent, edited, 4) == (edited, None, None)
+
+class FakeCursor:
+    def __init__(self, latest_version):
+        self.latest_version = latest_version
+        self.executed = []
+        self._result = None
+
+    def execute(self, query, vars=None):
+        self.executed.append((query, vars))
+        if query.startswith("SELECT latest_version"):
+            self._result = {"latest_version": self.latest_version}
+        else:
+            self._result = {"id": 42}
+
+    def fetchone(self):
+        return self._result
+
+def test_store_version_numbers_after_the_latest_version():
+    cur = FakeCursor(latest_version=5)
+    parent = _row(1, 2, _sequence())
+    edited = _sequence()
+    edited["step3"]["channel"] = "linkedin"
+
+    assert store_version(cur, parent, edited) == (42, 6)
+    lock, insert = cur.executed
+    assert "FOR UPDATE" in lock[0]
+    campaign_id, sequence_data, version, base_id, patch = insert[1]
+    assert (campaign_id, sequence_data, version, base_id) == (7, None, 6, 1)
+    # Stored minified
+    assert patch == json.dumps(json.loads(patch), separators=(",", ":"))
+    assert apply_patch(_sequence(), json.loads(patch)) == edited
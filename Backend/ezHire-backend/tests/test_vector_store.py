@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from models.vector_store import LocalVectorIndex, content_id, query_hr_knowledge, store_hr_knowledge
+
+class FakeEmbedder:
+    """Bag-of-letters embeddings, enough to rank related texts together"""
+    def __init__(self):
+        self.calls = 0
+
+    def _embed(self, text):
+        vector = np.zeros(26, dtype=np.float32)
+        for char in text.lower():
+            if "a" <= char <= "z":
+                vector[ord(char) - ord("a")] += 1
+        return vector
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self._embed(text)
+
+@pytest.fixture
+def index():
+    index = LocalVectorIndex()
+    index.upsert(
+        ["x", "y", "xy"],
+        [[1, 0, 0], [0, 1, 0], [1, 1, 0]],
+        [{"type": "tip", "year": 2022}, {"type": "playbook", "year": 2023}, {"type": "tip", "year": 2024}],
+    )
+    return index
+
+def test_query_ranks_by_cosine_similarity(index):
+    matches = index.query([1, 0.1, 0], top_k=3)
+    assert [m["id"] for m in matches] == ["x", "xy", "y"]
+    assert matches[0]["score"] == pytest.approx(0.995, abs=1e-3)
+    assert matches[0]["metadata"] == {"type": "tip", "year": 2022}
+
+def test_query_top_k_and_empty_index(index):
+    assert len(index.query([1, 0, 0], top_k=1)) == 1
+    assert index.query([1, 0, 0], top_k=0) == []
+    assert LocalVectorIndex().query([1, 0, 0]) == []
+
+def test_metadata_filters(index):
+    assert [m["id"] for m in index.query([0, 1, 0], filter={"type": "tip"})] == ["xy", "x"]
+    assert [m["id"] for m in index.query([0, 1, 0], filter={"year": {"$gte": 2023}})] == ["y", "xy"]
+    assert [m["id"] for m in index.query([0, 1, 0], filter={"type": {"$in": ["playbook"]}})] == ["y"]
+    assert index.query([0, 1, 0], filter={"type": "missing"}) == []
+
+def test_upsert_replaces_existing_ids(index):
+    index.upsert(["x"], [[0, 0, 1]], [{"type": "replaced"}])
+    assert len(index) == 3
+    best = index.query([0, 0, 1], top_k=1)[0]
+    assert best["id"] == "x"
+    assert best["metadata"] == {"type": "replaced"}
+
+def test_upsert_rejects_other_dimensions(index):
+    with pytest.raises(ValueError):
+        index.upsert(["z"], [[1, 0]])
+
+def test_delete_moves_the_last_row_into_the_gap(index):
+    index.delete(["x", "missing"])
+    assert len(index) == 2
+    assert index.existing(["x", "y", "xy"]) == {"y", "xy"}
+    assert index.query([1, 0, 0], top_k=1)[0]["id"] == "xy"
+
+def test_index_grows_past_its_initial_capacity():
+    index = LocalVectorIndex(dimension=200)
+    vectors = np.eye(200)
+    for start in range(0, 200, 50):
+        index.upsert([str(i) for i in range(start, start + 50)], vectors[start:start + 50])
+    assert len(index) == 200
+    assert index.query(vectors[199], top_k=1)[0]["id"] == "199"
+    assert index.query(vectors[0], top_k=1)[0]["id"] == "0"
+
+def test_save_and_load_memory_mapped(index, tmp_path):
+    path = str(tmp_path / "knowledge")
+    index.save(path)
+
+    loaded = LocalVectorIndex(path=path)
+    assert loaded.stats() == {"vectors": 3, "dimension": 3, "memory_mapped": True}
+    assert [m["id"] for m in loaded.query([1, 0.1, 0], top_k=3)] == ["x", "xy", "y"]
+
+    # The first write copies the memory-mapped vectors
+    loaded.upsert(["z"], [[0, 0, 1]])
+    assert not loaded.stats()["memory_mapped"]
+    assert loaded.query([0, 0, 1], top_k=1)[0]["id"] == "z"
+    assert len(LocalVectorIndex(path=path)) == 3
+
+def test_save_needs_a_path(index):
+    with pytest.raises(ValueError):
+        index.save()
+
+def test_store_and_query_hr_knowledge(tmp_path):
+    embedder = FakeEmbedder()
+    index = LocalVectorIndex(path=str(tmp_path / "knowledge"))
+    texts = ["Keep subject lines short", "Follow up after three days"]
+
+    ids = store_hr_knowledge(index, texts, metadatas=[{"type": "tip"}, None], embedder=embedder)
+    assert ids == [content_id(text) for text in texts]
+    # Storing the same text again is idempotent
+    store_hr_knowledge(index, texts[:1], metadatas=[{"type": "tip"}], embedder=embedder)
+    assert len(index) == 2
+    assert (tmp_path / "knowledge.npy").exists()
+
+    matches = query_hr_knowledge(index, "short subject lines", top_k=1, embedder=embedder)
+    assert matches[0]["text"] == "Keep subject lines short"
+    assert matches[0]["metadata"]["type"] == "tip"
+
+def test_query_hr_knowledge_skips_embedding_for_an_empty_index():
+    embedder = FakeEmbedder()
+    assert query_hr_knowledge(LocalVectorIndex(), "anything", embedder=embedder) == []
+    assert embedder.calls == 0